@@ -0,0 +1,162 @@
+"""
+Бенчмарк загрузки ленты твитов.
+
+Сравнивает прежнюю загрузку ленты (JOIN коллекций лайков и изображений
+с дедупликацией в Python) и текущую (страница твитов + пакетная догрузка
+связанных данных по набору id) при росте кол-ва лайков у твитов.
+Для каждого запуска выводится кол-во запросов, кол-во строк, полученных
+из БД, и время ответа.
+
+ВНИМАНИЕ: база данных из .env будет пересоздана.
+
+Запуск:
+    python -m benchmarks.feed_loading
+"""
+import asyncio
+import time
+from typing import List, Tuple
+
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm import joinedload
+
+from main.config import FEED_PAGE_SIZE
+from main.database import Base, async_session_maker, engine
+from main.models.images import Image
+from main.models.likes import Like
+from main.models.tweets import Tweet
+from main.models.users import User, user_to_user
+from main.services.tweet import TweetsService
+from main.services.user import UserService
+
+TWEETS = 20
+IMAGES_PER_TWEET = 4
+LIKES_PER_TWEET = (10, 100, 1000)
+
+
+async def seed(likes_per_tweet: int) -> None:
+    """
+    Читатель, автор с твитами, у каждого твита likes_per_tweet лайков
+    и IMAGES_PER_TWEET изображений
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    users = [
+        {"username": f"user-{i}", "api_key": f"user-{i}"}
+        for i in range(likes_per_tweet + 2)
+    ]
+
+    async with async_session_maker() as session:
+        await session.execute(insert(User), users)
+        await session.execute(
+            insert(user_to_user), [{"followers_id": 1, "following_id": 2}]
+        )
+        await session.execute(
+            insert(Tweet),
+            [{"tweet_data": f"Tweet {i}", "user_id": 2} for i in range(TWEETS)],
+        )
+        await session.execute(
+            insert(Like),
+            [
+                {"user_id": user_id, "tweets_id": tweet_id}
+                for tweet_id in range(1, TWEETS + 1)
+                for user_id in range(3, likes_per_tweet + 3)
+            ],
+        )
+        await session.execute(
+            insert(Image),
+            [
+                {"tweet_id": tweet_id, "path_media": f"{tweet_id}-{i}.jpg"}
+                for tweet_id in range(1, TWEETS + 1)
+                for i in range(IMAGES_PER_TWEET)
+            ],
+        )
+        await session.commit()
+
+
+async def legacy_feed(user: User, session) -> list:
+    """
+    Прежний вариант запроса ленты: JOIN коллекций на одном запросе
+    """
+    query = (
+        select(Tweet)
+        .filter(Tweet.user_id.in_(user.id for user in user.following))
+        .options(
+            joinedload(Tweet.user),
+            joinedload(Tweet.likes).subqueryload(Like.user),
+            joinedload(Tweet.images),
+        )
+        .order_by(Tweet.likes_count.asc())
+    )
+    result = await session.execute(query)
+
+    return result.unique().scalars().all()
+
+
+async def current_feed(user: User, session) -> list:
+    """
+    Текущий вариант запроса ленты
+    """
+    tweets, *_ = await TweetsService.get_tweets(user=user,
+                                                session=session,
+                                                limit=FEED_PAGE_SIZE,
+                                                )
+    return tweets
+
+
+async def measure(loader) -> Tuple[int, int, float]:
+    """
+    Кол-во запросов, кол-во полученных строк и время загрузки ленты
+    """
+    statements: List[Tuple[str, tuple]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    async with async_session_maker() as session:
+        user = await UserService.get_user_by_key(token="user-0",
+                                                 session=session,
+                                                 )
+
+    async with async_session_maker() as session:
+        event.listen(engine.sync_engine, "before_cursor_execute", capture)
+        started = time.perf_counter()
+        try:
+            await loader(user, session)
+        finally:
+            elapsed = time.perf_counter() - started
+            event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+    # Повторяем захваченные запросы, чтобы посчитать переданные строки
+    rows = 0
+
+    async with engine.connect() as conn:
+        for statement, parameters in statements:
+            result = await conn.exec_driver_sql(statement, parameters)
+            rows += len(result.fetchall())
+
+    return len(statements), rows, elapsed
+
+
+async def main() -> None:
+    print(f"{'likes/tweet':>12} {'loader':>8} {'queries':>8} "
+          f"{'rows':>10} {'ms':>9}")
+
+    for likes_per_tweet in LIKES_PER_TWEET:
+        await seed(likes_per_tweet=likes_per_tweet)
+
+        for name, loader in (("legacy", legacy_feed),
+                             ("batched", current_feed),
+                             ):
+            # Прогрев пула соединений и кэша подготовленных выражений
+            await measure(loader)
+            queries, rows, elapsed = await measure(loader)
+            print(f"{likes_per_tweet:>12} {name:>8} {queries:>8} "
+                  f"{rows:>10} {elapsed * 1000:>9.1f}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,189 @@
+"""
+Бенчмарк сериализации ленты твитов.
+
+Сравнивает вывод страницы из TWEETS твитов (у каждого LIKES_PER_TWEET
+лайков и IMAGES_PER_TWEET изображений) двумя способами:
+    schema - ORM-объекты твитов со связанными лайками и изображениями,
+             валидация схемой TweetListSchema (from_attributes) и JSON,
+             как при возврате объектов из маршрута с response_model;
+    rows   - текущий вариант: строки без ORM-объектов, собранные в формат
+             ответа, и orjson (ORJSONResponse).
+Для каждого способа выводится медиана времени загрузки из БД,
+сериализации и размер ответа.
+
+ВНИМАНИЕ: база данных из .env будет пересоздана.
+
+Запуск:
+    python -m benchmarks.feed_serialization
+"""
+import asyncio
+import statistics
+import time
+from typing import Any, Callable, Tuple
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from sqlalchemy import insert, select
+from sqlalchemy.orm import joinedload, selectinload
+
+from main.database import Base, async_session_maker, engine
+from main.models.images import Image
+from main.models.likes import Like
+from main.models.tweets import Tweet
+from main.models.users import User, user_to_user
+from main.schemas import Principal, TweetListSchema
+from main.services.tweet import TweetsService
+
+TWEETS = 1000
+LIKES_PER_TWEET = 5
+IMAGES_PER_TWEET = 2
+RUNS = 5
+
+
+async def seed() -> None:
+    """
+    Читатель, автор с TWEETS твитами, лайки и изображения твитов
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with async_session_maker() as session:
+        await session.execute(
+            insert(User),
+            [
+                {"username": f"user-{i}", "api_key": f"user-{i}"}
+                for i in range(LIKES_PER_TWEET + 2)
+            ],
+        )
+        await session.execute(
+            insert(user_to_user), [{"followers_id": 1, "following_id": 2}]
+        )
+        await session.execute(
+            insert(Tweet),
+            [
+                {"tweet_data": f"Tweet {i}", "user_id": 2,
+                 "likes_count": LIKES_PER_TWEET}
+                for i in range(TWEETS)
+            ],
+        )
+        await session.execute(
+            insert(Like),
+            [
+                {"user_id": user_id, "tweets_id": tweet_id}
+                for tweet_id in range(1, TWEETS + 1)
+                for user_id in range(3, LIKES_PER_TWEET + 3)
+            ],
+        )
+        await session.execute(
+            insert(Image),
+            [
+                {"tweet_id": tweet_id, "path_media": f"{tweet_id}-{i}.jpg"}
+                for tweet_id in range(1, TWEETS + 1)
+                for i in range(IMAGES_PER_TWEET)
+            ],
+        )
+        await session.commit()
+
+
+async def schema_feed(user: Principal, session) -> Any:
+    """
+    ORM-объекты ленты со связанными данными
+    """
+    following_ids = select(user_to_user.c.following_id).where(
+        user_to_user.c.followers_id == user.id
+    )
+    query = (
+        select(Tweet)
+        .where(Tweet.user_id.in_(following_ids))
+        .options(
+            joinedload(Tweet.user),
+            selectinload(Tweet.likes).joinedload(Like.user),
+            selectinload(Tweet.images),
+        )
+        .order_by(Tweet.created_at.desc(), Tweet.id.desc())
+        .limit(TWEETS)
+    )
+    tweets = list((await session.scalars(query)).all())
+
+    for tweet in tweets:
+        tweet.is_liked = any(like.user_id == user.id for like in tweet.likes)
+
+    return {"tweets": tweets, "next_cursor": None}
+
+
+def schema_render(content: Any) -> bytes:
+    """
+    Валидация схемой и JSON (как для маршрута с response_model)
+    """
+    data = TweetListSchema.model_validate(content).model_dump(mode="json",
+                                                              by_alias=True,
+                                                              )
+
+    return JSONResponse(data).body
+
+
+async def rows_feed(user: Principal, session) -> Any:
+    """
+    Текущий вариант загрузки ленты
+    """
+    tweets, next_cursor, _ = await TweetsService.get_tweets(user=user,
+                                                            session=session,
+                                                            limit=TWEETS,
+                                                            )
+
+    return {"result": True, "tweets": tweets, "next_cursor": next_cursor}
+
+
+def rows_render(content: Any) -> bytes:
+    """
+    Сериализация готовых данных orjson
+    """
+    return ORJSONResponse(content).body
+
+
+async def measure(loader: Callable,
+                  render: Callable,
+                  ) -> Tuple[float, float, int]:
+    """
+    Медианы времени загрузки и сериализации (мс) и размер ответа
+    """
+    user = Principal(id=1, username="user-0")
+    load_times, render_times = [], []
+    size = 0
+
+    for _ in range(RUNS + 1):
+        async with async_session_maker() as session:
+            started = time.perf_counter()
+            content = await loader(user, session)
+            loaded = time.perf_counter()
+            size = len(render(content))
+            rendered = time.perf_counter()
+
+        load_times.append((loaded - started) * 1000)
+        render_times.append((rendered - loaded) * 1000)
+
+    # Первый запуск - прогрев пула соединений и кэшей
+    return (statistics.median(load_times[1:]),
+            statistics.median(render_times[1:]),
+            size,
+            )
+
+
+async def main() -> None:
+    await seed()
+
+    print(f"{'path':>8} {'load ms':>9} {'render ms':>10} "
+          f"{'total ms':>9} {'bytes':>9}")
+
+    for name, loader, render in (("schema", schema_feed, schema_render),
+                                 ("rows", rows_feed, rows_render),
+                                 ):
+        load, render_time, size = await measure(loader, render)
+        print(f"{name:>8} {load:>9.1f} {render_time:>10.1f} "
+              f"{load + render_time:>9.1f} {size:>9}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
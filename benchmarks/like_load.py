@@ -0,0 +1,95 @@
+"""
+Нагрузочный тест лайков одного твита.
+
+Множество клиентов одновременно ставят лайк одному твиту. Сравниваются
+обновление счетчика в каждом запросе (блокировка строки твита)
+и отложенная запись счетчика пачками (LIKES_WRITE_BEHIND).
+Для каждого режима выводится время, пропускная способность и итоговое
+значение счетчика.
+
+ВНИМАНИЕ: база данных из .env будет пересоздана.
+
+Запуск:
+    python -m benchmarks.like_load
+"""
+import asyncio
+import time
+
+from httpx import AsyncClient
+from sqlalchemy import insert
+
+import main.services.like as like_module
+from main.app import app
+from main.database import Base, async_session_maker, engine
+from main.models.tweets import Tweet
+from main.models.users import User
+from main.services.like_counter import like_counter
+
+CLIENTS = 1000
+CONCURRENCY = 100
+
+
+async def seed() -> None:
+    """
+    Автор с одним твитом и CLIENTS пользователей
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with async_session_maker() as session:
+        await session.execute(
+            insert(User),
+            [
+                {"username": f"user-{i}", "api_key": f"user-{i}"}
+                for i in range(CLIENTS + 1)
+            ],
+        )
+        await session.execute(insert(Tweet), [{"tweet_data": "Hot", "user_id": 1}])
+        await session.commit()
+
+
+async def hammer(client: AsyncClient) -> float:
+    """
+    Лайки твита от всех пользователей не более CONCURRENCY одновременно
+    """
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def like(i: int) -> None:
+        async with semaphore:
+            resp = await client.post("/api/tweets/1/likes",
+                                     headers={"api-key": f"user-{i}"},
+                                     )
+            resp.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(like(i) for i in range(1, CLIENTS + 1)))
+    await like_counter.flush()
+
+    return time.perf_counter() - started
+
+
+async def main() -> None:
+    print(f"{'mode':>13} {'likes':>7} {'s':>7} {'likes/s':>9} {'counter':>8}")
+
+    for write_behind in (False, True):
+        await seed()
+        like_module.LIKES_WRITE_BEHIND = write_behind
+
+        async with AsyncClient(app=app, base_url="http://test") as client:
+            elapsed = await hammer(client)
+
+        await like_counter.stop()
+
+        async with async_session_maker() as session:
+            tweet = await session.get(Tweet, 1)
+
+        mode = "write-behind" if write_behind else "direct"
+        print(f"{mode:>13} {CLIENTS:>7} {elapsed:>7.2f} "
+              f"{CLIENTS / elapsed:>9.0f} {tweet.likes_count:>8}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+"""
+Бенчмарк задержки загрузки изображений.
+
+Загружает UPLOADS изображений (CONCURRENCY одновременно) без создания
+уменьшенных копий и с ним (MEDIA_VARIANTS_ENABLED). Копии создаются
+в пуле процессов после ответа, поэтому задержка загрузки не должна
+заметно зависеть от режима, если у машины есть свободные ядра для
+MEDIA_WORKERS процессов (на одном ядре процессы обработки конкурируют
+с приложением за процессор). Для режима с копиями отдельно выводится
+время до готовности всех копий.
+
+ВНИМАНИЕ: база данных из .env будет пересоздана, изображения
+сохраняются во временную директорию.
+
+Запуск:
+    python -m benchmarks.upload_latency
+"""
+import asyncio
+import io
+import statistics
+import tempfile
+import time
+from typing import List
+
+from httpx import AsyncClient
+from PIL import Image as PILImage
+
+import main.services.image as image_service
+import main.services.image_variants as variants_module
+import main.utils.image as image_utils
+from main.app import app
+from main.database import Base, async_session_maker, engine
+from main.models.users import User
+from main.services.image_variants import image_variants
+
+UPLOADS = 50
+CONCURRENCY = 10
+IMAGE_SIZE = (3000, 2000)
+
+
+async def seed() -> None:
+    """
+    Пользователь, загружающий изображения
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with async_session_maker() as session:
+        session.add(User(username="user", api_key="user"))
+        await session.commit()
+
+
+def make_images() -> List[bytes]:
+    """
+    Разные изображения (одинаковые хранились бы одним файлом)
+    """
+    images = []
+
+    for i in range(UPLOADS):
+        content = io.BytesIO()
+        image = PILImage.effect_noise(IMAGE_SIZE, 64 + i).convert("RGB")
+        image.save(content, format="JPEG", quality=90)
+        images.append(content.getvalue())
+
+    return images
+
+
+async def upload(client: AsyncClient, images: List[bytes]) -> List[float]:
+    """
+    Загрузка изображений, задержка каждого запроса в секундах
+    """
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    latencies = []
+
+    async def send(i: int, content: bytes) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            resp = await client.post("/api/medias",
+                                     files={"file": (f"{i}.jpg", content)},
+                                     headers={"api-key": "user"},
+                                     )
+            latencies.append(time.perf_counter() - started)
+            resp.raise_for_status()
+
+    await asyncio.gather(*(send(i, content) for i, content in enumerate(images)))
+
+    return latencies
+
+
+async def main() -> None:
+    images = make_images()
+    print(f"{len(images)} images, "
+          f"{sum(map(len, images)) / len(images) / 1024:.0f} KiB avg")
+    print(f"{'variants':>9} {'p50 ms':>8} {'p95 ms':>8} {'total s':>8} "
+          f"{'ready s':>8}")
+
+    for enabled in (False, True):
+        await seed()
+
+        with tempfile.TemporaryDirectory() as folder:
+            image_utils.MEDIA_FOLDER = folder
+            variants_module.MEDIA_FOLDER = folder
+            image_service.MEDIA_VARIANTS_ENABLED = enabled
+
+            async with AsyncClient(app=app, base_url="http://test") as client:
+                started = time.perf_counter()
+                latencies = await upload(client, images)
+                total = time.perf_counter() - started
+
+                await image_variants.wait()
+                ready = time.perf_counter() - started
+
+            await image_variants.stop()
+
+        p50 = statistics.median(latencies) * 1000
+        p95 = statistics.quantiles(latencies, n=20)[-1] * 1000
+        mode = "on" if enabled else "off"
+        print(f"{mode:>9} {p50:>8.1f} {p95:>8.1f} {total:>8.2f} "
+              f"{ready if enabled else total:>8.2f}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
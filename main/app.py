@@ -1,15 +1,39 @@
+from contextlib import asynccontextmanager
+
 from fastapi import Depends, FastAPI
 from starlette.staticfiles import StaticFiles
 
 from main.routes.image import image_router
+from main.routes.metrics import metrics_router
 from main.routes.tweet import tweet_router
 from main.routes.user import user_router
+from main.services.file_reaper import file_reaper
+from main.services.image_variants import image_variants
+from main.services.like_counter import like_counter
+from main.services.media_collector import media_collector
+from main.services.tweet_stream import tweet_stream
 from main.utils.exeptions import SpecialException, custom_special_exception
-from main.utils.user import get_current_user
+from main.utils.user import get_current_principal
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Периодическая сборка брошенных изображений (MEDIA_GC_INTERVAL)
+    media_collector.start()
+    yield
+    await media_collector.stop()
+    # Запись накопленных счетчиков лайков, завершение обработки
+    # и удаления изображений при остановке приложения
+    await like_counter.stop()
+    await image_variants.stop()
+    await file_reaper.stop()
+    await tweet_stream.stop()
+
 
 app = FastAPI(title="Microblog",
               debug=True,
-              dependencies=[Depends(get_current_user)],)
+              lifespan=lifespan,
+              dependencies=[Depends(get_current_principal)],)
 
 # Статик
 # app.mount("/static",
@@ -23,3 +47,4 @@ app.add_exception_handler(SpecialException, custom_special_exception)
 app.include_router(user_router)
 app.include_router(image_router)
 app.include_router(tweet_router)
+app.include_router(metrics_router)
@@ -0,0 +1,23 @@
+import asyncio
+
+from loguru import logger
+
+from main.database import async_session_maker
+from main.services.timeline import TimelineService
+
+
+async def backfill_timelines():
+    """
+    Заполнение материализованных лент по существующим подпискам.
+    Запускается один раз перед включением FEED_FANOUT_ENABLED
+    """
+    logger.debug("Запуск заполнения лент")
+
+    async with async_session_maker() as session:
+        inserted = await TimelineService.backfill(session=session)
+
+    logger.debug(f"Заполнение лент завершено, записей: {inserted}")
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill_timelines())
@@ -0,0 +1,28 @@
+import asyncio
+
+from loguru import logger
+
+from main.database import async_session_maker
+from main.services.file_reaper import file_reaper
+from main.services.image import ImageService
+
+
+async def collect_media():
+    """
+    Удаление изображений, не привязанных к твитам дольше MEDIA_ORPHAN_GRACE.
+    Для запуска по расписанию (cron)
+    """
+    logger.debug("Запуск сборки брошенных изображений")
+
+    async with async_session_maker() as session:
+        collected, reclaimed = await ImageService.collect_orphans(session=session)
+
+    # Файлы удаляются в фоне, дожидаемся их удаления
+    await file_reaper.wait()
+
+    logger.info(f"Удалено изображений: {collected}, "
+                f"освобождено: {reclaimed / 1024 / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    asyncio.run(collect_media())
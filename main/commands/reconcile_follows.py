@@ -0,0 +1,22 @@
+import asyncio
+
+from loguru import logger
+
+from main.database import async_session_maker
+from main.services.follower import FollowerService
+
+
+async def reconcile_follows():
+    """
+    Пересчет счетчиков подписок и подписчиков по таблице подписок
+    """
+    logger.debug("Запуск сверки счетчиков подписок")
+
+    async with async_session_maker() as session:
+        fixed = await FollowerService.reconcile_counts(session=session)
+
+    logger.debug(f"Сверка счетчиков подписок завершена, исправлено: {fixed}")
+
+
+if __name__ == "__main__":
+    asyncio.run(reconcile_follows())
@@ -0,0 +1,22 @@
+import asyncio
+
+from loguru import logger
+
+from main.database import async_session_maker
+from main.services.like import LikeService
+
+
+async def reconcile_likes():
+    """
+    Пересчет счетчиков лайков твитов по таблице лайков
+    """
+    logger.debug("Запуск сверки счетчиков лайков")
+
+    async with async_session_maker() as session:
+        fixed = await LikeService.reconcile_counts(session=session)
+
+    logger.debug(f"Сверка счетчиков лайков завершена, исправлено: {fixed}")
+
+
+if __name__ == "__main__":
+    asyncio.run(reconcile_likes())
@@ -6,6 +6,18 @@ from dotenv import load_dotenv
 load_dotenv()  # Извлекаем переменные окружения из файла .env
 
 
+def _env_bool(name: str, default: bool = False) -> bool:
+    """
+    Чтение логического флага из переменной окружения
+    """
+    value = os.environ.get(name)
+
+    if value is None:
+        return default
+
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 # STATIC_FOLDER = os.path.join("usr", "share", "nginx", "static")
 # IMAGES_FOLDER = os.path.join(STATIC_FOLDER, "images")
@@ -18,9 +30,140 @@ ALLOWED_EXTENSIONS = {
     "gif",
 }
 
+# Директория для сохранения изображений
+MEDIA_FOLDER = os.environ.get("MEDIA_FOLDER", os.path.join("static", "images"))
+# Загрузка изображений: размер читаемого блока и максимальный размер файла
+MEDIA_CHUNK_SIZE = int(os.environ.get("MEDIA_CHUNK_SIZE", 64 * 1024))
+MEDIA_MAX_SIZE = int(os.environ.get("MEDIA_MAX_SIZE", 10 * 1024 * 1024))
+# Максимальное кол-во файлов в одном запросе пакетной загрузки
+MEDIA_BATCH_MAX_FILES = int(os.environ.get("MEDIA_BATCH_MAX_FILES", 10))
+# Фоновое удаление файлов: размер пачки, кол-во попыток и пауза
+# между попытками в секундах
+MEDIA_REAPER_BATCH = int(os.environ.get("MEDIA_REAPER_BATCH", 100))
+MEDIA_REAPER_RETRIES = int(os.environ.get("MEDIA_REAPER_RETRIES", 5))
+MEDIA_REAPER_RETRY_DELAY = float(os.environ.get("MEDIA_REAPER_RETRY_DELAY", 1))
+# Сборка не привязанных к твитам изображений: срок в секундах, после
+# которого изображение считается брошенным, размер пачки и интервал
+# запуска в приложении в секундах (0 - только командой collect_media)
+MEDIA_ORPHAN_GRACE = int(os.environ.get("MEDIA_ORPHAN_GRACE", 24 * 60 * 60))
+MEDIA_GC_BATCH = int(os.environ.get("MEDIA_GC_BATCH", 500))
+MEDIA_GC_INTERVAL = float(os.environ.get("MEDIA_GC_INTERVAL", 0))
+# Уменьшенные копии изображений: включение, кол-во процессов обработки,
+# варианты (название -> максимальная сторона в пикселях) и качество WebP
+MEDIA_VARIANTS_ENABLED = _env_bool("MEDIA_VARIANTS_ENABLED")
+MEDIA_WORKERS = int(os.environ.get("MEDIA_WORKERS", 2))
+MEDIA_VARIANTS = {
+    "thumb": 320,
+    "medium": 1080,
+}
+MEDIA_VARIANT_QUALITY = int(os.environ.get("MEDIA_VARIANT_QUALITY", 80))
+
 # PostgresSQL
 DB_HOST = os.environ.get("DB_HOST")
 DB_PORT = os.environ.get("DB_PORT")
 DB_NAME = os.environ.get("DB_NAME")
 DB_USER = os.environ.get("DB_USER")
 DB_PASS = os.environ.get("DB_PASS")
+
+# Пул соединений (на каждый процесс приложения): постоянные соединения,
+# дополнительные соединения сверх пула, ожидание свободного соединения
+# и время жизни соединения в секундах (-1 - без ограничения),
+# проверка соединения перед выдачей из пула
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+# Ограничение времени выполнения запроса в БД, мс (0 - без ограничения)
+DB_STATEMENT_TIMEOUT = int(os.environ.get("DB_STATEMENT_TIMEOUT", 0))
+# Кэш подготовленных выражений asyncpg на соединение
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 100))
+# Работа через пулер в режиме транзакций (PgBouncer pool_mode=transaction):
+# подготовленные выражения не кэшируются
+DB_PGBOUNCER = _env_bool("DB_PGBOUNCER")
+
+# Реплики для чтения: URL через запятую (postgresql+asyncpg://...).
+# Пользователь, изменявший данные, DB_REPLICA_STALENESS секунд читает
+# с основной БД (видит свои изменения)
+DB_REPLICA_URLS = [
+    url.strip()
+    for url in os.environ.get("DB_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
+DB_REPLICA_STALENESS = float(os.environ.get("DB_REPLICA_STALENESS", 5))
+# Допустимое отставание реплики в секундах (0 - не проверяется)
+# и период проверки реплики; на этот же срок исключается недоступная реплика
+DB_REPLICA_MAX_LAG = float(os.environ.get("DB_REPLICA_MAX_LAG", 0))
+DB_REPLICA_CHECK_INTERVAL = float(os.environ.get("DB_REPLICA_CHECK_INTERVAL",
+                                                 10,
+                                                 ))
+
+# Лента твитов: размер страницы по умолчанию и максимально допустимый
+FEED_PAGE_SIZE = int(os.environ.get("FEED_PAGE_SIZE", 50))
+FEED_MAX_PAGE_SIZE = int(os.environ.get("FEED_MAX_PAGE_SIZE", 100))
+# Кол-во последних лайков твита в ленте в режиме сводки (likes=summary)
+FEED_LIKES_PREVIEW = int(os.environ.get("FEED_LIKES_PREVIEW", 3))
+# Версия ленты (ETag) меняется не реже раза в FEED_ETAG_MAX_AGE секунд,
+# чтобы обновлялись лайки твитов (0 - только при активности авторов)
+FEED_ETAG_MAX_AGE = float(os.environ.get("FEED_ETAG_MAX_AGE", 60))
+# Запрос ленты по watermark повторно выводит твиты последних
+# FEED_SINCE_OVERLAP секунд: твиты, закоммиченные с задержкой, не теряются
+FEED_SINCE_OVERLAP = float(os.environ.get("FEED_SINCE_OVERLAP", 5))
+
+# Список лайков твита: размер страницы по умолчанию и максимально допустимый
+LIKES_PAGE_SIZE = int(os.environ.get("LIKES_PAGE_SIZE", 100))
+LIKES_MAX_PAGE_SIZE = int(os.environ.get("LIKES_MAX_PAGE_SIZE", 500))
+
+# Подписки и подписчики: кол-во последних в профиле пользователя,
+# размер страницы списка по умолчанию и максимально допустимый
+PROFILE_FOLLOWS_PREVIEW = int(os.environ.get("PROFILE_FOLLOWS_PREVIEW", 50))
+FOLLOWS_PAGE_SIZE = int(os.environ.get("FOLLOWS_PAGE_SIZE", 100))
+FOLLOWS_MAX_PAGE_SIZE = int(os.environ.get("FOLLOWS_MAX_PAGE_SIZE", 500))
+# Максимальное кол-во пользователей в одном запросе массовой подписки
+FOLLOWS_BULK_MAX_SIZE = int(os.environ.get("FOLLOWS_BULK_MAX_SIZE", 100))
+# Кол-во пользователей, пересчитываемых за один проход сверки счетчиков
+FOLLOWS_RECONCILE_BATCH = int(os.environ.get("FOLLOWS_RECONCILE_BATCH", 1000))
+
+# Материализованные ленты (fan-out-on-write). Твиты авторов, у которых
+# подписчиков больше FEED_FANOUT_MAX_FOLLOWERS, в ленты не раскладываются
+# и подмешиваются при чтении (fan-out-on-read)
+FEED_FANOUT_ENABLED = _env_bool("FEED_FANOUT_ENABLED")
+FEED_FANOUT_MAX_FOLLOWERS = int(os.environ.get("FEED_FANOUT_MAX_FOLLOWERS",
+                                               10000,
+                                               ))
+FEED_FANOUT_BACKFILL_BATCH = int(os.environ.get("FEED_FANOUT_BACKFILL_BATCH",
+                                                500,
+                                                ))
+
+# Общий для воркеров кэш: "" - не используется, memory - локальная замена
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "")
+
+# Поток новых твитов (GET /api/tweets/stream): общая для воркеров шина
+# событий ("" - только в пределах процесса, memory - локальная замена),
+# размер очереди соединения, интервал keep-alive (сек.) и время, после
+# которого поток закрывается и клиент переподключается (сек.)
+STREAM_BACKEND = os.environ.get("STREAM_BACKEND", "")
+STREAM_QUEUE_SIZE = int(os.environ.get("STREAM_QUEUE_SIZE", 100))
+STREAM_KEEPALIVE = float(os.environ.get("STREAM_KEEPALIVE", 15))
+STREAM_MAX_DURATION = float(os.environ.get("STREAM_MAX_DURATION", 300))
+
+# Кэш аутентификации по api-key: время жизни записи (сек.) и размер.
+# Без общего кэша (CACHE_BACKEND) записи хранятся в памяти каждого воркера,
+# и после ротации ключа или удаления пользователя другие воркеры принимают
+# прежний ключ до AUTH_CACHE_TTL сек. С общим кэшем память воркеров
+# не используется, и сброс действует сразу во всех
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", 60))
+AUTH_CACHE_MAXSIZE = int(os.environ.get("AUTH_CACHE_MAXSIZE", 10000))
+
+# Кэш профилей пользователей (GET /api/users/{id}): время жизни записи
+# (сек.) и размер. Записи сбрасываются при подписке и отписке
+PROFILE_CACHE_TTL = float(os.environ.get("PROFILE_CACHE_TTL", 300))
+PROFILE_CACHE_MAXSIZE = int(os.environ.get("PROFILE_CACHE_MAXSIZE", 10000))
+
+# Отложенная запись счетчиков лайков: записи о лайках сохраняются сразу,
+# а изменения likes_count копятся в памяти и записываются пачкой раз
+# в LIKES_FLUSH_INTERVAL секунд
+LIKES_WRITE_BEHIND = _env_bool("LIKES_WRITE_BEHIND")
+LIKES_FLUSH_INTERVAL = float(os.environ.get("LIKES_FLUSH_INTERVAL", 1))
+# Кол-во твитов, пересчитываемых за один проход сверки счетчиков лайков
+LIKES_RECONCILE_BATCH = int(os.environ.get("LIKES_RECONCILE_BATCH", 1000))
@@ -1,15 +1,28 @@
-from typing import AsyncGenerator
+import time
+import uuid
+from typing import Any, AsyncGenerator, Dict
 
 from sqlalchemy import MetaData
-from sqlalchemy.ext.asyncio import (AsyncSession,
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import (AsyncEngine,
+                                    AsyncSession,
                                     async_sessionmaker,
                                     create_async_engine,)
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 from main.config import (DB_HOST,
+                         DB_MAX_OVERFLOW,
                          DB_NAME,
                          DB_PASS,
+                         DB_PGBOUNCER,
+                         DB_POOL_PRE_PING,
+                         DB_POOL_RECYCLE,
+                         DB_POOL_SIZE,
+                         DB_POOL_TIMEOUT,
                          DB_PORT,
+                         DB_STATEMENT_CACHE_SIZE,
+                         DB_STATEMENT_TIMEOUT,
                          DB_USER,)
 
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
@@ -21,7 +34,120 @@ class Base(DeclarativeBase):
 
 metadata = MetaData()
 
-engine = create_async_engine(DATABASE_URL)
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений с учетом времени ожидания соединения
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.waits += 1
+            self.wait_time += elapsed
+            self.max_wait_time = max(self.max_wait_time, elapsed)
+
+
+def engine_options(pool_size: int = DB_POOL_SIZE,
+                   max_overflow: int = DB_MAX_OVERFLOW,
+                   pool_timeout: float = DB_POOL_TIMEOUT,
+                   ) -> Dict[str, Any]:
+    """
+    Параметры движка из настроек
+    :param pool_size: кол-во постоянных соединений
+    :param max_overflow: кол-во дополнительных соединений
+    :param pool_timeout: ожидание свободного соединения в секундах
+    :return: именованные аргументы create_async_engine
+    """
+    connect_args: Dict[str, Any] = {}
+    server_settings: Dict[str, str] = {}
+
+    if DB_STATEMENT_TIMEOUT:
+        server_settings["statement_timeout"] = str(DB_STATEMENT_TIMEOUT)
+
+    if server_settings:
+        connect_args["server_settings"] = server_settings
+
+    cache_size = DB_STATEMENT_CACHE_SIZE
+
+    if DB_PGBOUNCER:
+        # Соединение с сервером БД меняется между транзакциями, поэтому
+        # подготовленные выражения не кэшируются, а их имена уникальны
+        cache_size = 0
+        connect_args["prepared_statement_name_func"] = (
+            lambda: f"__asyncpg_{uuid.uuid4()}__"
+        )
+
+    # Кэш asyncpg и кэш подготовленных выражений диалекта SQLAlchemy
+    connect_args["statement_cache_size"] = cache_size
+    connect_args["prepared_statement_cache_size"] = cache_size
+
+    return {
+        "poolclass": MeteredQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": pool_timeout,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "connect_args": connect_args,
+    }
+
+
+def create_engine(url: str = DATABASE_URL, **options: Any) -> AsyncEngine:
+    """
+    Создание движка с параметрами пула и соединений из настроек
+    :param url: адрес БД
+    :param options: параметры, заменяющие настройки (pool_size и т.д.)
+    :return: асинхронный движок
+    """
+    return create_async_engine(url, **engine_options(**options))
+
+
+def pool_metrics(engine: AsyncEngine) -> Dict[str, Any]:
+    """
+    Состояние пула соединений движка
+    :param engine: асинхронный движок
+    :return: размер пула, выданные и свободные соединения, соединения
+     сверх пула, кол-во и время ожидания соединений (пустой словарь
+     для пулов без очереди соединений, например NullPool)
+    """
+    pool = engine.pool
+    metrics: Dict[str, Any] = {}
+
+    if isinstance(pool, QueuePool):
+        metrics.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=pool.overflow(),
+        )
+
+    if isinstance(pool, MeteredQueuePool):
+        metrics.update(
+            waits=pool.waits,
+            wait_time=pool.wait_time,
+            max_wait_time=pool.max_wait_time,
+            timeouts=pool.timeouts,
+        )
+
+    return metrics
+
+
+engine = create_engine()
 
 async_session_maker = async_sessionmaker(
     engine, expire_on_commit=False, class_=AsyncSession
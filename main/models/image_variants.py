@@ -0,0 +1,27 @@
+from sqlalchemy import BigInteger, ForeignKey, String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from main.database import Base
+
+
+class ImageVariant(Base):
+    """
+    Модель уменьшенной (перекодированной) копии изображения
+    """
+
+    __tablename__ = "image_variants"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    image_id: Mapped[int] = mapped_column(
+        ForeignKey("images.id", ondelete="CASCADE"), index=True
+    )
+    # Название варианта из MEDIA_VARIANTS (thumb, medium)
+    name: Mapped[str] = mapped_column(String(32))
+    path_media: Mapped[str]
+    width: Mapped[int]
+    height: Mapped[int]
+    size: Mapped[int] = mapped_column(BigInteger)
+
+    __table_args__ = (
+        UniqueConstraint("image_id", "name", name="uq_image_variants_image_id_name"),
+    )
@@ -1,4 +1,6 @@
-from sqlalchemy import ForeignKey
+import datetime
+
+from sqlalchemy import BigInteger, ForeignKey, Index, String, text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from main.database import Base
@@ -17,7 +19,29 @@ class Image(Base):
                                     )
     tweet_id: Mapped[int] = mapped_column(ForeignKey("tweets.id"),
                                           nullable=True,
+                                          index=True,
                                           )
-    path_media: Mapped[str]
+    # Проверка ссылок на файл перед его удалением
+    path_media: Mapped[str] = mapped_column(index=True)
+    # sha256 содержимого: файлы с одинаковым содержимым хранятся один раз,
+    # кол-во записей с одним хэшем - кол-во ссылок на файл
+    content_hash: Mapped[str | None] = mapped_column(String(64),
+                                                     index=True,
+                                                     nullable=True,
+                                                     )
+    size: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    # Дата загрузки: не привязанные к твиту изображения удаляются
+    # по истечении MEDIA_ORPHAN_GRACE
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        default=datetime.datetime.utcnow, nullable=False
+    )
+
+    __table_args__ = (
+        # Поиск брошенных изображений: индекс только по не привязанным
+        Index("ix_images_orphans_created_at",
+              "created_at",
+              postgresql_where=text("tweet_id IS NULL"),
+              ),
+    )
 
     __mapper_args__ = {"confirm_deleted_rows": False}
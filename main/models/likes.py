@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column
 
 from main.database import Base
@@ -18,6 +18,17 @@ class Like(Base):
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     tweets_id: Mapped[int] = mapped_column(ForeignKey("tweets.id"))
 
+    __table_args__ = (
+        # Пользователь может лайкнуть твит только один раз
+        # (индекс ограничения используется и для поиска лайков пользователя)
+        UniqueConstraint("user_id",
+                         "tweets_id",
+                         name="uq_likes_user_id_tweets_id",
+                         ),
+        # Лайки твита по порядку (список лайкнувших, последние лайки в ленте)
+        Index("ix_likes_tweets_id_id", "tweets_id", "id"),
+    )
+
     # Отключаем проверку строк, тем самым убирая уведомление,
     # возникающее при удалении несуществующей строки
     __mapper_args__ = {"confirm_deleted_rows": False}
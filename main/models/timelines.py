@@ -0,0 +1,36 @@
+import datetime
+
+from sqlalchemy import ForeignKey, Index
+from sqlalchemy.orm import Mapped, mapped_column
+
+from main.database import Base
+
+
+class TimelineEntry(Base):
+    """
+    Модель записи материализованной ленты пользователя
+    (используется в режиме fan-out-on-write)
+    """
+
+    __tablename__ = "timelines"
+
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    tweet_id: Mapped[int] = mapped_column(
+        ForeignKey("tweets.id", ondelete="CASCADE"), primary_key=True
+    )
+    # Дублируем дату создания твита, чтобы страница ленты читалась
+    # одним проходом по индексу без обращения к таблице твитов
+    created_at: Mapped[datetime.datetime]
+
+    __table_args__ = (
+        Index("ix_timelines_user_id_created_at_tweet_id",
+              "user_id",
+              "created_at",
+              "tweet_id",
+              ),
+        # Удаление твита из лент (TimelineService.retract, каскадное
+        # удаление вместе с твитом) без прохода по всей таблице
+        Index("ix_timelines_tweet_id", "tweet_id"),
+    )
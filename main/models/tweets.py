@@ -1,13 +1,25 @@
 import datetime
 from typing import List
 
-from sqlalchemy import ForeignKey, Integer, String
+from sqlalchemy import (Boolean,
+                        Computed,
+                        Float,
+                        ForeignKey,
+                        Index,
+                        Integer,
+                        String,)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from main.database import Base
 from main.models.images import Image
 from main.models.likes import Like
 
+# Рейтинг твита для ленты order=ranked: десятикратное кол-во лайков
+# равноценно SCORE_PERIOD секундам новизны (12.5 часов). Рейтинг не зависит
+# от текущего времени, поэтому хранится в колонке и индексируется,
+# а более новые твиты со временем обгоняют старые
+SCORE_PERIOD = 45000
+
 
 class Tweet(Base):
     """
@@ -22,7 +34,7 @@ class Tweet(Base):
                                     )
     tweet_data: Mapped[str] = mapped_column(String(280))
     created_at: Mapped[datetime.datetime] = mapped_column(
-        default=datetime.datetime.utcnow, nullable=True
+        default=datetime.datetime.utcnow, nullable=False
     )
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     images: Mapped[List["Image"]] = relationship(
@@ -32,6 +44,29 @@ class Tweet(Base):
     likes: Mapped[List["Like"]] = relationship(
         backref="tweet", cascade="all, delete-orphan"
     )
+    # Рейтинг (см. SCORE_PERIOD): вычисляется БД при добавлении твита
+    # и изменении likes_count
+    score: Mapped[float] = mapped_column(
+        Float,
+        Computed("log(greatest(likes_count, 1)) "
+                 f"+ extract(epoch FROM created_at) / {SCORE_PERIOD}",
+                 persisted=True,
+                 ),
+    )
+    # Твит разложен по лентам подписчиков (fan-out-on-write).
+    # Иначе твит подмешивается в ленту при чтении
+    fanned_out: Mapped[bool] = mapped_column(Boolean,
+                                             default=False,
+                                             server_default="false",
+                                             )
+
+    __table_args__ = (
+        # Твиты автора в порядке ленты (постраничный вывод по ключу)
+        Index("ix_tweets_user_id_created_at_id", "user_id", "created_at", "id"),
+        # Твиты автора по популярности и по рейтингу
+        Index("ix_tweets_user_id_likes_count_id", "user_id", "likes_count", "id"),
+        Index("ix_tweets_user_id_score_id", "user_id", "score", "id"),
+    )
 
     # Отключаем проверку строк, тем самым убирая уведомление,
     # возникающее при удалении несуществующей строки
@@ -1,6 +1,7 @@
+import datetime
 from typing import List
 
-from sqlalchemy import Column, ForeignKey, Integer, String, Table
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, Table
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from main.database import Base
@@ -13,6 +14,12 @@ user_to_user = Table(
     Base.metadata,
     Column("followers_id", Integer, ForeignKey("users.id"), primary_key=True),
     Column("following_id", Integer, ForeignKey("users.id"), primary_key=True),
+    # Первичный ключ начинается с followers_id (подписки пользователя),
+    # для подписчиков пользователя нужен индекс по following_id
+    Index("ix_user_to_user_following_id_followers_id",
+          "following_id",
+          "followers_id",
+          ),
 )
 
 
@@ -32,7 +39,15 @@ class User(Base):
                                           unique=True,
                                           index=True,
                                           )
-    api_key: Mapped[str] = mapped_column()
+    # Поиск пользователя при аутентификации
+    api_key: Mapped[str] = mapped_column(unique=True, index=True)
+    # Кол-во подписчиков и подписок (ведутся FollowerService)
+    followers_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    following_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    # Время последнего изменения, влияющего на ленты: твиты пользователя
+    # (добавление, удаление) и его подписки. Используется в версии ленты
+    # (ETag GET /api/tweets)
+    last_activity_at: Mapped[datetime.datetime | None]
     tweets: Mapped[List["Tweet"]] = relationship(
         backref="user", cascade="all, delete-orphan"
     )
@@ -41,14 +56,14 @@ class User(Base):
         cascade="all, delete-orphan",
     )
 
-    # many to many
+    # many to many. Списки подписок и подписчиков не загружаются вместе
+    # с пользователем: запросы, которым они нужны, загружают их явно
     following = relationship(
         "User",
         secondary=user_to_user,
         primaryjoin=id == user_to_user.c.followers_id,
         secondaryjoin=id == user_to_user.c.following_id,
         backref="followers",
-        lazy="selectin",
     )
 
     # Отключаем проверку строк, тем самым убирая уведомление,
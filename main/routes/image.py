@@ -1,21 +1,63 @@
 from http import HTTPStatus
+from typing import Callable, Coroutine, List
 
-from fastapi import APIRouter, Depends, UploadFile
+from fastapi import APIRouter, Depends, Request, Response, UploadFile
+from fastapi.routing import APIRoute
 from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from main.database import get_async_session
+from main.config import MEDIA_BATCH_MAX_FILES
+from main.database import async_session_maker, get_async_session
 from main.schemas import (
     ImageErrorSchema,
+    ImageListSchema,
     ImageSchema,
+    ImageTooLargeSchema,
     UnauthorizedSchema,
     ValidationSchema,
 )
 from main.services.image import ImageService
 from main.utils.exeptions import SpecialException
+from main.utils.image import check_content_length
+from main.utils.token import TOKEN
+from main.utils.user import authenticate
+
+
+class MediaRoute(APIRoute):
+    """
+    Маршрут загрузки изображений: размер запроса проверяется по заголовку
+    Content-Length до того, как тело будет прочитано и разобрано.
+    Зависимости маршрута (в том числе аутентификация) выполняются только
+    после разбора тела, поэтому api-key проверяется здесь же, до размера:
+    запрос без верного токена получает 401, а не 413
+    """
+
+    def get_route_handler(
+        self,
+    ) -> Callable[[Request], Coroutine[None, None, Response]]:
+        handler = super().get_route_handler()
+        batch = self.path.endswith("/batch")
+
+        async def media_route_handler(request: Request) -> Response:
+            # Пользователь обычно уже в кэше аутентификации,
+            # соединение для сессии берется из пула только при промахе
+            async with async_session_maker() as session:
+                await authenticate(token=await TOKEN(request), session=session)
+
+            check_content_length(
+                content_length=request.headers.get("content-length"),
+                files=MEDIA_BATCH_MAX_FILES if batch else 1,
+            )
+
+            return await handler(request)
+
+        return media_route_handler
+
 
 image_router = APIRouter(
-    prefix="/api/medias", tags=["medias"]  # URL  # Объединяем URL в группу
+    prefix="/api/medias",  # URL
+    tags=["medias"],  # Объединяем URL в группу
+    route_class=MediaRoute,
 )
 
 
@@ -25,6 +67,7 @@ image_router = APIRouter(
     responses={
         401: {"model": UnauthorizedSchema},
         400: {"model": ImageErrorSchema},
+        413: {"model": ImageTooLargeSchema},
         422: {"model": ValidationSchema},
     },
     status_code=201,
@@ -49,3 +92,35 @@ async def add_image(
     image_id = await ImageService.save_image(image=file, session=session)
 
     return {"media_id": image_id}
+
+
+@image_router.post(
+    "/batch",
+    response_model=ImageListSchema,
+    responses={
+        401: {"model": UnauthorizedSchema},
+        413: {"model": ImageTooLargeSchema},
+        422: {"model": ValidationSchema},
+    },
+    status_code=201,
+)
+async def add_images(
+    files: List[UploadFile],
+    session: AsyncSession = Depends(get_async_session),
+) -> dict:
+    """
+    Загрузка нескольких изображений к твиту одним запросом
+    """
+    if len(files) > MEDIA_BATCH_MAX_FILES:
+        logger.error(f"Передано изображений: {len(files)}")
+
+        raise SpecialException(
+            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,  # 422
+            detail=f"Too many images. Maximum: {MEDIA_BATCH_MAX_FILES}",
+        )
+    logger.info(f"Изображения {[file.filename for file in files]}")
+
+    # Записываем изображения в файловой системе и создаем записи в БД
+    image_ids = await ImageService.save_images(images=files, session=session)
+
+    return {"media_ids": image_ids}
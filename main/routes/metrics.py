@@ -0,0 +1,21 @@
+from fastapi import APIRouter
+
+from main.database import engine, pool_metrics
+from main.schemas import PoolMetricsSchema, UnauthorizedSchema
+
+metrics_router = APIRouter(
+    prefix="/api/metrics", tags=["metrics"]  # URL  # Объединяем URL в группу
+)
+
+
+@metrics_router.get(
+    "/pool",
+    response_model=PoolMetricsSchema,
+    responses={401: {"model": UnauthorizedSchema}},
+    status_code=200,
+)
+async def get_pool_metrics():
+    """
+    Состояние пула соединений с БД текущего процесса приложения
+    """
+    return pool_metrics(engine=engine)
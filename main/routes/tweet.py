@@ -1,15 +1,27 @@
+from http import HTTPStatus
 from typing import Annotated
 
-from fastapi import APIRouter, Depends
+import orjson
+from fastapi import APIRouter, Depends, Header, Query, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from main.config import (FEED_MAX_PAGE_SIZE,
+                         FEED_PAGE_SIZE,
+                         LIKES_MAX_PAGE_SIZE,
+                         LIKES_PAGE_SIZE,)
 from main.database import get_async_session
 from main.models.tweets import Tweet
-from main.models.users import User
 from main.schemas import (
     BaseSchema,
     ErrorSchema,
+    FeedOrder,
+    FollowingPrincipal,
+    LikeListSchema,
+    LikesMode,
     LockedSchema,
+    MediaVariant,
+    Principal,
     TweetIdSchema,
     TweetListSchema,
     TweetSchema,
@@ -18,7 +30,11 @@ from main.schemas import (
 )
 from main.services.like import LikeService
 from main.services.tweet import TweetsService
-from main.utils.user import get_current_user
+from main.services.tweet_stream import tweet_stream
+from main.utils.etag import etag_matches, make_etag
+from main.utils.user import (get_current_following,
+                             get_current_principal,
+                             get_read_session,)
 
 tweet_router = APIRouter(
     prefix="/api/tweets", tags=["tweets"]  # URL  # Объединяем URL в группу
@@ -32,16 +48,100 @@ tweet_router = APIRouter(
     status_code=200,
 )
 async def get_tweets(
-    current_user: Annotated[User, Depends(get_current_user)],
-    session: AsyncSession = Depends(get_async_session),
+    current_user: Annotated[Principal, Depends(get_current_principal)],
+    cursor: Annotated[str | None, Query()] = None,
+    limit: Annotated[int, Query(ge=1, le=FEED_MAX_PAGE_SIZE)] = FEED_PAGE_SIZE,
+    likes: Annotated[LikesMode, Query()] = "full",
+    media_variant: Annotated[MediaVariant | None, Query()] = None,
+    order: Annotated[FeedOrder, Query()] = "recent",
+    since: Annotated[str | None, Query()] = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+    session: AsyncSession = Depends(get_read_session),
 ):
     """
     Вывод ленты твитов (выводятся твиты людей,
-     на которых подписан пользователь)
+     на которых подписан пользователь), постранично по курсору.
+    В режиме likes=summary у твитов выводятся только последние лайки,
+     полный список доступен в GET /api/tweets/{tweet_id}/likes.
+    Параметр media_variant (thumb, medium) заменяет ссылки на изображения
+     ссылками на их уменьшенные копии.
+    Параметр order задает порядок ленты: recent - новые первыми,
+     popular - по кол-ву лайков, ranked - по рейтингу с учетом новизны.
+     Курсор действует только для порядка, с которым он получен.
+    Параметр since (watermark из предыдущего ответа) оставляет в ленте
+     только более новые твиты.
+    Ответ содержит ETag версии ленты: по заголовку If-None-Match
+     с актуальным ETag возвращается 304 без запроса самой ленты
+    """
+    version = await TweetsService.get_feed_version(user=current_user,
+                                                   session=session,
+                                                   )
+    etag = make_etag(orjson.dumps(
+        [version, cursor, limit, likes, media_variant, order, since]
+    ))
+    # Браузер проверяет актуальность ленты при каждом запросе
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if etag_matches(if_none_match=if_none_match, etag=etag):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED,  # 304
+                        headers=headers,
+                        )
+
+    tweets, next_cursor, watermark = await TweetsService.get_tweets(
+        user=current_user,
+        session=session,
+        limit=limit,
+        cursor=cursor,
+        likes_mode=likes,
+        media_variant=media_variant,
+        order=order,
+        since=since,
+    )
+
+    # Твиты уже в формате ответа: сериализуются orjson без валидации схемой
+    return ORJSONResponse({"result": True,
+                           "tweets": tweets,
+                           "next_cursor": next_cursor,
+                           "watermark": watermark,
+                           },
+                          headers=headers,
+                          )
+
+
+@tweet_router.get(
+    "/stream",
+    responses={
+        200: {"content": {"text/event-stream": {}}},
+        401: {"model": UnauthorizedSchema},
+    },
+    status_code=200,
+)
+async def stream_tweets(
+    current_user: Annotated[FollowingPrincipal, Depends(get_current_following)],
+    session: AsyncSession = Depends(get_async_session),
+):
     """
-    tweets = await TweetsService.get_tweets(user=current_user, session=session)
+    Поток новых твитов людей, на которых подписан пользователь
+     (Server-Sent Events).
+    Событие tweet содержит твит в формате ленты. Событие overflow
+     означает, что клиент не успевал читать и часть твитов пропущена:
+     ленту нужно догрузить запросом с параметром since.
+    Поток закрывается через STREAM_MAX_DURATION секунд, клиент
+     переподключается. Подписки, оформленные после подключения,
+     учитываются при переподключении
+    """
+    # Подписки загружены: соединение с БД возвращается в пул,
+    # а не удерживается на все время потока
+    await session.close()
 
-    return {"tweets": tweets}
+    return StreamingResponse(
+        tweet_stream.events(author_ids=current_user.following_ids),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache",
+                 # Отключение буферизации ответа в nginx
+                 "X-Accel-Buffering": "no",
+                 },
+    )
 
 
 @tweet_router.post(
@@ -55,7 +155,7 @@ async def get_tweets(
 )
 async def create_tweet(
     tweet_data: TweetSchema,
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[Principal, Depends(get_current_principal)],
     session: AsyncSession = Depends(get_async_session),
 ):
     """
@@ -81,7 +181,7 @@ async def create_tweet(
 )
 async def delete_tweet(
     tweet_id: int,
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[Principal, Depends(get_current_principal)],
     session: AsyncSession = Depends(get_async_session),
 ):
     """
@@ -94,6 +194,32 @@ async def delete_tweet(
     return {"result": True}
 
 
+@tweet_router.get(
+    "/{tweet_id}/likes",
+    response_model=LikeListSchema,
+    responses={
+        401: {"model": UnauthorizedSchema},
+        404: {"model": ErrorSchema},
+        422: {"model": ValidationSchema},
+    },
+    status_code=200,
+)
+async def get_likes(
+    tweet_id: int,
+    cursor: Annotated[str | None, Query()] = None,
+    limit: Annotated[int, Query(ge=1, le=LIKES_MAX_PAGE_SIZE)] = LIKES_PAGE_SIZE,
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Вывод пользователей, лайкнувших твит, постранично по курсору
+    """
+    likes, next_cursor = await LikeService.get_likes(
+        tweet_id=tweet_id, session=session, limit=limit, cursor=cursor
+    )
+
+    return {"likes": likes, "next_cursor": next_cursor}
+
+
 @tweet_router.post(
     "/{tweet_id}/likes",
     response_model=BaseSchema,
@@ -107,7 +233,7 @@ async def delete_tweet(
 )
 async def create_like(
     tweet_id: int,
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[Principal, Depends(get_current_principal)],
     session: AsyncSession = Depends(get_async_session),
 ):
     """
@@ -134,7 +260,7 @@ async def create_like(
 )
 async def delete_like(
     tweet_id: int,
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[Principal, Depends(get_current_principal)],
     session: AsyncSession = Depends(get_async_session),
 ):
     """
@@ -1,23 +1,35 @@
 from http import HTTPStatus
 from typing import Annotated
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.responses import Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from main.config import FOLLOWS_MAX_PAGE_SIZE, FOLLOWS_PAGE_SIZE
 from main.database import get_async_session
-from main.models.users import User
 from main.schemas import (
     BaseSchema,
+    BulkFollowResultSchema,
+    BulkFollowSchema,
     ErrorSchema,
+    FollowingPrincipal,
     LockedSchema,
+    Principal,
     UnauthorizedSchema,
+    UserInfoSchema,
+    UserListSchema,
     UserOutSchema,
     ValidationSchema,
 )
 from main.services.follower import FollowerService
 from main.services.user import UserService
+from main.utils.etag import etag_matches
 from main.utils.exeptions import SpecialException
-from main.utils.user import get_current_user
+from main.utils.profile_cache import profile_cache
+from main.utils.user import (get_current_following,
+                             get_current_principal,
+                             get_current_user,
+                             get_read_session,)
 
 user_router = APIRouter(
     prefix="/api/users", tags=["users"]  # URL  # Объединяем URL в группу
@@ -32,13 +44,70 @@ user_router = APIRouter(
     responses={401: {"model": UnauthorizedSchema}},
     status_code=200,
 )
-async def get_me(current_user: Annotated[User, Depends(get_current_user)]):
+async def get_me(
+    current_user: Annotated[UserInfoSchema, Depends(get_current_user)],
+):
     """
-    Вывод данных о текущем пользователе: id, username, подписки, подписчики
+    Вывод данных о текущем пользователе: id, username, кол-во подписок
+    и подписчиков, последние подписки и подписчики
     """
     return {"user": current_user}
 
 
+@user_router.post(
+    "/follow",
+    response_model=BulkFollowResultSchema,
+    responses={
+        401: {"model": UnauthorizedSchema},
+        422: {"model": ValidationSchema},
+    },
+    status_code=200,
+)
+async def create_followers(
+    data: BulkFollowSchema,
+    current_user: Annotated[Principal, Depends(get_current_principal)],
+    session: AsyncSession = Depends(get_async_session),
+):
+    """
+    Массовая подписка на пользователей (не более FOLLOWS_BULK_MAX_SIZE).
+    Результат для каждого id: followed, already_following, not_found, self
+    """
+    results = await FollowerService.create_followers(current_user=current_user,
+                                                     user_ids=data.user_ids,
+                                                     session=session,
+                                                     )
+
+    return {"users": [{"user_id": user_id, "status": status}
+                      for user_id, status in results]}
+
+
+@user_router.delete(
+    "/follow",
+    response_model=BulkFollowResultSchema,
+    responses={
+        401: {"model": UnauthorizedSchema},
+        422: {"model": ValidationSchema},
+    },
+    status_code=200,
+)
+async def delete_followers(
+    data: BulkFollowSchema,
+    current_user: Annotated[Principal, Depends(get_current_principal)],
+    session: AsyncSession = Depends(get_async_session),
+):
+    """
+    Массовая отписка от пользователей (не более FOLLOWS_BULK_MAX_SIZE).
+    Результат для каждого id: unfollowed, not_following, not_found, self
+    """
+    results = await FollowerService.delete_followers(current_user=current_user,
+                                                     user_ids=data.user_ids,
+                                                     session=session,
+                                                     )
+
+    return {"users": [{"user_id": user_id, "status": status}
+                      for user_id, status in results]}
+
+
 @user_router.post(
     "/{user_id}/follow",
     response_model=BaseSchema,
@@ -52,7 +121,7 @@ async def get_me(current_user: Annotated[User, Depends(get_current_user)]):
 )
 async def create_follower(
     user_id: int,
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[FollowingPrincipal, Depends(get_current_following)],
     session: AsyncSession = Depends(get_async_session),
 ):
     """
@@ -78,7 +147,7 @@ async def create_follower(
 )
 async def delete_follower(
     user_id: int,
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[FollowingPrincipal, Depends(get_current_following)],
     session: AsyncSession = Depends(get_async_session),
 ):
     """
@@ -95,6 +164,7 @@ async def delete_follower(
     "/{user_id}",
     response_model=UserOutSchema,
     responses={
+        304: {"description": "Профиль не изменился (If-None-Match)"},
         401: {"model": UnauthorizedSchema},
         404: {"model": ErrorSchema},
         422: {"model": ValidationSchema},
@@ -103,16 +173,95 @@ async def delete_follower(
     status_code=200,
 )
 async def get_user(user_id: int,
-                   session: AsyncSession = Depends(get_async_session),
+                   if_none_match: Annotated[str | None, Header()] = None,
+                   session: AsyncSession = Depends(get_read_session),
                    ):
     """
-    Вывод данных о пользователе: id, username, подписки, подписчики
+    Вывод данных о пользователе: id, username, кол-во подписок
+    и подписчиков, последние подписки и подписчики.
+    Готовый ответ берется из кэша профилей, по заголовку If-None-Match
+    с актуальным ETag возвращается 304 без тела
     """
-    user = await UserService.get_user_by_id(user_id=user_id, session=session)
+    profile = await profile_cache.get(user_id=user_id)
+
+    if profile is None:
+        user = await UserService.get_profile(user_id=user_id, session=session)
+
+        if user is None:
+            raise SpecialException(
+                status_code=HTTPStatus.NOT_FOUND, detail="User not found"
+            )
+
+        payload = UserOutSchema(user=user).model_dump_json(by_alias=True)
+        profile = await profile_cache.set(user_id=user_id, payload=payload)
 
-    if user is None:
-        raise SpecialException(
-            status_code=HTTPStatus.NOT_FOUND, detail="User not found"
-        )
+    payload, etag = profile
+
+    if etag_matches(if_none_match=if_none_match, etag=etag):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED,  # 304
+                        headers={"ETag": etag},
+                        )
+
+    return Response(content=payload,
+                    media_type="application/json",
+                    headers={"ETag": etag},
+                    )
+
+
+@user_router.get(
+    "/{user_id}/followers",
+    response_model=UserListSchema,
+    responses={
+        401: {"model": UnauthorizedSchema},
+        404: {"model": ErrorSchema},
+        422: {"model": ValidationSchema},
+    },
+    status_code=200,
+)
+async def get_followers(
+    user_id: int,
+    cursor: Annotated[str | None, Query()] = None,
+    limit: Annotated[int, Query(ge=1, le=FOLLOWS_MAX_PAGE_SIZE)] = FOLLOWS_PAGE_SIZE,
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Вывод подписчиков пользователя постранично по курсору (по убыванию id)
+    """
+    users, next_cursor = await UserService.get_follows(user_id=user_id,
+                                                       kind="followers",
+                                                       session=session,
+                                                       limit=limit,
+                                                       cursor=cursor,
+                                                       )
+
+    return {"users": users, "next_cursor": next_cursor}
+
+
+@user_router.get(
+    "/{user_id}/following",
+    response_model=UserListSchema,
+    responses={
+        401: {"model": UnauthorizedSchema},
+        404: {"model": ErrorSchema},
+        422: {"model": ValidationSchema},
+    },
+    status_code=200,
+)
+async def get_following(
+    user_id: int,
+    cursor: Annotated[str | None, Query()] = None,
+    limit: Annotated[int, Query(ge=1, le=FOLLOWS_MAX_PAGE_SIZE)] = FOLLOWS_PAGE_SIZE,
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Вывод пользователей, на которых подписан пользователь, постранично
+    по курсору (по убыванию id)
+    """
+    users, next_cursor = await UserService.get_follows(user_id=user_id,
+                                                       kind="following",
+                                                       session=session,
+                                                       limit=limit,
+                                                       cursor=cursor,
+                                                       )
 
-    return {"user": user}
+    return {"users": users, "next_cursor": next_cursor}
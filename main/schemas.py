@@ -1,5 +1,5 @@
 from http import HTTPStatus
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 from pydantic import (BaseModel,
                       ConfigDict,
@@ -7,8 +7,28 @@ from pydantic import (BaseModel,
                       field_validator,
                       model_validator,)
 
+from main.config import FOLLOWS_BULK_MAX_SIZE
 from main.utils.exeptions import SpecialException
 
+# Режим вывода лайков в ленте: full - все лайки твита,
+# summary - только последние лайки и признак лайка текущего пользователя
+LikesMode = Literal["full", "summary"]
+# Порядок ленты: recent - новые первыми, popular - по кол-ву лайков,
+# ranked - по рейтингу с учетом новизны (Tweet.score)
+FeedOrder = Literal["recent", "popular", "ranked"]
+# Уменьшенная копия изображений в ленте (см. MEDIA_VARIANTS)
+MediaVariant = Literal["thumb", "medium"]
+# Список пользователя: подписчики или подписки
+FollowsKind = Literal["followers", "following"]
+# Результат массовой подписки (отписки) для одного пользователя
+FollowStatus = Literal["followed",
+                       "unfollowed",
+                       "already_following",
+                       "not_following",
+                       "not_found",
+                       "self",
+                       ]
+
 
 class BaseSchema(BaseModel):
     """
@@ -66,6 +86,15 @@ class ImageErrorSchema(ErrorSchema):
     error_message: str = "The image was not attached to the request"
 
 
+class ImageTooLargeSchema(ErrorSchema):
+    """
+    Схема для ответа при загрузке изображения больше допустимого размера
+    """
+
+    error_type: HTTPStatus = HTTPStatus.REQUEST_ENTITY_TOO_LARGE  # 413
+    error_message: str = "The image is too large"
+
+
 class ImageSchema(BaseSchema):
     """
     Схема для вывода id изображения после публикации твита
@@ -79,6 +108,16 @@ class ImageSchema(BaseSchema):
     )
 
 
+class ImageListSchema(BaseSchema):
+    """
+    Схема для вывода id изображений после пакетной загрузки
+    """
+
+    ids: List[int] = Field(alias="media_ids")
+
+    model_config = ConfigDict(populate_by_name=True)
+
+
 class ImagePathSchema(BaseModel):
     """
     Схема для вывода ссылки на изображения при отображении твитов
@@ -106,11 +145,25 @@ class LikeSchema(BaseModel):
     def extract_user(cls, data):
         """
         Метод извлекает и возвращает данные о пользователе из объекта Like
+        (готовые данные лайка в формате ответа возвращаются как есть)
         """
+        if isinstance(data, dict):
+            return data
+
         user = data.user
         return user
 
 
+class LikeListSchema(BaseSchema):
+    """
+    Схема для постраничного вывода лайков твита
+    """
+
+    likes: List[LikeSchema]
+    # Курсор для запроса следующей страницы (None - больше лайков нет)
+    next_cursor: Optional[str] = None
+
+
 class UserSchema(BaseModel):
     """
     Базовая схема для вывода основных данных о пользователе
@@ -125,13 +178,38 @@ class UserSchema(BaseModel):
     )
 
 
+class Principal(BaseModel):
+    """
+    Данные аутентифицированного пользователя без связанных объектов
+    (хранятся в кэше аутентификации)
+    """
+
+    id: int
+    username: str
+
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+
+class FollowingPrincipal(Principal):
+    """
+    Данные аутентифицированного пользователя и id пользователей,
+    на которых он подписан
+    """
+
+    following_ids: List[int] = []
+
+
 class UserInfoSchema(UserSchema):
     """
     Схема для вывода детальной информации о пользователе
     """
 
+    # Последние подписки и подписчики (не более PROFILE_FOLLOWS_PREVIEW),
+    # полные списки - GET /api/users/{id}/following и /followers
     following: Optional[List["UserSchema"]] = []
     followers: Optional[List["UserSchema"]] = []
+    following_count: int = 0
+    followers_count: int = 0
 
     # Преобразование данных ORM-модели в объект схемы для сериализации
     model_config = ConfigDict(from_attributes=True)
@@ -145,6 +223,42 @@ class UserOutSchema(BaseSchema):
     user: UserInfoSchema
 
 
+class UserListSchema(BaseSchema):
+    """
+    Схема для постраничного вывода подписчиков или подписок пользователя
+    """
+
+    users: List[UserSchema]
+    # Курсор для запроса следующей страницы (None - больше пользователей нет)
+    next_cursor: Optional[str] = None
+
+
+class BulkFollowSchema(BaseModel):
+    """
+    Схема для входных данных массовой подписки и отписки
+    """
+
+    user_ids: List[int] = Field(min_length=1, max_length=FOLLOWS_BULK_MAX_SIZE)
+
+
+class FollowResultSchema(BaseModel):
+    """
+    Схема для вывода результата подписки (отписки) для одного пользователя
+    """
+
+    user_id: int
+    status: FollowStatus
+
+
+class BulkFollowResultSchema(BaseSchema):
+    """
+    Схема для вывода результатов массовой подписки и отписки
+    (в порядке переданных id)
+    """
+
+    users: List[FollowResultSchema]
+
+
 class TweetSchema(BaseModel):
     """
     Схема для входных данных при добавлении нового твита
@@ -199,14 +313,17 @@ class TweetOutSchema(BaseModel):
     likes: List[LikeSchema]
     images: List[str] = Field(alias="attachments")
     likes_count: int
+    # Лайкнул ли твит текущий пользователь
+    is_liked: bool = False
 
     @field_validator("images", mode="before")
     def serialize_images(cls, val: List[ImagePathSchema]):
         """
         Возвращаем список строк с ссылками на изображение
+        (готовые ссылки возвращаются как есть)
         """
         if isinstance(val, list):
-            return [v.path_media for v in val]
+            return [v if isinstance(v, str) else v.path_media for v in val]
 
         return val
 
@@ -222,3 +339,27 @@ class TweetListSchema(BaseSchema):
     """
 
     tweets: List[TweetOutSchema]
+    # Курсор для запроса следующей страницы (None - больше твитов нет)
+    next_cursor: Optional[str] = None
+    # Значение параметра since для запроса только новых твитов
+    # (первая страница ленты порядка recent)
+    watermark: Optional[str] = None
+
+
+class PoolMetricsSchema(BaseSchema):
+    """
+    Схема для вывода состояния пула соединений с БД
+    """
+
+    size: int
+    checked_out: int
+    checked_in: int
+    # Соединения сверх размера пула (отрицательное значение - пул
+    # еще не заполнен)
+    overflow: int
+    # Кол-во выдач соединения, суммарное и максимальное ожидание (секунды)
+    # и кол-во отказов по таймауту
+    waits: int = 0
+    wait_time: float = 0
+    max_wait_time: float = 0
+    timeouts: int = 0
@@ -0,0 +1,208 @@
+import asyncio
+import time
+from typing import Dict, List, Tuple
+
+from loguru import logger
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from main.config import (MEDIA_REAPER_BATCH,
+                         MEDIA_REAPER_RETRIES,
+                         MEDIA_REAPER_RETRY_DELAY,)
+from main.database import async_session_maker
+from main.models.images import Image
+from main.utils.image import lock_media, media_files, remove_media_files
+
+# Файлы, подлежащие удалению после коммита сессии
+_REMOVE_KEY = "file_reaper_remove"
+
+# Путь изображения, sha256 содержимого, номер попытки, время следующей попытки
+ReaperItem = Tuple[str, str | None, int, float]
+
+
+class FileReaper:
+    """
+    Фоновое удаление файлов изображений.
+    Файлы удаляются пачками в отдельном потоке после коммита транзакции,
+    удалившей записи о них. Перед удалением проверяется, что на файл
+    не появились новые ссылки. Неудачные удаления повторяются
+    """
+
+    def __init__(self, batch_size: int, retries: int, retry_delay: float) -> None:
+        self.batch_size = batch_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._pending: List[ReaperItem] = []
+        self._task: asyncio.Task | None = None
+
+    def enqueue(self, files: List[Tuple[str, str | None]]) -> None:
+        """
+        Постановка файлов в очередь на удаление
+        :param files: пути изображений и sha256 их содержимого
+        :return: None
+        """
+        self._pending.extend(
+            (path_media, content_hash, 0, 0.0) for path_media, content_hash in files
+        )
+        self._ensure_started()
+
+    def pending(self) -> int:
+        """
+        Кол-во файлов в очереди
+        """
+        return len(self._pending)
+
+    async def wait(self) -> None:
+        """
+        Ожидание обработки очереди (включая повторные попытки)
+        """
+        while self._task is not None and not self._task.done():
+            await asyncio.wait({self._task})
+
+    async def stop(self) -> None:
+        """
+        Обработка оставшейся очереди при остановке приложения
+        """
+        await self.wait()
+
+    def _ensure_started(self) -> None:
+        """
+        Запуск фоновой обработки в текущем цикле событий
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        # Обработка завершается, когда очередь пуста
+        while self._pending:
+            now = time.monotonic()
+            ready = [item for item in self._pending if item[3] <= now]
+
+            if not ready:
+                await asyncio.sleep(min(item[3] for item in self._pending) - now)
+                continue
+
+            batch = ready[:self.batch_size]
+            batch_ids = set(map(id, batch))
+            self._pending = [
+                item for item in self._pending if id(item) not in batch_ids
+            ]
+
+            failed = await self._reap(batch=batch)
+
+            for path_media, content_hash, attempt, _ in failed:
+                if attempt + 1 >= self.retries:
+                    logger.error(f"Файл {path_media} не удален после "
+                                 f"{self.retries} попыток")
+                    continue
+
+                self._pending.append((path_media,
+                                      content_hash,
+                                      attempt + 1,
+                                      time.monotonic() + self.retry_delay,
+                                      ))
+
+    async def _reap(self, batch: List[ReaperItem]) -> List[ReaperItem]:
+        """
+        Удаление пачки файлов
+        :param batch: файлы
+        :return: файлы, которые не удалось удалить
+        """
+        try:
+            async with async_session_maker() as session:
+                files = await self._unreferenced_files(batch=batch, session=session)
+
+                # Блокировки удерживаются до коммита, пока файлы удаляются
+                failed = set(await asyncio.to_thread(
+                    remove_media_files,
+                    [path for paths in files.values() for path in paths],
+                ))
+                await session.commit()
+
+        except Exception:
+            logger.exception("Ошибка удаления файлов изображений")
+            return batch
+
+        logger.debug(f"Обработано файлов: {len(batch)}")
+
+        return [
+            item for item in batch
+            if failed.intersection(files.get(item[0], ()))
+        ]
+
+    @classmethod
+    async def _unreferenced_files(cls,
+                                  batch: List[ReaperItem],
+                                  session: AsyncSession,
+                                  ) -> Dict[str, List[str]]:
+        """
+        Файлы пачки, на которые не ссылается ни одно изображение.
+        Содержимое файлов блокируется до конца транзакции, чтобы
+        параллельная загрузка не сослалась на удаляемый файл
+        :param batch: файлы
+        :param session: асинхронная сессия
+        :return: путь изображения -> файлы для удаления
+        """
+        paths = {item[0] for item in batch}
+        hashes = {item[1] for item in batch if item[1]}
+
+        # Блокировки в одном порядке, чтобы не ждать друг друга по кругу
+        for key in sorted({item[1] or item[0] for item in batch}):
+            await lock_media(key=key, session=session)
+
+        referenced_paths = set(await session.scalars(
+            select(Image.path_media).where(Image.path_media.in_(paths))
+        ))
+        referenced_hashes = set(await session.scalars(
+            select(Image.content_hash).where(Image.content_hash.in_(hashes))
+        ))
+
+        files = {}
+
+        for path_media, content_hash, _, _ in batch:
+            if path_media in referenced_paths:
+                logger.debug(f"Файл {path_media} используется, не удаляется")
+                continue
+
+            # Уменьшенные копии общие для всех файлов с одним содержимым
+            if content_hash in referenced_hashes:
+                content_hash = None
+
+            files[path_media] = media_files(path_media=path_media,
+                                            content_hash=content_hash,
+                                            )
+
+        return files
+
+
+file_reaper = FileReaper(batch_size=MEDIA_REAPER_BATCH,
+                         retries=MEDIA_REAPER_RETRIES,
+                         retry_delay=MEDIA_REAPER_RETRY_DELAY,
+                         )
+
+
+def schedule_removal(session: AsyncSession,
+                     files: List[Tuple[str, str | None]],
+                     ) -> None:
+    """
+    Удаление файлов изображений после коммита сессии
+    (при откате транзакции файлы остаются)
+    :param session: асинхронная сессия
+    :param files: пути изображений и sha256 их содержимого
+    :return: None
+    """
+    session.info.setdefault(_REMOVE_KEY, []).extend(files)
+
+
+@event.listens_for(Session, "after_commit")
+def _session_committed(session: Session) -> None:
+    files = session.info.pop(_REMOVE_KEY, None)
+
+    if files:
+        file_reaper.enqueue(files=files)
+
+
+@event.listens_for(Session, "after_rollback")
+def _session_rolled_back(session: Session) -> None:
+    session.info.pop(_REMOVE_KEY, None)
@@ -1,11 +1,18 @@
 from http import HTTPStatus
+from typing import List, Set, Tuple
 
 from loguru import logger
+from sqlalchemy import CTE, case, delete, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from main.models.users import User
+from main.config import FOLLOWS_RECONCILE_BATCH
+from main.models.users import User, user_to_user
+from main.schemas import FollowingPrincipal, FollowStatus, Principal
+from main.services.timeline import TimelineService
 from main.services.user import UserService
 from main.utils.exeptions import SpecialException
+from main.utils.profile_cache import schedule_invalidation
 
 
 class FollowerService:
@@ -15,7 +22,10 @@ class FollowerService:
 
     @classmethod
     async def create_follower(
-        cls, current_user: User, following_user_id: int, session: AsyncSession
+        cls,
+        current_user: FollowingPrincipal,
+        following_user_id: int,
+        session: AsyncSession,
     ) -> None:
         """
         Подписка на пользователя по id
@@ -41,7 +51,7 @@ class FollowerService:
 
         # Поиск пользователя для подписки
         following_user = await UserService.get_user_by_id(
-            user_id=following_user_id, session=session
+            user_id=following_user_id, session=session, load_follows=False
         )
 
         if not following_user:
@@ -62,21 +72,46 @@ class FollowerService:
                 detail="The user is already subscribed",
             )
 
-        # Получаем текущего пользователя в текущей сессии
-        # для записи нового подписчика
-        current_user_db = await UserService.get_user_by_id(
-            user_id=current_user.id, session=session
+        # Добавляем подписку напрямую в таблицу связей, без загрузки
+        # текущего пользователя и его подписок.
+        # Параллельный запрос мог успеть оформить ту же подписку
+        query = (
+            insert(user_to_user)
+            .values(followers_id=current_user.id, following_id=following_user.id)
+            .on_conflict_do_nothing()
+            .returning(user_to_user.c.following_id)
         )
 
-        # Добавляем подписку текущему пользователю
-        current_user_db.following.append(following_user)
+        if await session.scalar(query) is None:
+            logger.warning("Подписка уже оформлена")
+
+            raise SpecialException(
+                status_code=HTTPStatus.LOCKED,  # 423
+                detail="The user is already subscribed",
+            )
+
+        await cls.update_counts(follower_id=current_user.id,
+                                following_ids=[following_user.id],
+                                delta=1,
+                                session=session,
+                                )
+
+        # Изменились списки подписок и подписчиков обоих пользователей
+        schedule_invalidation(session, current_user.id, following_user.id)
+
+        if TimelineService.is_enabled():
+            await TimelineService.add_authors(user_id=current_user.id,
+                                              author_ids=[following_user.id],
+                                              session=session,
+                                              )
+
         await session.commit()
 
         logger.info("Подписка оформлена")
 
     @classmethod
     async def check_follower(cls,
-                             current_user: User,
+                             current_user: FollowingPrincipal,
                              following_user_id: int,
                              ) -> bool:
         """
@@ -85,15 +120,15 @@ class FollowerService:
         :param following_user_id: id пользователя для подписки
         :return: True - если пользователь уже подписан | False - если нет
         """
-        # Проверяем, что текущего пользователя нет в числе подписчиков пользователя,
-        # на которого он хочет подписаться
-        return following_user_id in [
-            following.id for following in current_user.following
-        ]
+        # Проверяем, что пользователь есть в подписках текущего пользователя
+        return following_user_id in current_user.following_ids
 
     @classmethod
     async def delete_follower(
-        cls, current_user: User, followed_user_id: int, session: AsyncSession
+        cls,
+        current_user: FollowingPrincipal,
+        followed_user_id: int,
+        session: AsyncSession,
     ) -> None:
         """
         Отписка от пользователя
@@ -119,7 +154,7 @@ class FollowerService:
 
         # Поиск пользователя для отмены подписки
         followed_user = await UserService.get_user_by_id(
-            user_id=followed_user_id, session=session
+            user_id=followed_user_id, session=session, load_follows=False
         )
 
         if not followed_user:
@@ -140,13 +175,321 @@ class FollowerService:
                 detail="The user is not among the subscribers",
             )
 
-        # Получаем текущего пользователя в текущей сессии для удаления подписки
-        current_user_db = await UserService.get_user_by_id(
-            user_id=current_user.id, session=session
+        # Отписка от пользователя: удаление строки из таблицы связей
+        query = (
+            delete(user_to_user)
+            .where(user_to_user.c.followers_id == current_user.id,
+                   user_to_user.c.following_id == followed_user.id,
+                   )
+            .returning(user_to_user.c.following_id)
         )
 
-        # Отписка от пользователя
-        current_user_db.following.remove(followed_user)
+        if await session.scalar(query) is None:
+            logger.warning("Подписка не обнаружена")
+
+            raise SpecialException(
+                status_code=HTTPStatus.LOCKED,  # 423
+                detail="The user is not among the subscribers",
+            )
+
+        await cls.update_counts(follower_id=current_user.id,
+                                following_ids=[followed_user.id],
+                                delta=-1,
+                                session=session,
+                                )
+
+        schedule_invalidation(session, current_user.id, followed_user.id)
+
+        if TimelineService.is_enabled():
+            await TimelineService.remove_authors(user_id=current_user.id,
+                                                 author_ids=[followed_user.id],
+                                                 session=session,
+                                                 )
+
         await session.commit()
 
         logger.info("Пользователь успешно отписался")
+
+    @classmethod
+    async def create_followers(cls,
+                               current_user: Principal,
+                               user_ids: List[int],
+                               session: AsyncSession,
+                               ) -> List[Tuple[int, FollowStatus]]:
+        """
+        Массовая подписка. Проверка существования пользователей и добавление
+        подписок выполняются одним запросом (INSERT ... SELECT ...
+        ON CONFLICT DO NOTHING), кол-во запросов не зависит от кол-ва id
+        :param current_user: текущий пользователь
+        :param user_ids: id пользователей для подписки
+        :param session: асинхронная сессия
+        :return: id и результат для каждого переданного id: followed,
+         already_following, not_found, self
+        """
+        logger.debug(f"Массовая подписка пользователя {current_user.id} "
+                     f"на id: {user_ids}")
+
+        targets = cls._targets(current_user=current_user, user_ids=user_ids)
+        changed = (
+            insert(user_to_user)
+            .from_select(["followers_id", "following_id"],
+                         select(literal(current_user.id), targets.c.id),
+                         )
+            .on_conflict_do_nothing()
+            .returning(user_to_user.c.following_id)
+            .cte("changed")
+        )
+        found, followed = await cls._apply(targets=targets,
+                                           changed=changed,
+                                           session=session,
+                                           )
+
+        if followed:
+            await cls.update_counts(follower_id=current_user.id,
+                                    following_ids=followed,
+                                    delta=1,
+                                    session=session,
+                                    )
+            schedule_invalidation(session, current_user.id, *followed)
+
+            if TimelineService.is_enabled():
+                await TimelineService.add_authors(user_id=current_user.id,
+                                                  author_ids=followed,
+                                                  session=session,
+                                                  )
+
+        await session.commit()
+
+        logger.info(f"Оформлено подписок: {len(followed)}")
+
+        return cls._statuses(current_user=current_user,
+                             user_ids=user_ids,
+                             found=found,
+                             changed=followed,
+                             statuses=("followed", "already_following"),
+                             )
+
+    @classmethod
+    async def delete_followers(cls,
+                               current_user: Principal,
+                               user_ids: List[int],
+                               session: AsyncSession,
+                               ) -> List[Tuple[int, FollowStatus]]:
+        """
+        Массовая отписка одним запросом (DELETE ... RETURNING)
+        :param current_user: текущий пользователь
+        :param user_ids: id пользователей для отписки
+        :param session: асинхронная сессия
+        :return: id и результат для каждого переданного id: unfollowed,
+         not_following, not_found, self
+        """
+        logger.debug(f"Массовая отписка пользователя {current_user.id} "
+                     f"от id: {user_ids}")
+
+        targets = cls._targets(current_user=current_user, user_ids=user_ids)
+        changed = (
+            delete(user_to_user)
+            .where(user_to_user.c.followers_id == current_user.id,
+                   user_to_user.c.following_id.in_(select(targets.c.id)),
+                   )
+            .returning(user_to_user.c.following_id)
+            .cte("changed")
+        )
+        found, unfollowed = await cls._apply(targets=targets,
+                                             changed=changed,
+                                             session=session,
+                                             )
+
+        if unfollowed:
+            await cls.update_counts(follower_id=current_user.id,
+                                    following_ids=unfollowed,
+                                    delta=-1,
+                                    session=session,
+                                    )
+            schedule_invalidation(session, current_user.id, *unfollowed)
+
+            if TimelineService.is_enabled():
+                await TimelineService.remove_authors(user_id=current_user.id,
+                                                     author_ids=unfollowed,
+                                                     session=session,
+                                                     )
+
+        await session.commit()
+
+        logger.info(f"Отменено подписок: {len(unfollowed)}")
+
+        return cls._statuses(current_user=current_user,
+                             user_ids=user_ids,
+                             found=found,
+                             changed=unfollowed,
+                             statuses=("unfollowed", "not_following"),
+                             )
+
+    @classmethod
+    def _targets(cls, current_user: Principal, user_ids: List[int]) -> CTE:
+        """
+        Подзапрос существующих пользователей из переданных id
+        (кроме самого пользователя)
+        """
+        return (
+            select(User.id)
+            .where(User.id.in_(set(user_ids) - {current_user.id}))
+            .cte("targets")
+        )
+
+    @classmethod
+    async def _apply(cls,
+                     targets: CTE,
+                     changed: CTE,
+                     session: AsyncSession,
+                     ) -> Tuple[Set[int], List[int]]:
+        """
+        Выполнение изменения подписок вместе с выборкой найденных
+        пользователей (один запрос)
+        :param targets: подзапрос существующих пользователей
+        :param changed: изменение подписок, возвращающее following_id
+        :param session: асинхронная сессия
+        :return: id найденных пользователей и id измененных подписок
+        """
+        query = select(targets.c.id, changed.c.following_id).outerjoin(
+            changed, changed.c.following_id == targets.c.id
+        )
+        result = await session.execute(query)
+        found, changed_ids = set(), []
+
+        for user_id, following_id in result:
+            found.add(user_id)
+
+            if following_id is not None:
+                changed_ids.append(following_id)
+
+        return found, sorted(changed_ids)
+
+    @classmethod
+    def _statuses(cls,
+                  current_user: Principal,
+                  user_ids: List[int],
+                  found: Set[int],
+                  changed: List[int],
+                  statuses: Tuple[FollowStatus, FollowStatus],
+                  ) -> List[Tuple[int, FollowStatus]]:
+        """
+        Результаты в порядке переданных id
+        :param statuses: результат для измененной и неизмененной подписки
+        """
+        changed_ids = set(changed)
+        result: List[Tuple[int, FollowStatus]] = []
+
+        for user_id in user_ids:
+            status: FollowStatus
+
+            if user_id == current_user.id:
+                status = "self"
+            elif user_id not in found:
+                status = "not_found"
+            elif user_id in changed_ids:
+                status = statuses[0]
+            else:
+                status = statuses[1]
+
+            result.append((user_id, status))
+
+        return result
+
+    @classmethod
+    async def update_counts(cls,
+                            follower_id: int,
+                            following_ids: List[int],
+                            delta: int,
+                            session: AsyncSession,
+                            ) -> None:
+        """
+        Изменение счетчиков подписок подписчика и подписчиков пользователей
+        одним запросом. У подписчика отмечается активность: изменился
+        состав его ленты
+        :param follower_id: id подписчика
+        :param following_ids: id пользователей, подписки на которых
+         оформлены (delta=1) или отменены (delta=-1)
+        :param delta: изменение счетчиков
+        :param session: асинхронная сессия
+        :return: None
+        """
+        if not following_ids:
+            return
+
+        query = (
+            update(User)
+            .where(User.id.in_([follower_id, *following_ids]))
+            .values(
+                following_count=User.following_count + case(
+                    (User.id == follower_id, delta * len(following_ids)),
+                    else_=0,
+                ),
+                followers_count=User.followers_count + case(
+                    (User.id.in_(following_ids), delta),
+                    else_=0,
+                ),
+                last_activity_at=case(
+                    (User.id == follower_id, func.now()),
+                    else_=User.last_activity_at,
+                ),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await session.execute(query)
+
+    @classmethod
+    async def reconcile_counts(cls, session: AsyncSession) -> int:
+        """
+        Сверка счетчиков подписок и подписчиков с таблицей подписок пачками
+        по id пользователей, каждая пачка коммитится отдельно
+        :param session: асинхронная сессия
+        :return: кол-во исправленных пользователей
+        """
+        logger.debug("Сверка счетчиков подписок")
+
+        fixed = 0
+        last_user_id = 0
+
+        followers_count = (
+            select(func.count())
+            .where(user_to_user.c.following_id == User.id)
+            .scalar_subquery()
+        )
+        following_count = (
+            select(func.count())
+            .where(user_to_user.c.followers_id == User.id)
+            .scalar_subquery()
+        )
+
+        while True:
+            users = await session.scalars(
+                select(User.id)
+                .where(User.id > last_user_id)
+                .order_by(User.id)
+                .limit(FOLLOWS_RECONCILE_BATCH)
+            )
+            user_ids = list(users)
+
+            if not user_ids:
+                break
+
+            result = await session.execute(
+                update(User)
+                .where(User.id.between(user_ids[0], user_ids[-1]),
+                       (User.followers_count != followers_count)
+                       | (User.following_count != following_count),
+                       )
+                .values(followers_count=followers_count,
+                        following_count=following_count,
+                        )
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+
+            fixed += result.rowcount
+            last_user_id = user_ids[-1]
+
+        logger.info(f"Сверка счетчиков подписок завершена, исправлено: {fixed}")
+
+        return fixed
@@ -1,13 +1,26 @@
+import asyncio
+import datetime
 from itertools import chain
-from typing import List
+from typing import Any, Dict, List, Tuple
 
 from fastapi import UploadFile
 from loguru import logger
-from sqlalchemy import select, update
+from sqlalchemy import delete, func, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from main.config import (MEDIA_GC_BATCH,
+                         MEDIA_ORPHAN_GRACE,
+                         MEDIA_VARIANTS_ENABLED,)
+from main.models.image_variants import ImageVariant
 from main.models.images import Image
-from main.utils.image import delete_images, save_image_util
+from main.services.file_reaper import file_reaper, schedule_removal
+from main.services.image_variants import image_variants
+from main.utils.image import (discard_temp_image,
+                              image_filename,
+                              image_path,
+                              lock_media,
+                              place_image,
+                              save_image_util,)
 
 
 class ImageService:
@@ -24,35 +37,131 @@ class ImageService:
         :return: id изображения
         """
         logger.debug("Сохранение изображения")
+        image_name = image_filename(file=image)
 
-        path = await save_image_util(
-            file=image
-        )  # Сохранение изображения в файловой системе
-        image_obj = Image(path_media=path)  # Создание экземпляра изображения
+        # Сохранение изображения во временный файл
+        temp_path, content_hash, size = await save_image_util(file=image)
+        path = image_path(content_hash=content_hash, image_name=image_name)
+
+        try:
+            # Блокировка до коммита: файл не будет удален, пока
+            # не появится запись о новой ссылке на него
+            await lock_media(key=content_hash, session=session)
+            await place_image(temp_path=temp_path, path_media=path)
+        except BaseException:
+            await discard_temp_image(temp_path=temp_path)
+
+            raise
+
+        image_obj = Image(path_media=path,
+                          content_hash=content_hash,
+                          size=size,
+                          )  # Создание экземпляра изображения
         session.add(image_obj)  # Добавление изображения в БД
         await session.commit()  # Сохранение в БД
 
+        if MEDIA_VARIANTS_ENABLED:
+            # Уменьшенные копии создаются в фоне, ответ их не ждет
+            image_variants.submit(image=image_obj)
+
         return image_obj.id
 
+    @classmethod
+    async def save_images(cls,
+                          images: List[UploadFile],
+                          session: AsyncSession,
+                          ) -> List[int]:
+        """
+        Сохранение нескольких изображений (без привязки к твиту).
+        Файлы копируются одновременно, записи обо всех изображениях
+        добавляются одним запросом в одной транзакции. Если сохранить
+        удалось не все, уже перенесенные файлы передаются на удаление
+        (удаляются, если на них не ссылаются другие изображения)
+        :param images: файлы
+        :param session: асинхронная сессия
+        :return: id изображений в порядке файлов
+        """
+        logger.debug(f"Сохранение изображений: {len(images)}")
+        image_names = [image_filename(file=image) for image in images]
+
+        # Сохранение изображений во временные файлы
+        results = await asyncio.gather(
+            *(save_image_util(file=image) for image in images),
+            return_exceptions=True,
+        )
+        saved = [result for result in results if not isinstance(result, BaseException)]
+        temp_paths = [temp_path for temp_path, _, _ in saved]
+        placed: List[Tuple[str, str | None]] = []
+
+        try:
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+
+            rows: List[Dict[str, Any]] = [
+                {
+                    "path_media": image_path(content_hash=content_hash,
+                                             image_name=image_name,
+                                             ),
+                    "content_hash": content_hash,
+                    "size": size,
+                }
+                for image_name, (_, content_hash, size) in zip(image_names, saved)
+            ]
+
+            # Блокировки в одном порядке, чтобы параллельные загрузки
+            # не ждали друг друга по кругу
+            for content_hash in sorted({row["content_hash"] for row in rows}):
+                await lock_media(key=content_hash, session=session)
+
+            for temp_path, row in zip(temp_paths, rows):
+                await place_image(temp_path=temp_path, path_media=row["path_media"])
+                placed.append((row["path_media"], row["content_hash"]))
+
+            query = insert(Image).returning(Image, sort_by_parameter_order=True)
+            image_objs = list(await session.scalars(query, rows))
+            await session.commit()
+
+        except BaseException:
+            for temp_path in temp_paths:
+                await discard_temp_image(temp_path=temp_path)
+
+            if placed:
+                # Удаление ждет снятия блокировок этой транзакции
+                file_reaper.enqueue(files=placed)
+
+            raise
+
+        if MEDIA_VARIANTS_ENABLED:
+            for image_obj in image_objs:
+                image_variants.submit(image=image_obj)
+
+        return [image_obj.id for image_obj in image_objs]
+
     @classmethod
     async def update_images(
         cls, tweet_media_ids: List[int], tweet_id: int, session: AsyncSession
-    ) -> None:
+    ) -> List[str]:
         """
         Обновление изображений (привязка к твиту)
         :param tweet_media_ids: список с id изображений
         :param tweet_id: id твита для привязки изображений
         :param session: асинхронная сессия
-        :return: None
+        :return: пути привязанных изображений в порядке id
         """
         logger.debug(
             f"Обновление изображения: {tweet_media_ids}, tweet_id: {tweet_id}"
         )
 
         query = (
-            update(Image).where(Image.id.in_(tweet_media_ids)).values(tweet_id=tweet_id)
+            update(Image)
+            .where(Image.id.in_(tweet_media_ids))
+            .values(tweet_id=tweet_id)
+            .returning(Image.id, Image.path_media)
         )
-        await session.execute(query)
+        result = await session.execute(query)
+
+        return [path_media for _, path_media in sorted(result.all())]
 
     @classmethod
     async def get_images(cls,
@@ -73,6 +182,29 @@ class ImageService:
         # Очищаем результат от вложенных кортежей
         return list(chain(*images.all()))
 
+    @classmethod
+    async def get_variant_paths(cls,
+                                image_ids: List[int],
+                                name: str,
+                                session: AsyncSession,
+                                ) -> Dict[int, str]:
+        """
+        Пути уменьшенных копий изображений
+        :param image_ids: id изображений
+        :param name: название варианта
+        :param session: асинхронная сессия
+        :return: id изображения -> путь копии (изображения без копии пропущены)
+        """
+        if not image_ids:
+            return {}
+
+        query = select(ImageVariant.image_id, ImageVariant.path_media).where(
+            ImageVariant.image_id.in_(image_ids), ImageVariant.name == name
+        )
+        result = await session.execute(query)
+
+        return dict(result.tuples().all())
+
     @classmethod
     async def delete_images(cls, tweet_id: int, session: AsyncSession) -> None:
         """
@@ -85,8 +217,90 @@ class ImageService:
 
         images = await cls.get_images(tweet_id=tweet_id, session=session)
 
-        if images:
-            # Удаляем изображения из файловой системы
-            await delete_images(images=images)
-        else:
+        if not images:
             logger.warning("Изображения не найдены")
+            return
+
+        # Файлы удаляются в фоне после коммита, если на них больше
+        # не ссылается ни одно изображение
+        schedule_removal(
+            session=session,
+            files=[(img.path_media, img.content_hash) for img in images],
+        )
+
+    @classmethod
+    async def collect_orphans(cls, session: AsyncSession) -> Tuple[int, int]:
+        """
+        Удаление изображений, не привязанных к твиту дольше
+        MEDIA_ORPHAN_GRACE секунд. Изображения удаляются пачками,
+        каждая пачка коммитится отдельно, файлы удаляются в фоне после коммита
+        :param session: асинхронная сессия
+        :return: кол-во удаленных изображений и освобождаемый объем в байтах
+        """
+        logger.debug("Сборка брошенных изображений")
+
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(
+            seconds=MEDIA_ORPHAN_GRACE
+        )
+        collected = 0
+        reclaimed = 0
+
+        while True:
+            # Строки, заблокированные другим сборщиком, пропускаются
+            orphans = await session.scalars(
+                select(Image.id)
+                .where(Image.tweet_id.is_(None), Image.created_at < cutoff)
+                .order_by(Image.id)
+                .limit(MEDIA_GC_BATCH)
+                .with_for_update(skip_locked=True)
+            )
+            image_ids = list(orphans)
+
+            if not image_ids:
+                break
+
+            # Уменьшенные копии удаляются вместе с изображениями (каскадно)
+            variants = await session.execute(
+                select(ImageVariant.image_id, func.sum(ImageVariant.size))
+                .where(ImageVariant.image_id.in_(image_ids))
+                .group_by(ImageVariant.image_id)
+            )
+            variants_size: Dict[int, int] = dict(variants.tuples().all())
+
+            result = await session.execute(
+                delete(Image)
+                .where(Image.id.in_(image_ids))
+                .returning(Image.id, Image.path_media, Image.content_hash, Image.size)
+                .execution_options(synchronize_session=False)
+            )
+            images = result.all()
+
+            # Файлы, на которые ссылаются другие изображения, остаются
+            hashes = {img.content_hash for img in images if img.content_hash}
+            referenced = set(await session.scalars(
+                select(Image.content_hash).where(Image.content_hash.in_(hashes))
+            ))
+            freed: Dict[str, int] = {}
+
+            for img in images:
+                if img.content_hash and img.content_hash not in referenced:
+                    freed[img.content_hash] = max(
+                        freed.get(img.content_hash, 0),
+                        (img.size or 0) + (variants_size.get(img.id) or 0),
+                    )
+
+            schedule_removal(
+                session=session,
+                files=[(img.path_media, img.content_hash) for img in images],
+            )
+            await session.commit()
+
+            collected += len(images)
+            reclaimed += sum(freed.values())
+
+            logger.debug(f"Удалено брошенных изображений: {collected}")
+
+        logger.info(f"Сборка брошенных изображений завершена, удалено: "
+                    f"{collected}, освобождается байт: {reclaimed}")
+
+        return collected, reclaimed
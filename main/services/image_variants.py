@@ -0,0 +1,134 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Set
+
+from loguru import logger
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+
+from main.config import (MEDIA_FOLDER,
+                         MEDIA_VARIANT_QUALITY,
+                         MEDIA_VARIANTS,
+                         MEDIA_WORKERS,)
+from main.database import async_session_maker
+from main.models.image_variants import ImageVariant
+from main.models.images import Image
+from main.services.file_reaper import file_reaper
+from main.utils.image_variants import make_variants
+
+
+class ImageVariantsPipeline:
+    """
+    Фоновое создание уменьшенных копий загруженных изображений.
+    Декодирование и кодирование выполняются в пуле процессов, чтобы
+    не занимать цикл событий и не упираться в GIL
+    """
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        self._pool: ProcessPoolExecutor | None = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def submit(self, image: Image) -> None:
+        """
+        Постановка изображения в очередь обработки. Копии называются
+        по хэшу содержимого, изображения без хэша не обрабатываются
+        :param image: сохраненное изображение
+        :return: None
+        """
+        content_hash = image.content_hash
+
+        if content_hash is None:
+            logger.warning(f"У изображения №{image.id} нет хэша содержимого")
+            return
+
+        task = asyncio.get_running_loop().create_task(
+            self._process(image_id=image.id,
+                          path_media=image.path_media,
+                          content_hash=content_hash,
+                          )
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def wait(self) -> None:
+        """
+        Ожидание обработки поставленных в очередь изображений
+        """
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def stop(self) -> None:
+        """
+        Завершение обработки и остановка пула процессов
+        """
+        await self.wait()
+
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """
+        Пул процессов создается при первом изображении
+        """
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                # Процессы не наследуют соединения с БД и цикл событий
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+        return self._pool
+
+    async def _process(self,
+                       image_id: int,
+                       path_media: str,
+                       content_hash: str,
+                       ) -> None:
+        logger.debug(f"Создание уменьшенных копий изображения №{image_id}")
+
+        try:
+            variants = await asyncio.get_running_loop().run_in_executor(
+                self._get_pool(),
+                make_variants,
+                MEDIA_FOLDER,
+                path_media,
+                content_hash,
+                MEDIA_VARIANTS,
+                MEDIA_VARIANT_QUALITY,
+            )
+        except Exception:
+            # Изображение остается доступным в исходном виде
+            logger.exception(f"Ошибка обработки изображения №{image_id}")
+            return
+
+        query = insert(ImageVariant).values([
+            {
+                "image_id": image_id,
+                "name": name,
+                "path_media": path,
+                "width": width,
+                "height": height,
+                "size": size,
+            }
+            for name, path, width, height, size in variants
+        ]).on_conflict_do_nothing(index_elements=["image_id", "name"])
+
+        try:
+            async with async_session_maker() as session:
+                await session.execute(query)
+                await session.commit()
+        except IntegrityError:
+            logger.warning(f"Изображение №{image_id} удалено до окончания обработки")
+
+            # Копии уже записаны: удаляются, если на содержимое
+            # не ссылаются другие изображения
+            file_reaper.enqueue(files=[(path_media, content_hash)])
+            return
+
+        logger.debug(f"Уменьшенные копии изображения №{image_id} сохранены")
+
+
+image_variants = ImageVariantsPipeline(workers=MEDIA_WORKERS)
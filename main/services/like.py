@@ -1,11 +1,20 @@
 from http import HTTPStatus
+from typing import Any, List, NoReturn, Tuple
 
 from loguru import logger
-from sqlalchemy import select
+from sqlalchemy import (ColumnElement, Integer, column, delete, func, literal,
+                        select, update, values,)
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
+from main.config import LIKES_RECONCILE_BATCH, LIKES_WRITE_BEHIND
 from main.models.likes import Like
+from main.models.tweets import Tweet
+from main.models.users import User
+from main.services.like_counter import like_counter
 from main.services.tweet import TweetsService
+from main.utils.cursor import decode_cursor, encode_cursor, keyset_page
 from main.utils.exeptions import SpecialException
 
 
@@ -21,7 +30,10 @@ class LikeService:
                    session: AsyncSession,
                    ) -> None:
         """
-        Лайк твита
+        Лайк твита. Запись о лайке и увеличение счетчика выполняются одним
+        запросом: INSERT ... ON CONFLICT DO NOTHING в CTE и UPDATE счетчика
+        в БД, поэтому одновременные лайки не теряются и не дублируются.
+        В режиме LIKES_WRITE_BEHIND счетчик обновляется отложенно пачкой
         :param tweet_id: id твита для лайка
         :param user_id: id пользователя
         :param session: объект асинхронной сессии
@@ -29,35 +41,42 @@ class LikeService:
         """
         logger.debug(f"Лайк твита №{tweet_id}")
 
-        # Поиск твита по id
-        tweet = await TweetsService.get_tweet(tweet_id=tweet_id,
-                                              session=session,
-                                              )
-
-        if not tweet:
-            logger.error("Твит не найден")
-
-            raise SpecialException(
-                status_code=HTTPStatus.NOT_FOUND,
-                detail="Tweet not found",  # 404
+        insert_query = (
+            insert(Like)
+            .from_select(
+                ["user_id", "tweets_id"],
+                select(literal(user_id), Tweet.id).where(Tweet.id == tweet_id),
             )
+            .on_conflict_do_nothing(index_elements=["user_id", "tweets_id"])
+            .returning(Like.tweets_id)
+        )
 
-        if await cls.check_like_tweet(
-            tweet_id=tweet_id, user_id=user_id, session=session
-        ):
-            logger.warning("Пользователь уже ставил лайк твиту")
+        if LIKES_WRITE_BEHIND:
+            result = await session.execute(insert_query)
+        else:
+            inserted_like = insert_query.cte("inserted_like")
+            update_query = (
+                update(Tweet)
+                .where(Tweet.id.in_(select(inserted_like.c.tweets_id)))
+                .values(likes_count=Tweet.likes_count + 1)
+                .returning(Tweet.id)
+                .execution_options(synchronize_session=False)
+            )
+            result = await session.execute(update_query)
 
-            raise SpecialException(
-                status_code=HTTPStatus.LOCKED,  # 423
+        if result.scalar_one_or_none() is None:
+            await session.rollback()
+            await cls._raise_like_error(
+                tweet_id=tweet_id,
+                session=session,
                 detail="The user has already liked this tweet",
             )
-        tweet.likes_count += 1
 
-        like_record = Like(user_id=user_id, tweets_id=tweet.id)
-
-        session.add(like_record)
         await session.commit()
 
+        if LIKES_WRITE_BEHIND:
+            like_counter.add(tweet_id=tweet_id, delta=1)
+
     @classmethod
     async def check_like_tweet(
         cls, tweet_id: int, user_id: int, session: AsyncSession
@@ -84,7 +103,8 @@ class LikeService:
                       session: AsyncSession,
                       ) -> None:
         """
-        Удаление лайка
+        Удаление лайка. Удаление записи и уменьшение счетчика выполняются
+        одним запросом (в режиме LIKES_WRITE_BEHIND счетчик - отложенно)
         :param tweet_id: id твита
         :param user_id: id пользователя
         :param session: асинхронная сессия
@@ -92,7 +112,128 @@ class LikeService:
         """
         logger.debug(f"Убран лайк с твита №{tweet_id}")
 
-        # Поиск твита по id
+        delete_query = (
+            delete(Like)
+            .where(Like.user_id == user_id, Like.tweets_id == tweet_id)
+            .returning(Like.tweets_id)
+            .execution_options(synchronize_session=False)
+        )
+
+        if LIKES_WRITE_BEHIND:
+            result = await session.execute(delete_query)
+        else:
+            deleted_like = delete_query.cte("deleted_like")
+            update_query = (
+                update(Tweet)
+                .where(Tweet.id.in_(select(deleted_like.c.tweets_id)))
+                .values(likes_count=func.greatest(Tweet.likes_count - 1, 0))
+                .returning(Tweet.id)
+                .execution_options(synchronize_session=False)
+            )
+            result = await session.execute(update_query)
+
+        if result.scalar_one_or_none() is None:
+            await session.rollback()
+            await cls._raise_like_error(
+                tweet_id=tweet_id,
+                session=session,
+                detail="The user has not yet liked this tweet",
+            )
+
+        await session.commit()
+
+        if LIKES_WRITE_BEHIND:
+            like_counter.add(tweet_id=tweet_id, delta=-1)
+
+    @classmethod
+    async def reconcile_counts(cls, session: AsyncSession) -> int:
+        """
+        Сверка счетчиков лайков с таблицей лайков: likes_count
+        пересчитывается по записям о лайках пачками по id твитов,
+        каждая пачка коммитится отдельно.
+        Лайки, изменения счетчиков которых еще в буфере процесса
+        (LIKES_WRITE_BEHIND), уже есть в таблице лайков: буфер записывается
+        перед сверкой, а изменения, накопленные за время сверки, вычитаются
+        из пересчитанных значений, чтобы не учесть их дважды.
+        Буферы других процессов не видны: при запуске команды отдельно от
+        приложения изменения, накопленные воркерами за последние
+        LIKES_FLUSH_INTERVAL секунд, учитываются дважды, поэтому в режиме
+        LIKES_WRITE_BEHIND сверку выполняют при остановленных воркерах
+        :param session: асинхронная сессия
+        :return: кол-во исправленных твитов
+        """
+        logger.debug("Сверка счетчиков лайков")
+
+        await like_counter.flush()
+
+        fixed = 0
+        last_tweet_id = 0
+
+        while True:
+            tweets = await session.scalars(
+                select(Tweet.id)
+                .where(Tweet.id > last_tweet_id)
+                .order_by(Tweet.id)
+                .limit(LIKES_RECONCILE_BATCH)
+            )
+            tweet_ids = list(tweets)
+
+            if not tweet_ids:
+                break
+
+            likes_count: ColumnElement[Any] = (
+                select(func.count(Like.id))
+                .where(Like.tweets_id == Tweet.id)
+                .scalar_subquery()
+            )
+            pending = sorted(
+                (tweet_id, delta)
+                for tweet_id, delta in like_counter.pending().items()
+                if tweet_ids[0] <= tweet_id <= tweet_ids[-1]
+            )
+
+            if pending:
+                changes = values(column("id", Integer),
+                                 column("delta", Integer),
+                                 name="changes",
+                                 ).data(pending)
+                likes_count = likes_count - func.coalesce(
+                    select(changes.c.delta)
+                    .where(changes.c.id == Tweet.id)
+                    .scalar_subquery(),
+                    0,
+                )
+
+            result = await session.execute(
+                update(Tweet)
+                .where(Tweet.id.between(tweet_ids[0], tweet_ids[-1]),
+                       Tweet.likes_count != likes_count,
+                       )
+                .values(likes_count=likes_count)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+
+            fixed += result.rowcount
+            last_tweet_id = tweet_ids[-1]
+
+        logger.info(f"Сверка счетчиков лайков завершена, исправлено: {fixed}")
+
+        return fixed
+
+    @classmethod
+    async def _raise_like_error(cls,
+                                tweet_id: int,
+                                session: AsyncSession,
+                                detail: str,
+                                ) -> NoReturn:
+        """
+        Вывод ошибки, когда лайк не был добавлен или удален:
+        твит не найден (404) или состояние лайка уже такое (423)
+        :param tweet_id: id твита
+        :param session: асинхронная сессия
+        :param detail: текст ошибки, если твит найден
+        """
         tweet = await TweetsService.get_tweet(tweet_id=tweet_id,
                                               session=session,
                                               )
@@ -105,21 +246,71 @@ class LikeService:
                 detail="Tweet not found",  # 404
             )
 
-        # Ищем запись о лайке
-        like_record = await cls.check_like_tweet(
-            tweet_id=tweet_id, user_id=user_id, session=session
+        logger.warning(detail)
+
+        raise SpecialException(
+            status_code=HTTPStatus.LOCKED,  # 423
+            detail=detail,
         )
 
-        if like_record is None:
-            logger.warning("Запись о лайке не найдена")
+    @classmethod
+    async def get_likes(cls,
+                        tweet_id: int,
+                        session: AsyncSession,
+                        limit: int,
+                        cursor: str | None = None,
+                        ) -> Tuple[List[Like], str | None]:
+        """
+        Постраничный вывод лайков твита (новые первыми)
+        :param tweet_id: id твита
+        :param session: асинхронная сессия
+        :param limit: размер страницы
+        :param cursor: курсор, полученный вместе с предыдущей страницей
+        :return: список лайков и курсор следующей страницы (None - страниц нет)
+        """
+        logger.debug(f"Вывод лайков твита №{tweet_id}, курсор: {cursor}")
+
+        tweet = await TweetsService.get_tweet(tweet_id=tweet_id,
+                                              session=session,
+                                              )
+
+        if not tweet:
+            logger.error("Твит не найден")
 
             raise SpecialException(
-                status_code=HTTPStatus.LOCKED,  # 423
-                detail="The user has not yet liked this tweet",
+                status_code=HTTPStatus.NOT_FOUND,
+                detail="Tweet not found",  # 404
             )
-        tweet.likes_count -= 1
-        if tweet.likes_count < 0:
-            tweet.likes_count = 0
-        await session.delete(like_record)
 
-        await session.commit()
+        after = None
+
+        if cursor:
+            (like_id,) = decode_cursor(cursor=cursor, size=1)
+
+            if not isinstance(like_id, int):
+                raise SpecialException(
+                    status_code=HTTPStatus.UNPROCESSABLE_ENTITY,  # 422
+                    detail="Invalid cursor",
+                )
+
+            after = [like_id]
+
+        # Запрашиваем на одну запись больше, чтобы узнать, есть ли еще страница
+        query = keyset_page(
+            query=select(Like)
+            .where(Like.tweets_id == tweet_id)
+            .options(selectinload(Like.user).lazyload(User.following)),
+            columns=[Like.id],
+            after=after,
+            limit=limit + 1,
+        )
+        result = await session.scalars(query)
+        likes = list(result)
+
+        next_cursor = None
+
+        if len(likes) > limit:
+            likes = likes[:limit]
+            next_cursor = encode_cursor([likes[-1].id])
+
+        return likes, next_cursor
@@ -0,0 +1,125 @@
+import asyncio
+from collections import defaultdict
+from typing import Dict
+
+from loguru import logger
+from sqlalchemy import Integer, column, func, update, values
+
+from main.config import LIKES_FLUSH_INTERVAL
+from main.database import async_session_maker
+from main.models.tweets import Tweet
+
+
+class LikeCounterBuffer:
+    """
+    Буфер изменений счетчиков лайков (write-behind).
+    Изменения копятся в памяти по id твита и периодически записываются
+    одним запросом, поэтому лайки популярного твита не выстраиваются
+    в очередь на блокировку его строки
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._deltas: Dict[int, int] = defaultdict(int)
+        self._task: asyncio.Task | None = None
+        self._stopping = asyncio.Event()
+
+    def add(self, tweet_id: int, delta: int) -> None:
+        """
+        Учет изменения счетчика лайков твита
+        :param tweet_id: id твита
+        :param delta: изменение (+1 - лайк, -1 - удаление лайка)
+        :return: None
+        """
+        self._deltas[tweet_id] += delta
+        self._ensure_started()
+
+    def pending(self) -> Dict[int, int]:
+        """
+        Еще не записанные изменения
+        """
+        return {
+            tweet_id: delta for tweet_id, delta in self._deltas.items() if delta
+        }
+
+    async def flush(self) -> int:
+        """
+        Запись накопленных изменений в БД одним запросом
+        :return: кол-во обновленных твитов
+        """
+        deltas = self.pending()
+        self._deltas = defaultdict(int)
+
+        if not deltas:
+            return 0
+
+        # Сортировка по id - одинаковый порядок блокировок строк
+        # в разных воркерах
+        rows = sorted(deltas.items())
+        changes = values(column("id", Integer),
+                         column("delta", Integer),
+                         name="changes",
+                         ).data(rows)
+        query = (
+            update(Tweet)
+            .where(Tweet.id == changes.c.id)
+            .values(likes_count=func.greatest(Tweet.likes_count + changes.c.delta,
+                                              0,
+                                              ))
+            .execution_options(synchronize_session=False)
+        )
+
+        try:
+            async with async_session_maker() as session:
+                await session.execute(query)
+                await session.commit()
+        except BaseException:
+            # В том числе при отмене задачи (CancelledError)
+            logger.exception("Ошибка записи счетчиков лайков")
+
+            # Возвращаем изменения в буфер до следующей попытки
+            for tweet_id, delta in rows:
+                self._deltas[tweet_id] += delta
+
+            raise
+
+        logger.debug(f"Записаны счетчики лайков {len(rows)} твитов")
+
+        return len(rows)
+
+    async def stop(self) -> None:
+        """
+        Остановка фоновой записи с записью оставшихся изменений.
+        Задача не отменяется, а завершает текущую запись, поэтому запись,
+        начатая до остановки, не прерывается на середине
+        """
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+
+        await self.flush()
+
+    def _ensure_started(self) -> None:
+        """
+        Запуск фоновой записи в текущем цикле событий при первом изменении
+        """
+        if self._task is None or self._task.done():
+            self._stopping.clear()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                await self.flush()
+            except Exception:
+                # Изменения остались в буфере, повторим на следующем шаге
+                pass
+
+
+like_counter = LikeCounterBuffer(interval=LIKES_FLUSH_INTERVAL)
@@ -0,0 +1,47 @@
+import asyncio
+
+from loguru import logger
+
+from main.config import MEDIA_GC_INTERVAL
+from main.database import async_session_maker
+from main.services.image import ImageService
+
+
+class MediaCollector:
+    """
+    Периодическая сборка брошенных изображений в приложении.
+    Несколько воркеров могут собирать одновременно: заблокированные
+    другим сборщиком изображения пропускаются
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """
+        Запуск периодической сборки (интервал 0 - сборка отключена)
+        """
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Остановка периодической сборки
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+
+            try:
+                async with async_session_maker() as session:
+                    await ImageService.collect_orphans(session=session)
+            except Exception:
+                logger.exception("Ошибка сборки брошенных изображений")
+
+
+media_collector = MediaCollector(interval=MEDIA_GC_INTERVAL)
@@ -0,0 +1,246 @@
+from typing import Any, List
+
+from loguru import logger
+from sqlalchemy import (CompoundSelect, Select, delete, func, literal, select,
+                        union, update,)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from main.config import (FEED_FANOUT_BACKFILL_BATCH,
+                         FEED_FANOUT_ENABLED,
+                         FEED_FANOUT_MAX_FOLLOWERS,)
+from main.models.timelines import TimelineEntry
+from main.models.tweets import Tweet
+from main.models.users import User, user_to_user
+from main.utils.cursor import keyset_page
+
+
+class TimelineService:
+    """
+    Класс для ведения материализованных лент пользователей (fan-out-on-write)
+    """
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        """
+        Включен ли режим fan-out-on-write
+        """
+        return FEED_FANOUT_ENABLED
+
+    @classmethod
+    async def is_fanout_author(cls,
+                               author_id: int,
+                               session: AsyncSession,
+                               ) -> bool:
+        """
+        Проверка, что твиты автора раскладываются по лентам подписчиков.
+        Подписчики считаются не дальше порога, поэтому проверка не зависит
+        от их общего кол-ва
+        :param author_id: id автора
+        :param session: асинхронная сессия
+        :return: True - fan-out-on-write | False - fan-out-on-read
+        """
+        followers = (
+            select(user_to_user.c.followers_id)
+            .where(user_to_user.c.following_id == author_id)
+            .limit(FEED_FANOUT_MAX_FOLLOWERS + 1)
+            .subquery()
+        )
+        result = await session.execute(select(func.count()).select_from(followers))
+        count = result.scalar_one()
+
+        return count <= FEED_FANOUT_MAX_FOLLOWERS
+
+    @classmethod
+    async def fan_out(cls, tweet: Tweet, session: AsyncSession) -> None:
+        """
+        Добавление нового твита в ленты подписчиков автора
+        :param tweet: новый твит (уже записанный в сессию)
+        :param session: асинхронная сессия
+        :return: None
+        """
+        if not await cls.is_fanout_author(author_id=tweet.user_id,
+                                          session=session,
+                                          ):
+            logger.debug(f"Твит №{tweet.id} будет подмешиваться при чтении")
+            return
+
+        logger.debug(f"Раскладка твита №{tweet.id} по лентам подписчиков")
+
+        query = insert(TimelineEntry).from_select(
+            ["user_id", "tweet_id", "created_at"],
+            select(user_to_user.c.followers_id,
+                   literal(tweet.id),
+                   literal(tweet.created_at),
+                   ).where(user_to_user.c.following_id == tweet.user_id),
+        ).on_conflict_do_nothing()
+        await session.execute(query)
+
+        tweet.fanned_out = True
+
+    @classmethod
+    async def retract(cls, tweet_id: int, session: AsyncSession) -> None:
+        """
+        Удаление твита из лент подписчиков
+        :param tweet_id: id твита
+        :param session: асинхронная сессия
+        :return: None
+        """
+        logger.debug(f"Удаление твита №{tweet_id} из лент подписчиков")
+
+        query = delete(TimelineEntry).where(TimelineEntry.tweet_id == tweet_id)
+        await session.execute(query)
+
+    @classmethod
+    async def add_authors(cls,
+                          user_id: int,
+                          author_ids: List[int],
+                          session: AsyncSession,
+                          ) -> None:
+        """
+        Добавление в ленту пользователя разложенных твитов новых авторов
+        (при оформлении подписки) одним запросом
+        :param user_id: id подписчика
+        :param author_ids: id авторов
+        :param session: асинхронная сессия
+        :return: None
+        """
+        logger.debug(f"Добавление твитов авторов {author_ids} в ленту {user_id}")
+
+        query = insert(TimelineEntry).from_select(
+            ["user_id", "tweet_id", "created_at"],
+            select(literal(user_id), Tweet.id, Tweet.created_at).where(
+                Tweet.user_id.in_(author_ids), Tweet.fanned_out.is_(True)
+            ),
+        ).on_conflict_do_nothing()
+        await session.execute(query)
+
+    @classmethod
+    async def remove_authors(cls,
+                             user_id: int,
+                             author_ids: List[int],
+                             session: AsyncSession,
+                             ) -> None:
+        """
+        Удаление из ленты пользователя твитов авторов (при отписке)
+        одним запросом
+        :param user_id: id подписчика
+        :param author_ids: id авторов
+        :param session: асинхронная сессия
+        :return: None
+        """
+        logger.debug(f"Удаление твитов авторов {author_ids} из ленты {user_id}")
+
+        query = delete(TimelineEntry).where(
+            TimelineEntry.user_id == user_id,
+            TimelineEntry.tweet_id.in_(
+                select(Tweet.id).where(Tweet.user_id.in_(author_ids))
+            ),
+        )
+        await session.execute(query)
+
+    @classmethod
+    def page_keys_query(cls,
+                        user_id: int,
+                        following_ids: Select,
+                        after: List[Any] | None,
+                        limit: int,
+                        since: List[Any] | None = None,
+                        ) -> CompoundSelect:
+        """
+        Запрос ключей (id, created_at) страницы ленты: материализованная часть
+        ленты объединяется с твитами, которые подмешиваются при чтении.
+        Каждая часть ограничивается страницей отдельно
+        :param user_id: id владельца ленты
+        :param following_ids: подзапрос id пользователей, на которых он подписан
+        :param after: ключ последнего твита предыдущей страницы
+        :param limit: размер страницы
+        :param since: ключ, новее которого выводятся твиты (None - все)
+        :return: запрос, возвращающий колонки id и created_at
+        """
+        materialized = keyset_page(
+            query=select(TimelineEntry.tweet_id.label("id"),
+                         TimelineEntry.created_at,
+                         ).where(TimelineEntry.user_id == user_id),
+            columns=[TimelineEntry.created_at, TimelineEntry.tweet_id],
+            after=after,
+            limit=limit,
+            since=since,
+        )
+        on_read = keyset_page(
+            query=select(Tweet.id, Tweet.created_at).where(
+                Tweet.user_id.in_(following_ids), Tweet.fanned_out.is_(False)
+            ),
+            columns=[Tweet.created_at, Tweet.id],
+            after=after,
+            limit=limit,
+            since=since,
+        )
+
+        return union(materialized, on_read)
+
+    @classmethod
+    async def backfill(cls, session: AsyncSession) -> int:
+        """
+        Заполнение лент по существующим подпискам (таблица user_to_user).
+        Авторы обрабатываются пачками, каждая пачка коммитится отдельно
+        :param session: асинхронная сессия
+        :return: кол-во добавленных записей лент
+        """
+        logger.debug("Заполнение материализованных лент")
+
+        inserted = 0
+        last_author_id = 0
+
+        while True:
+            authors = await session.scalars(
+                select(User.id)
+                .where(User.id > last_author_id)
+                .order_by(User.id)
+                .limit(FEED_FANOUT_BACKFILL_BATCH)
+            )
+            author_ids = list(authors)
+
+            if not author_ids:
+                break
+
+            last_author_id = author_ids[-1]
+
+            # Авторы с большим кол-вом подписчиков остаются на fan-out-on-read
+            read_authors = await session.scalars(
+                select(user_to_user.c.following_id)
+                .where(user_to_user.c.following_id.in_(author_ids))
+                .group_by(user_to_user.c.following_id)
+                .having(func.count() > FEED_FANOUT_MAX_FOLLOWERS)
+            )
+            read_author_ids = set(read_authors)
+            write_author_ids = [
+                author_id for author_id in author_ids
+                if author_id not in read_author_ids
+            ]
+
+            # Условие на обе таблицы: подписчики пачки авторов читаются
+            # по индексу following_id, а не проходом по всем подпискам
+            query = insert(TimelineEntry).from_select(
+                ["user_id", "tweet_id", "created_at"],
+                select(user_to_user.c.followers_id, Tweet.id, Tweet.created_at)
+                .join(user_to_user, user_to_user.c.following_id == Tweet.user_id)
+                .where(Tweet.user_id.in_(write_author_ids),
+                       user_to_user.c.following_id.in_(write_author_ids),
+                       ),
+            ).on_conflict_do_nothing()
+            result = await session.execute(query)
+            inserted += result.rowcount
+
+            await session.execute(
+                update(Tweet)
+                .where(Tweet.user_id.in_(author_ids))
+                .values(fanned_out=Tweet.user_id.in_(write_author_ids))
+            )
+            await session.commit()
+
+            logger.debug(f"Обработаны авторы до id {last_author_id}")
+
+        logger.info(f"Ленты заполнены, добавлено записей: {inserted}")
+
+        return inserted
@@ -1,47 +1,435 @@
+import datetime
+import time
 from http import HTTPStatus
+from typing import Any, Dict, List, Sequence, Tuple
 
 from loguru import logger
-from sqlalchemy import select
+from sqlalchemy import Select, func, literal, select, true, union_all
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import InstrumentedAttribute
 
+from main.config import (FEED_ETAG_MAX_AGE,
+                         FEED_LIKES_PREVIEW,
+                         FEED_SINCE_OVERLAP,)
+from main.models.images import Image
 from main.models.likes import Like
 from main.models.tweets import Tweet
-from main.models.users import User
-from main.schemas import TweetSchema
+from main.models.users import User, user_to_user
+from main.schemas import (FeedOrder,
+                          LikesMode,
+                          MediaVariant,
+                          Principal,
+                          TweetSchema,)
 from main.services.image import ImageService
+from main.services.timeline import TimelineService
+from main.services.tweet_stream import tweet_stream
+from main.services.user import UserService
+from main.utils.cursor import decode_cursor, encode_cursor, keyset_page
 from main.utils.exeptions import SpecialException
 
 
+# Колонки порядка ленты (индексы по (user_id, колонка, id) у твитов)
+FEED_SORT_COLUMNS: Dict[str, InstrumentedAttribute[Any]] = {
+    "recent": Tweet.created_at,
+    "popular": Tweet.likes_count,
+    "ranked": Tweet.score,
+}
+
+
 class TweetsService:
     """
     Класс для добавления, удаления и вывода твитов
     """
 
     @classmethod
-    async def get_tweets(cls, user: User, session: AsyncSession):
+    async def get_tweets(
+        cls,
+        user: Principal,
+        session: AsyncSession,
+        limit: int,
+        cursor: str | None = None,
+        likes_mode: LikesMode = "full",
+        media_variant: MediaVariant | None = None,
+        order: FeedOrder = "recent",
+        since: str | None = None,
+    ) -> Tuple[List[Dict[str, Any]], str | None, str | None]:
         """
-        Вывод последних твитов подписанных пользователей
+        Вывод твитов подписанных пользователей (постранично).
+        Твиты упорядочены по убыванию (колонка порядка, id): created_at,
+        likes_count или score (FEED_SORT_COLUMNS). Курсор хранит порядок
+        и ключ последнего твита страницы, поэтому стоимость запроса зависит
+        только от размера страницы, а не от длины истории
         :param user: текущий пользователь
         :param session: асинхронная сессия
-        :return: список твитов
+        :param limit: размер страницы
+        :param cursor: курсор, полученный вместе с предыдущей страницей
+        :param likes_mode: full - все лайки твита,
+         summary - последние FEED_LIKES_PREVIEW лайков
+        :param media_variant: уменьшенная копия изображений (None - оригиналы)
+        :param order: recent - новые первыми, popular - по кол-ву лайков,
+         ranked - по рейтингу с учетом новизны
+        :param since: watermark, полученный с предыдущей лентой: выводятся
+         только более новые твиты (только для order=recent)
+        :return: список твитов в формате ответа (TweetOutSchema по псевдонимам),
+         курсор следующей страницы (None - страниц нет) и watermark для
+         параметра since (только на первой странице порядка recent)
         """
-        logger.debug("Вывод твитов")
+        logger.debug(f"Вывод твитов, курсор: {cursor}, размер страницы: {limit}")
+
+        # Подписки не загружаются, а подставляются в запрос подзапросом
+        following_ids = select(user_to_user.c.following_id).where(
+            user_to_user.c.followers_id == user.id
+        )
+        sort_column = FEED_SORT_COLUMNS[order]
+        after = cls._parse_cursor(cursor=cursor, order=order) if cursor else None
+        newer = None
+
+        if since:
+            if order != "recent":
+                logger.error(f"Параметр since для порядка ленты {order}")
+
+                raise SpecialException(
+                    status_code=HTTPStatus.UNPROCESSABLE_ENTITY,  # 422
+                    detail="Parameter since is supported only for order=recent",
+                )
+
+            # watermark - курсор порядка recent
+            newer = cls._parse_cursor(cursor=since, order=order)
+
+        # Запрашиваем на одну запись больше, чтобы узнать, есть ли еще страница.
+        # Материализованные ленты хранят только порядок по дате
+        if order == "recent" and TimelineService.is_enabled():
+            keys = TimelineService.page_keys_query(
+                user_id=user.id,
+                following_ids=following_ids,
+                after=after,
+                limit=limit + 1,
+                since=newer,
+            ).subquery()
+        else:
+            keys = cls._page_keys_query(following_ids=following_ids,
+                                        sort_column=sort_column,
+                                        after=after,
+                                        limit=limit + 1,
+                                        since=newer,
+                                        ).subquery()
+
+        sort_key = keys.c[sort_column.key]
+
+        # Лента собирается из строк без создания ORM-объектов: готовые
+        # словари в формате ответа сериализуются напрямую (orjson), минуя
+        # построчную валидацию схемой TweetOutSchema.
+        # Связанные данные догружаются отдельными запросами по набору id
+        # твитов страницы, а не JOIN-ом коллекций, который размножает строки
+        # (твиты × лайки × изображения). Кол-во запросов постоянно:
+        # страница твитов с авторами, лайки, изображения
         query = (
-            select(Tweet)
-            .filter(Tweet.user_id.in_(user.id for user in user.following))
-            .options(
-                joinedload(Tweet.user),
-                joinedload(Tweet.likes).subqueryload(Like.user),
-                joinedload(Tweet.images),
+            select(Tweet.id,
+                   Tweet.tweet_data,
+                   Tweet.likes_count,
+                   sort_key.label("sort_key"),
+                   User.id.label("user_id"),
+                   User.username,
+                   )
+            .join(keys, keys.c.id == Tweet.id)
+            .join(User, User.id == Tweet.user_id)
+            .order_by(sort_key.desc(), keys.c.id.desc())
+            .limit(limit + 1)
+        )
+        result = await session.execute(query)
+        rows = result.all()
+
+        next_cursor = None
+        watermark = None
+
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = cls._make_cursor(order=order, row=rows[-1])
+
+        if order == "recent" and cursor is None:
+            watermark = cls._make_watermark(rows=rows, since=since, newer=newer)
+
+        tweets = {
+            row.id: {
+                "id": row.id,
+                "content": row.tweet_data,
+                "author": {"id": row.user_id, "name": row.username},
+                "likes": [],
+                "attachments": [],
+                "likes_count": row.likes_count,
+                "is_liked": False,
+            }
+            for row in rows
+        }
+
+        if tweets:
+            await cls._load_likes(tweets=tweets,
+                                  user_id=user.id,
+                                  likes_mode=likes_mode,
+                                  session=session,
+                                  )
+            await cls._load_attachments(tweets=tweets,
+                                        media_variant=media_variant,
+                                        session=session,
+                                        )
+
+        return list(tweets.values()), next_cursor, watermark
+
+    @classmethod
+    async def get_feed_version(cls,
+                               user: Principal,
+                               session: AsyncSession,
+                               ) -> List[Any]:
+        """
+        Версия ленты без запроса самой ленты: кол-во подписок и сумма
+        отметок активности (last_activity_at) пользователя и авторов,
+        на которых он подписан. В отличие от максимума, сумма меняется
+        и тогда, когда транзакция с более ранней отметкой закоммичена позже.
+        Лайки пользователя (is_liked в ленте) учитываются по их кол-ву
+        и последнему id: лайк и удаление лайка ничего не записывают
+        в таблицу пользователей. Лайки других пользователей в версию
+        не входят: версия дополнительно меняется раз в FEED_ETAG_MAX_AGE секунд
+        :param user: текущий пользователь
+        :param session: асинхронная сессия
+        :return: значения, из которых строится ETag ленты
+        """
+        # Подписки и сам пользователь (его подписки меняют состав ленты)
+        user_ids = union_all(
+            select(user_to_user.c.following_id).where(
+                user_to_user.c.followers_id == user.id
+            ),
+            select(literal(user.id)),
+        )
+        # Лайки пользователя (по индексу уникальности по user_id)
+        user_likes = select(Like.id).where(Like.user_id == user.id).subquery()
+        query = select(
+            func.count(),
+            func.sum(func.extract("epoch", User.last_activity_at)),
+            select(func.count()).select_from(user_likes).scalar_subquery(),
+            select(func.coalesce(func.max(user_likes.c.id), 0)).scalar_subquery(),
+        ).where(User.id.in_(user_ids))
+        result = await session.execute(query)
+        count, activity, likes_count, last_like_id = result.one()
+        period = int(time.time() // FEED_ETAG_MAX_AGE) if FEED_ETAG_MAX_AGE else 0
+
+        return [user.id, count, str(activity), likes_count, last_like_id, period]
+
+    @classmethod
+    def _make_cursor(cls, order: FeedOrder, row: Any) -> str:
+        """
+        Курсор ленты: порядок и ключ твита (значение колонки порядка, id)
+        """
+        sort_value = row.sort_key
+
+        if isinstance(sort_value, datetime.datetime):
+            sort_value = sort_value.isoformat()
+
+        return encode_cursor([order, sort_value, row.id])
+
+    @classmethod
+    def _make_watermark(cls,
+                        rows: Sequence[Any],
+                        since: str | None,
+                        newer: List[Any] | None,
+                        ) -> str | None:
+        """
+        Watermark ленты: время самого нового твита за вычетом
+        FEED_SINCE_OVERLAP секунд. Время твита назначается при вставке,
+        а виден он после коммита, поэтому твит более долгой транзакции
+        появляется в ленте позже более новых. Запрос по watermark повторно
+        выводит твиты последних секунд, клиент отбрасывает уже полученные
+        по id. Watermark не сдвигается назад: если новее прежнего твитов
+        нет, он остается в силе
+        """
+        if not rows:
+            return since
+
+        boundary = [
+            rows[0].sort_key - datetime.timedelta(seconds=FEED_SINCE_OVERLAP),
+            0,
+        ]
+
+        if newer is not None and boundary <= newer:
+            return since
+
+        return encode_cursor(["recent", boundary[0].isoformat(), boundary[1]])
+
+    @classmethod
+    async def _load_attachments(cls,
+                                tweets: Dict[int, Dict[str, Any]],
+                                media_variant: MediaVariant | None,
+                                session: AsyncSession,
+                                ) -> None:
+        """
+        Ссылки на изображения твитов страницы. Если запрошена уменьшенная
+        копия, подставляются ссылки на готовые копии, изображения без копии
+        выводятся в исходном виде
+        :param tweets: твиты страницы по id
+        :param media_variant: уменьшенная копия (None - оригиналы)
+        :param session: асинхронная сессия
+        :return: None
+        """
+        result = await session.execute(
+            select(Image.id, Image.tweet_id, Image.path_media)
+            .where(Image.tweet_id.in_(list(tweets)))
+            .order_by(Image.id)
+        )
+        images = result.all()
+        paths: Dict[int, str] = {}
+
+        if media_variant is not None:
+            paths = await ImageService.get_variant_paths(
+                image_ids=[image.id for image in images],
+                name=media_variant,
+                session=session,
             )
-            .order_by(Tweet.likes_count.asc())
+
+        for image in images:
+            tweets[image.tweet_id]["attachments"].append(
+                paths.get(image.id) or image.path_media
+            )
+
+    @classmethod
+    def _page_keys_query(cls,
+                         following_ids: Select,
+                         sort_column: InstrumentedAttribute[Any],
+                         after: List[Any] | None,
+                         limit: int,
+                         since: List[Any] | None = None,
+                         ) -> Select:
+        """
+        Запрос ключей страницы ленты: у каждого автора берется не больше
+        limit твитов по индексу (user_id, колонка порядка, id) (LATERAL),
+        поэтому сортируются только они, а не все твиты подписок
+        :param following_ids: подзапрос id пользователей, на которых подписан
+         пользователь
+        :param sort_column: колонка порядка ленты
+        :param after: ключ последнего твита предыдущей страницы
+        :param limit: размер страницы
+        :param since: ключ, новее которого выводятся твиты (None - все)
+        :return: запрос, возвращающий колонки id и колонку порядка
+        """
+        authors = following_ids.subquery()
+        author_page = keyset_page(
+            query=select(Tweet.id, sort_column).where(
+                Tweet.user_id == authors.c.following_id
+            ),
+            columns=[sort_column, Tweet.id],
+            after=after,
+            limit=limit,
+            since=since,
+        ).lateral()
+
+        return keyset_page(
+            query=select(author_page).select_from(authors).join(author_page,
+                                                                true(),
+                                                                ),
+            columns=[author_page.c[sort_column.key], author_page.c.id],
+            after=None,
+            limit=limit,
         )
 
+    @classmethod
+    def _parse_cursor(cls,
+                      cursor: str,
+                      order: FeedOrder,
+                      ) -> List[datetime.datetime | float | int]:
+        """
+        Разбор курсора ленты
+        :param cursor: курсор
+        :param order: запрошенный порядок ленты (должен совпадать с курсором)
+        :return: значение колонки порядка и id последнего твита
+         предыдущей страницы
+        """
+        cursor_order, value, tweet_id = decode_cursor(cursor=cursor, size=3)
+
+        try:
+            if cursor_order != order or not isinstance(tweet_id, int):
+                raise ValueError(order)
+
+            if order == "recent":
+                return [datetime.datetime.fromisoformat(value), tweet_id]
+
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(value)
+
+            return [int(value) if order == "popular" else float(value), tweet_id]
+        except (TypeError, ValueError):
+            logger.error(f"Некорректные значения в курсоре: {cursor}")
+
+            raise SpecialException(
+                status_code=HTTPStatus.UNPROCESSABLE_ENTITY,  # 422
+                detail="Invalid cursor",
+            )
+
+    @classmethod
+    async def _load_likes(cls,
+                          tweets: Dict[int, Dict[str, Any]],
+                          user_id: int,
+                          likes_mode: LikesMode,
+                          session: AsyncSession,
+                          ) -> None:
+        """
+        Лайки твитов страницы и признак лайка текущего пользователя.
+        В режиме summary загружаются только последние FEED_LIKES_PREVIEW
+        лайков каждого твита
+        :param tweets: твиты страницы по id
+        :param user_id: id текущего пользователя
+        :param likes_mode: full - все лайки, summary - последние лайки
+        :param session: асинхронная сессия
+        :return: None
+        """
+        tweet_ids = list(tweets)
+
+        if likes_mode == "full":
+            query = (
+                select(Like.tweets_id, Like.user_id, User.username)
+                .join(User, User.id == Like.user_id)
+                .where(Like.tweets_id.in_(tweet_ids))
+                .order_by(Like.id)
+            )
+        else:
+            # Для каждого твита берем не больше FEED_LIKES_PREVIEW лайков (LATERAL)
+            page = select(Tweet.id).where(Tweet.id.in_(tweet_ids)).subquery()
+            preview = (
+                select(Like.id, Like.user_id)
+                .where(Like.tweets_id == page.c.id)
+                .order_by(Like.id.desc())
+                .limit(FEED_LIKES_PREVIEW)
+                .lateral()
+            )
+            query = (
+                select(page.c.id.label("tweets_id"),
+                       preview.c.user_id,
+                       User.username,
+                       )
+                .select_from(page)
+                .join(preview, true())
+                .join(User, User.id == preview.c.user_id)
+                .order_by(preview.c.id.desc())
+            )
+
         result = await session.execute(query)
-        tweets = result.unique().scalars().all()
 
-        return tweets
+        for like in result:
+            tweets[like.tweets_id]["likes"].append(
+                {"user_id": like.user_id, "name": like.username}
+            )
+
+        if likes_mode == "full":
+            for tweet in tweets.values():
+                tweet["is_liked"] = any(like["user_id"] == user_id
+                                        for like in tweet["likes"])
+        else:
+            # Лайк текущего пользователя может не попасть в последние лайки
+            liked = await session.scalars(
+                select(Like.tweets_id).where(Like.user_id == user_id,
+                                             Like.tweets_id.in_(tweet_ids),
+                                             )
+            )
+
+            for tweet_id in liked:
+                tweets[tweet_id]["is_liked"] = True
 
     @classmethod
     async def get_tweet(cls,
@@ -63,7 +451,7 @@ class TweetsService:
 
     @classmethod
     async def create_tweet(
-        cls, tweet: TweetSchema, current_user: User, session: AsyncSession
+        cls, tweet: TweetSchema, current_user: Principal, session: AsyncSession
     ) -> Tweet:
         """
         Создание нового твита
@@ -81,23 +469,45 @@ class TweetsService:
 
         # Если есть изображение, то сохраняем его
         tweet_media_ids = tweet.tweet_media_ids
+        attachments = []
 
         if tweet_media_ids and tweet_media_ids != []:
             # Привязываем изображения к твиту
-            await ImageService.update_images(
+            attachments = await ImageService.update_images(
                 tweet_media_ids=tweet_media_ids,
                 tweet_id=new_tweet.id,
                 session=session,
             )
 
+        if TimelineService.is_enabled():
+            # Раскладываем твит по лентам подписчиков в той же транзакции
+            await TimelineService.fan_out(tweet=new_tweet, session=session)
+
+        # Новая версия лент подписчиков
+        await UserService.mark_active(user_id=current_user.id, session=session)
+
         # Коммитим изменения в БД
         await session.commit()
 
+        # Подписчики с открытым потоком получают твит в формате ленты
+        await tweet_stream.publish(
+            author_id=current_user.id,
+            tweet={
+                "id": new_tweet.id,
+                "content": new_tweet.tweet_data,
+                "author": {"id": current_user.id, "name": current_user.username},
+                "likes": [],
+                "attachments": attachments,
+                "likes_count": 0,
+                "is_liked": False,
+            },
+        )
+
         return new_tweet
 
     @classmethod
     async def delete_tweet(
-        cls, user: User, tweet_id: int, session: AsyncSession
+        cls, user: Principal, tweet_id: int, session: AsyncSession
     ) -> None:
         """
         Удаление твита
@@ -134,6 +544,14 @@ class TweetsService:
                                                  session=session,
                                                  )
 
+                if TimelineService.is_enabled():
+                    # Убираем твит из лент подписчиков
+                    await TimelineService.retract(tweet_id=tweet.id,
+                                                  session=session,
+                                                  )
+
+                await UserService.mark_active(user_id=user.id, session=session)
+
                 # Удаляем твит
                 await session.delete(tweet)
                 await session.commit()
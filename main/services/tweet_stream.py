@@ -0,0 +1,261 @@
+import asyncio
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Set
+
+import orjson
+from loguru import logger
+
+from main.config import (STREAM_BACKEND,
+                         STREAM_KEEPALIVE,
+                         STREAM_MAX_DURATION,
+                         STREAM_QUEUE_SIZE,)
+
+# Комментарий SSE: поддерживает соединение через прокси
+KEEPALIVE_FRAME = ": keepalive\n\n"
+# Событие переполнения очереди: часть твитов пропущена, клиент
+# догружает ленту запросом GET /api/tweets?since=<watermark>
+OVERFLOW_FRAME = "event: overflow\ndata: {}\n\n"
+
+
+class StreamBackend(ABC):
+    """
+    Общая для воркеров приложения шина событий (интерфейс).
+    Опубликованное сообщение доставляется всем воркерам, включая
+    опубликовавший, каждый воркер рассылает его своим соединениям
+    """
+
+    @abstractmethod
+    async def start(self, deliver: Callable[[str], None]) -> None:
+        ...
+
+    @abstractmethod
+    async def publish(self, message: str) -> None:
+        ...
+
+    @abstractmethod
+    async def stop(self) -> None:
+        ...
+
+
+class MemoryStreamBackend(StreamBackend):
+    """
+    Локальная замена общей шины: сообщения доставляются в пределах процесса.
+    Используется для разработки и тестов
+    """
+
+    def __init__(self) -> None:
+        self._deliver: Callable[[str], None] | None = None
+
+    async def start(self, deliver: Callable[[str], None]) -> None:
+        self._deliver = deliver
+
+    async def publish(self, message: str) -> None:
+        if self._deliver is not None:
+            self._deliver(message)
+
+    async def stop(self) -> None:
+        self._deliver = None
+
+
+def get_stream_backend() -> StreamBackend | None:
+    """
+    Общая шина, выбранная в настройках STREAM_BACKEND (None - не используется)
+    """
+    if not STREAM_BACKEND:
+        return None
+
+    if STREAM_BACKEND == "memory":
+        logger.info("Шина потока твитов: память процесса")
+
+        return MemoryStreamBackend()
+
+    raise ValueError(f"Unknown STREAM_BACKEND: {STREAM_BACKEND}")
+
+
+class Subscription:
+    """
+    Соединение потока: id авторов, твиты которых в него попадают,
+    и ограниченная очередь готовых событий SSE
+    """
+
+    def __init__(self, author_ids: Iterable[int], queue_size: int) -> None:
+        self.author_ids = set(author_ids)
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=queue_size)
+        self.overflows = 0
+
+    def put(self, frame: str) -> None:
+        """
+        Добавление события без ожидания. Если клиент не успевает читать
+        и очередь заполнена, накопленные события отбрасываются и заменяются
+        событием переполнения, поэтому медленный клиент не задерживает
+        рассылку и не накапливает память
+        """
+        if self.queue.full():
+            self.overflows += 1
+
+            while not self.queue.empty():
+                self.queue.get_nowait()
+
+            self.queue.put_nowait(OVERFLOW_FRAME)
+
+        # Твит, не поместившийся после события переполнения, клиент
+        # получит при догрузке ленты
+        if not self.queue.full():
+            self.queue.put_nowait(frame)
+
+
+class TweetStream:
+    """
+    Рассылка новых твитов по открытым соединениям потока (pub/sub).
+    Соединения хранятся по id авторов, поэтому твит проверяется только
+    для подписчиков его автора, а не для всех соединений.
+    С общей шиной (backend) твиты доходят до соединений всех воркеров
+    """
+
+    def __init__(self,
+                 queue_size: int,
+                 keepalive: float,
+                 max_duration: float,
+                 backend: StreamBackend | None = None,
+                 ) -> None:
+        self.queue_size = queue_size
+        self.keepalive = keepalive
+        self.max_duration = max_duration
+        self.backend = backend
+        self._subscribers: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._connections: Set[Subscription] = set()
+        self._started = False
+
+    async def subscribe(self, author_ids: Iterable[int]) -> Subscription:
+        """
+        Новое соединение
+        :param author_ids: id авторов, на которых подписан пользователь
+        :return: подписка соединения
+        """
+        await self._ensure_started()
+
+        subscription = Subscription(author_ids=author_ids,
+                                    queue_size=self.queue_size,
+                                    )
+
+        for author_id in subscription.author_ids:
+            self._subscribers[author_id].add(subscription)
+
+        self._connections.add(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Закрытие соединения
+        """
+        self._connections.discard(subscription)
+
+        for author_id in subscription.author_ids:
+            subscribers = self._subscribers.get(author_id)
+
+            if subscribers is not None:
+                subscribers.discard(subscription)
+
+                if not subscribers:
+                    del self._subscribers[author_id]
+
+        if subscription.overflows:
+            logger.warning(f"Переполнений очереди соединения: "
+                           f"{subscription.overflows}")
+
+    def connections(self) -> int:
+        """
+        Кол-во открытых соединений процесса
+        """
+        return len(self._connections)
+
+    async def publish(self, author_id: int, tweet: Dict[str, Any]) -> None:
+        """
+        Публикация нового твита (после коммита)
+        :param author_id: id автора
+        :param tweet: твит в формате ленты
+        :return: None
+        """
+        message = orjson.dumps({"author_id": author_id, "tweet": tweet}).decode()
+
+        if self.backend is None:
+            self.deliver(message)
+            return
+
+        await self._ensure_started()
+
+        try:
+            await self.backend.publish(message)
+        except Exception:
+            # Твит сохранен, подписчики увидят его в ленте
+            logger.exception("Ошибка публикации твита в шину потока")
+
+    def deliver(self, message: str) -> None:
+        """
+        Рассылка сообщения соединениям процесса. Событие SSE формируется
+        один раз для всех соединений
+        """
+        data = orjson.loads(message)
+        subscribers = self._subscribers.get(data["author_id"])
+
+        if not subscribers:
+            return
+
+        frame = f"event: tweet\ndata: {orjson.dumps(data['tweet']).decode()}\n\n"
+
+        for subscription in list(subscribers):
+            subscription.put(frame)
+
+    async def events(self, author_ids: Iterable[int]) -> AsyncIterator[str]:
+        """
+        События SSE нового соединения. При отсутствии твитов раз в keepalive
+        секунд отправляется комментарий, через max_duration секунд поток
+        закрывается: клиент (EventSource) переподключается, а соединения
+        перераспределяются между воркерами.
+        Подписка оформляется при начале передачи и снимается при ее
+        завершении, в том числе при отключении клиента
+        :param author_ids: id авторов, на которых подписан пользователь
+        :return: события SSE
+        """
+        subscription = await self.subscribe(author_ids=author_ids)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_duration
+
+        try:
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    frame = await asyncio.wait_for(subscription.queue.get(),
+                                                   min(self.keepalive, remaining),
+                                                   )
+                except asyncio.TimeoutError:
+                    frame = KEEPALIVE_FRAME
+
+                yield frame
+        finally:
+            self.unsubscribe(subscription)
+
+    async def stop(self) -> None:
+        """
+        Отключение от общей шины при остановке приложения
+        """
+        if self.backend is not None and self._started:
+            await self.backend.stop()
+
+        self._started = False
+
+    async def _ensure_started(self) -> None:
+        """
+        Подключение к общей шине при первом соединении или публикации
+        """
+        if self.backend is not None and not self._started:
+            self._started = True
+            await self.backend.start(self.deliver)
+
+
+tweet_stream = TweetStream(queue_size=STREAM_QUEUE_SIZE,
+                           keepalive=STREAM_KEEPALIVE,
+                           max_duration=STREAM_MAX_DURATION,
+                           backend=get_stream_backend(),
+                           )
@@ -1,11 +1,18 @@
+from http import HTTPStatus
+from typing import Any, List, Tuple
+
 from loguru import logger
-from sqlalchemy import select
+from sqlalchemy import Select, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from collections.abc import Sequence
 
+from main.config import PROFILE_FOLLOWS_PREVIEW
 from main.database import async_session_maker
-from main.models.users import User
+from main.models.users import User, user_to_user
+from main.schemas import FollowsKind, Principal, UserInfoSchema
+from main.utils.cursor import decode_cursor, encode_cursor, keyset_page
+from main.utils.exeptions import SpecialException
 
 
 class UserService:
@@ -38,29 +45,227 @@ class UserService:
 
         return result.scalar_one_or_none()
 
+    @classmethod
+    async def get_principal_by_key(cls,
+                                   token: str,
+                                   session: AsyncSession,
+                                   ) -> Principal | None:
+        """
+        Получение данных пользователя по api-ключу без связанных объектов
+        :param token: api-ключ пользователя
+        :param session: асинхронная сессия
+        :return: Данные пользователя / None если пользователь не найден
+        """
+        logger.debug("Поиск пользователя по api-key")
+
+        query = select(User.id, User.username).where(User.api_key == token)
+        result = await session.execute(query)
+        row = result.one_or_none()
+
+        if row is None:
+            return None
+
+        return Principal.model_validate(row)
+
     @classmethod
     async def get_user_by_id(cls, user_id: int,
                              session: AsyncSession,
+                             load_follows: bool = True,
                              ) -> User | None:
         """
         Возврат объекта пользователя по id
         :param user_id: id пользователя
         :param session: асинхронная сессия
+        :param load_follows: загрузить списки подписок и подписчиков
         :return: Пользователь / False если пользователь не найден
         """
         logger.debug(f"Поиск пользователя по id: {user_id}")
 
-        query = (
-            select(User)
-            .where(User.id == user_id)
-            .options(selectinload(User.following),
-                     selectinload(User.followers),)
-        )
+        query = select(User).where(User.id == user_id)
+
+        if load_follows:
+            query = query.options(selectinload(User.following),
+                                  selectinload(User.followers),
+                                  )
 
         result = await session.execute(query)
 
         return result.scalar_one_or_none()
 
+    @classmethod
+    async def get_following_ids(cls,
+                                user_id: int,
+                                session: AsyncSession,
+                                ) -> List[int]:
+        """
+        Возврат id пользователей, на которых подписан пользователь
+        (без загрузки самих пользователей)
+        :param user_id: id пользователя
+        :param session: асинхронная сессия
+        :return: список id
+        """
+        logger.debug(f"Поиск подписок пользователя: {user_id}")
+
+        query = select(user_to_user.c.following_id).where(
+            user_to_user.c.followers_id == user_id
+        )
+        result = await session.scalars(query)
+
+        return list(result)
+
+    @classmethod
+    def follows_query(cls,
+                      user_id: int,
+                      kind: FollowsKind,
+                      after: List[Any] | None,
+                      limit: int,
+                      ) -> Select:
+        """
+        Запрос страницы подписчиков или подписок пользователя (по убыванию id).
+        Подписчики читаются по индексу (following_id, followers_id),
+        подписки - по первичному ключу (followers_id, following_id)
+        :param user_id: id пользователя
+        :param kind: followers - подписчики | following - подписки
+        :param after: id последнего пользователя предыдущей страницы
+        :param limit: размер страницы
+        :return: запрос пользователей
+        """
+        if kind == "followers":
+            owner = user_to_user.c.following_id
+            other = user_to_user.c.followers_id
+        else:
+            owner = user_to_user.c.followers_id
+            other = user_to_user.c.following_id
+
+        return keyset_page(
+            query=select(User).join(user_to_user, User.id == other).where(
+                owner == user_id
+            ),
+            columns=[other],
+            after=after,
+            limit=limit,
+        )
+
+    @classmethod
+    async def get_profile(cls,
+                          user_id: int,
+                          session: AsyncSession,
+                          ) -> UserInfoSchema | None:
+        """
+        Профиль пользователя: счетчики и последние подписки и подписчики
+        (не более PROFILE_FOLLOWS_PREVIEW)
+        :param user_id: id пользователя
+        :param session: асинхронная сессия
+        :return: профиль | None - пользователь не найден
+        """
+        user = await cls.get_user_by_id(user_id=user_id,
+                                        session=session,
+                                        load_follows=False,
+                                        )
+
+        if user is None:
+            return None
+
+        follows = {}
+
+        for kind in ("following", "followers"):
+            result = await session.scalars(
+                cls.follows_query(user_id=user_id,
+                                  kind=kind,
+                                  after=None,
+                                  limit=PROFILE_FOLLOWS_PREVIEW,
+                                  )
+            )
+            follows[kind] = list(result)
+
+        return UserInfoSchema(id=user.id,
+                              username=user.username,
+                              following=follows["following"],
+                              followers=follows["followers"],
+                              following_count=user.following_count,
+                              followers_count=user.followers_count,
+                              )
+
+    @classmethod
+    async def get_follows(cls,
+                          user_id: int,
+                          kind: FollowsKind,
+                          session: AsyncSession,
+                          limit: int,
+                          cursor: str | None = None,
+                          ) -> Tuple[List[User], str | None]:
+        """
+        Постраничный вывод подписчиков или подписок пользователя
+        :param user_id: id пользователя
+        :param kind: followers - подписчики | following - подписки
+        :param session: асинхронная сессия
+        :param limit: размер страницы
+        :param cursor: курсор, полученный вместе с предыдущей страницей
+        :return: список пользователей и курсор следующей страницы
+         (None - страниц нет)
+        """
+        logger.debug(f"Вывод {kind} пользователя {user_id}, курсор: {cursor}")
+
+        user = await cls.get_user_by_id(user_id=user_id,
+                                        session=session,
+                                        load_follows=False,
+                                        )
+
+        if user is None:
+            logger.error(f"Пользователь с id: {user_id} не найден")
+
+            raise SpecialException(
+                status_code=HTTPStatus.NOT_FOUND,  # 404
+                detail="User not found",
+            )
+
+        after = None
+
+        if cursor:
+            (last_id,) = decode_cursor(cursor=cursor, size=1)
+
+            if not isinstance(last_id, int):
+                raise SpecialException(
+                    status_code=HTTPStatus.UNPROCESSABLE_ENTITY,  # 422
+                    detail="Invalid cursor",
+                )
+
+            after = [last_id]
+
+        # Запрашиваем на одну запись больше, чтобы узнать, есть ли еще страница
+        result = await session.scalars(
+            cls.follows_query(user_id=user_id,
+                              kind=kind,
+                              after=after,
+                              limit=limit + 1,
+                              )
+        )
+        users = list(result)
+        next_cursor = None
+
+        if len(users) > limit:
+            users = users[:limit]
+            next_cursor = encode_cursor([users[-1].id])
+
+        return users, next_cursor
+
+    @classmethod
+    async def mark_active(cls, user_id: int, session: AsyncSession) -> None:
+        """
+        Отметка активности пользователя, влияющей на ленты подписчиков
+        (новая версия их лент)
+        :param user_id: id пользователя
+        :param session: асинхронная сессия
+        :return: None
+        """
+        query = (
+            update(User)
+            .where(User.id == user_id)
+            .values(last_activity_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+        await session.execute(query)
+
     @classmethod
     async def check_user_by_id(cls, current_user_id: int,
                                user_id: int,
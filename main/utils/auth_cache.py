@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+from typing import Dict, Set
+
+from loguru import logger
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from main.config import AUTH_CACHE_MAXSIZE, AUTH_CACHE_TTL
+from main.models.users import User
+from main.schemas import Principal
+from main.utils.cache import CacheBackend, TTLCache, get_cache_backend
+
+# Ключи кэша, подлежащие сбросу после коммита сессии
+_INVALIDATE_KEY = "auth_cache_invalidate"
+
+
+class AuthCache:
+    """
+    Кэш аутентификации: хэш api-key -> данные пользователя (Principal).
+    Без общего кэша записи хранятся в памяти процесса. С общим для воркеров
+    кэшем память процесса не используется: сброс записи в одном воркере
+    (ротация ключа, удаление пользователя) сразу действует во всех
+    """
+
+    def __init__(self,
+                 local: TTLCache,
+                 shared: CacheBackend | None = None,
+                 ) -> None:
+        self.local = local
+        self.shared = shared
+        # Фоновые удаления из общего кэша по ключам: пока удаление
+        # не завершено, запись считается отсутствующей
+        self._deleting: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def make_key(api_key: str) -> str:
+        """
+        Ключ кэша: сам api-key в кэше не хранится
+        """
+        return "auth:" + hashlib.sha256(api_key.encode()).hexdigest()
+
+    async def get(self, api_key: str) -> Principal | None:
+        """
+        Поиск пользователя в кэше по api-key
+        """
+        key = self.make_key(api_key)
+
+        if self.shared is None:
+            return self.local.get(key)
+
+        if key in self._deleting:
+            return None
+
+        value = await self.shared.get(key)
+
+        return Principal.model_validate_json(value) if value is not None else None
+
+    async def set(self, api_key: str, principal: Principal) -> None:
+        """
+        Запись пользователя в кэш
+        """
+        key = self.make_key(api_key)
+
+        if self.shared is None:
+            self.local.set(key, principal)
+        elif key not in self._deleting:
+            await self.shared.set(key, principal.model_dump_json(), self.local.ttl)
+
+    def invalidate(self, api_key: str) -> None:
+        """
+        Сброс записи по api-key (ротация ключа, удаление пользователя).
+        Из общего кэша запись удаляется в фоне
+        """
+        key = self.make_key(api_key)
+        self.local.delete(key)
+
+        if self.shared is not None:
+            try:
+                task = asyncio.get_running_loop().create_task(
+                    self.shared.delete(key)
+                )
+            except RuntimeError:
+                # Нет запущенного цикла событий (скрипты, миграции)
+                asyncio.run(self.shared.delete(key))
+                return
+
+            self._deleting[key] = task
+            task.add_done_callback(lambda done: self._deleted(key, done))
+
+    def _deleted(self, key: str, task: asyncio.Task) -> None:
+        """
+        Завершение фонового удаления из общего кэша
+        """
+        if self._deleting.get(key) is task:
+            del self._deleting[key]
+
+    def clear(self) -> None:
+        """
+        Очистка кэша процесса
+        """
+        self.local.clear()
+
+
+auth_cache = AuthCache(
+    local=TTLCache(maxsize=AUTH_CACHE_MAXSIZE, ttl=AUTH_CACHE_TTL),
+    shared=get_cache_backend(),
+)
+
+
+def _schedule_invalidation(target: User, *api_keys: str | None) -> None:
+    """
+    Сброс кэша сразу и повторно после коммита, чтобы запрос, успевший
+    закэшировать старые данные до коммита, не оставил их в кэше
+    """
+    keys: Set[str] = {api_key for api_key in api_keys if api_key}
+
+    for api_key in keys:
+        auth_cache.invalidate(api_key)
+
+    session = object_session(target)
+
+    if session is not None:
+        session.info.setdefault(_INVALIDATE_KEY, set()).update(keys)
+
+
+@event.listens_for(User, "after_update")
+def _user_updated(mapper, connection, target: User) -> None:
+    """
+    Ротация api-key или смена имени пользователя
+    """
+    state = inspect(target)
+    api_key = state.attrs.api_key.history
+    username = state.attrs.username.history
+
+    if api_key.has_changes() or username.has_changes():
+        logger.debug(f"Сброс кэша аутентификации пользователя {target.id}")
+
+        _schedule_invalidation(target, target.api_key, *(api_key.deleted or ()))
+
+
+@event.listens_for(User, "after_delete")
+def _user_deleted(mapper, connection, target: User) -> None:
+    """
+    Удаление пользователя
+    """
+    logger.debug(f"Сброс кэша аутентификации пользователя {target.id}")
+
+    _schedule_invalidation(target, target.api_key)
+
+
+@event.listens_for(Session, "after_commit")
+def _session_committed(session: Session) -> None:
+    for api_key in session.info.pop(_INVALIDATE_KEY, ()):
+        auth_cache.invalidate(api_key)
+
+
+@event.listens_for(Session, "after_rollback")
+def _session_rolled_back(session: Session) -> None:
+    session.info.pop(_INVALIDATE_KEY, None)
@@ -0,0 +1,121 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+from loguru import logger
+
+from main.config import CACHE_BACKEND
+
+
+class TTLCache:
+    """
+    Кэш в памяти процесса: записи живут ttl секунд, при переполнении
+    вытесняются давно не использованные (LRU)
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, Tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str) -> Any | None:
+        """
+        Значение по ключу (None - нет в кэше или устарело)
+        """
+        item = self._data.get(key)
+
+        if item is None:
+            return None
+
+        expires_at, value = item
+
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+
+        self._data.move_to_end(key)
+
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Запись значения с вытеснением самых старых записей
+        """
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        """
+        Удаление значения
+        """
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Очистка кэша
+        """
+        self._data.clear()
+
+
+class CacheBackend(ABC):
+    """
+    Общий для воркеров приложения кэш (интерфейс).
+    Значения хранятся строками, чтобы их можно было держать во внешнем
+    хранилище (например, Redis)
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> str | None:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Локальная замена общего кэша: хранит значения в памяти процесса.
+    Используется для разработки и тестов, между воркерами не разделяется
+    """
+
+    def __init__(self) -> None:
+        self._data: Dict[str, Tuple[float, str]] = {}
+
+    async def get(self, key: str) -> str | None:
+        item = self._data.get(key)
+
+        if item is None or item[0] < time.monotonic():
+            self._data.pop(key, None)
+            return None
+
+        return item[1]
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+
+def get_cache_backend() -> CacheBackend | None:
+    """
+    Общий кэш, выбранный в настройках CACHE_BACKEND (None - не используется)
+    """
+    if not CACHE_BACKEND:
+        return None
+
+    if CACHE_BACKEND == "memory":
+        logger.info("Общий кэш: память процесса")
+
+        return MemoryCacheBackend()
+
+    raise ValueError(f"Unknown CACHE_BACKEND: {CACHE_BACKEND}")
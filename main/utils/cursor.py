@@ -0,0 +1,73 @@
+import base64
+import binascii
+import json
+from http import HTTPStatus
+from typing import Any, List, Sequence
+
+from loguru import logger
+from sqlalchemy import ColumnElement, Select, tuple_
+from sqlalchemy.orm import QueryableAttribute
+
+from main.utils.exeptions import SpecialException
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """
+    Кодирование ключа последней записи страницы в непрозрачный курсор
+    :param values: значения полей сортировки последней записи
+    :return: курсор (base64 без паддинга)
+    """
+    raw = json.dumps(values, default=str, separators=(",", ":")).encode()
+
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """
+    Декодирование курсора, полученного от клиента
+    :param cursor: курсор
+    :param size: ожидаемое кол-во значений в курсоре
+    :return: значения полей сортировки
+    """
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (binascii.Error, ValueError):
+        values = None
+
+    if not isinstance(values, list) or len(values) != size:
+        logger.error(f"Некорректный курсор: {cursor}")
+
+        raise SpecialException(
+            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,  # 422
+            detail="Invalid cursor",
+        )
+
+    return values
+
+
+def keyset_page(query: Select,
+                columns: Sequence[ColumnElement[Any] | QueryableAttribute[Any]],
+                after: List[Any] | None,
+                limit: int,
+                since: List[Any] | None = None,
+                ) -> Select:
+    """
+    Ограничение запроса одной страницей по ключу (keyset pagination):
+    записи упорядочиваются по колонкам ключа по убыванию и начинаются
+    сразу после ключа последней записи предыдущей страницы
+    :param query: исходный запрос
+    :param columns: колонки составного ключа сортировки
+    :param after: ключ последней записи предыдущей страницы (None - с начала)
+    :param limit: размер страницы
+    :param since: выводятся только записи с ключом больше этого
+     (None - без ограничения)
+    :return: запрос страницы
+    """
+    if after is not None:
+        query = query.where(tuple_(*columns) < tuple_(*after))
+
+    if since is not None:
+        query = query.where(tuple_(*columns) > tuple_(*since))
+
+    return query.order_by(*(column.desc() for column in columns)).limit(limit)
@@ -0,0 +1,32 @@
+import hashlib
+
+
+def make_etag(payload: str | bytes) -> str:
+    """
+    Сильный ETag ответа по его содержимому
+    :param payload: тело ответа
+    :return: значение заголовка ETag (в кавычках)
+    """
+    if isinstance(payload, str):
+        payload = payload.encode()
+
+    return '"' + hashlib.blake2b(payload, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Проверка заголовка If-None-Match: клиент уже получил эту версию ответа
+    :param if_none_match: значение заголовка (None - заголовка нет)
+    :param etag: ETag текущей версии ответа
+    :return: True - можно ответить 304 Not Modified
+    """
+    if not if_none_match:
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+
+    # Для If-None-Match используется слабое сравнение (префикс W/ не учитывается)
+    tags = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+    return etag in tags
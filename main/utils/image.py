@@ -1,14 +1,28 @@
+import hashlib
 import os
+import uuid
+from contextlib import suppress
 from http import HTTPStatus
-from typing import List
+from typing import List, Tuple
 
 import aiofiles
+import aiofiles.os
 from fastapi import UploadFile
 from loguru import logger
-
-from main.config import ALLOWED_EXTENSIONS
-from main.models.images import Image
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from main.config import (ALLOWED_EXTENSIONS,
+                         MEDIA_CHUNK_SIZE,
+                         MEDIA_FOLDER,
+                         MEDIA_MAX_SIZE,
+                         MEDIA_VARIANTS,)
 from main.utils.exeptions import SpecialException
+from main.utils.image_variants import variant_path
+
+# Запас на служебные данные каждого файла в теле multipart
+# (граница, заголовки части с названием файла)
+MULTIPART_FILE_OVERHEAD = 16 * 1024
 
 
 def allowed_image(image_name: str) -> None:
@@ -36,44 +50,198 @@ def allowed_image(image_name: str) -> None:
         )
 
 
-async def save_image_util(file: UploadFile) -> str:
+def image_filename(file: UploadFile) -> str:
+    """
+    Название загружаемого изображения
+    :param file: файл - изображение
+    :return: название файла
+    """
+    if not file.filename:
+        logger.error("Изображение загружено без названия файла")
+
+        raise SpecialException(
+            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,  # 422
+            detail="The image has no file name",
+        )
+
+    return file.filename
+
+
+def check_image_size(size: int | None) -> None:
+    """
+    Проверка размера изображения
+    :param size: размер файла в байтах (None - неизвестен)
+    :return: None
+    """
+    if size is not None and size > MEDIA_MAX_SIZE:
+        logger.error(f"Размер изображения превышает {MEDIA_MAX_SIZE} байт")
+
+        raise SpecialException(
+            status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE,  # 413
+            detail=f"The image is too large. Maximum size: {MEDIA_MAX_SIZE} bytes",
+        )
+
+
+def check_content_length(content_length: str | None, files: int) -> None:
+    """
+    Проверка заявленного размера запроса (заголовок Content-Length)
+    до чтения тела: запрос, в котором изображения заведомо больше
+    допустимого размера, отклоняется без приема файлов
+    :param content_length: значение заголовка (None - не передан)
+    :param files: допустимое кол-во файлов в запросе
+    :return: None
+    """
+    if content_length is None or not content_length.isdigit():
+        # Размер неизвестен (chunked) - проверяется при копировании
+        return
+
+    if int(content_length) > (MEDIA_MAX_SIZE + MULTIPART_FILE_OVERHEAD) * files:
+        logger.error(f"Размер запроса {content_length} байт превышает допустимый")
+
+        raise SpecialException(
+            status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE,  # 413
+            detail=f"The image is too large. Maximum size: {MEDIA_MAX_SIZE} bytes",
+        )
+
+
+def image_path(content_hash: str, image_name: str) -> str:
+    """
+    Путь изображения относительно MEDIA_FOLDER по хэшу содержимого.
+    Файлы раскладываются по поддиректориям из первых символов хэша,
+    чтобы в одной директории не скапливались тысячи файлов
+    :param content_hash: sha256 содержимого
+    :param image_name: исходное название (для расширения)
+    :return: путь вида ab/cd/abcd....jpg
+    """
+    extension = image_name.rsplit(".", 1)[1].lower()
+
+    return os.path.join(content_hash[:2],
+                        content_hash[2:4],
+                        f"{content_hash}.{extension}",
+                        )
+
+
+async def save_image_util(file: UploadFile) -> Tuple[str, str, int]:
     """
-    Сохранение изображения
+    Сохранение изображения во временный файл.
+    Файл копируется блоками по MEDIA_CHUNK_SIZE (чтение и запись
+    не блокируют цикл событий, файл целиком в памяти не держится),
+    попутно считается хэш содержимого
     :param file: файл - изображение
-    :return: путь относительно static для сохранения в БД
+    :return: путь временного файла, sha256 содержимого и размер в байтах
     """
     # Проверка формата загружаемого файла
-    allowed_image(image_name=file.filename)
+    allowed_image(image_name=image_filename(file=file))
+    # Размер известен заранее - отказываем без копирования
+    check_image_size(size=file.size)
 
     logger.debug("Сохранение изображения к твиту")
-    # Сохраняем изображения в директорию по дате добавления твита
-    contents = file.file.read()
-    path = os.path.join("static", "images", f"{file.filename}")
-    path_to_bd = os.path.join(f"{file.filename}")
 
-    # Сохраняем изображение
-    async with aiofiles.open(path, mode="wb") as f:
-        await f.write(contents)
+    temp_path = os.path.join(MEDIA_FOLDER, f".{uuid.uuid4().hex}.part")
+    content_hash = hashlib.sha256()
+    size = 0
+
+    try:
+        async with aiofiles.open(temp_path, mode="wb") as f:
+            while chunk := await file.read(MEDIA_CHUNK_SIZE):
+                size += len(chunk)
+                check_image_size(size=size)
+
+                content_hash.update(chunk)
+                await f.write(chunk)
+
+    except BaseException:
+        await discard_temp_image(temp_path=temp_path)
+
+        raise
+
+    return temp_path, content_hash.hexdigest(), size
+
+
+async def place_image(temp_path: str, path_media: str) -> None:
+    """
+    Перенос временного файла на место изображения.
+    Если файл с таким содержимым уже сохранен, временный файл удаляется.
+    Переименование в пределах файловой системы атомарно: файл по итоговому
+    пути либо отсутствует, либо записан полностью
+    :param temp_path: путь временного файла
+    :param path_media: путь изображения относительно MEDIA_FOLDER
+    :return: None
+    """
+    path = os.path.join(MEDIA_FOLDER, path_media)
+
+    try:
+        if await aiofiles.os.path.exists(path):
+            logger.debug(f"Изображение {path_media} уже сохранено")
+
+            await discard_temp_image(temp_path=temp_path)
+            return
+
+        await aiofiles.os.makedirs(os.path.dirname(path), exist_ok=True)
+        await aiofiles.os.replace(temp_path, path)
+
+    except BaseException:
+        await discard_temp_image(temp_path=temp_path)
 
-    # Возвращаем очищенную строку для записи в БД
-    return path_to_bd
+        raise
 
 
-async def delete_images(images: List[Image]) -> None:
+async def discard_temp_image(temp_path: str) -> None:
     """
-    Удаление из файловой системы изображений
-    :param images: объекты изображений из БД
+    Удаление временного файла изображения
+    :param temp_path: путь временного файла
     :return: None
     """
-    logger.debug("Удаление изображений из файловой системы")
+    with suppress(FileNotFoundError):
+        await aiofiles.os.remove(temp_path)
 
-    for img in images:
+
+async def lock_media(key: str, session: AsyncSession) -> None:
+    """
+    Блокировка файла изображения до конца транзакции: сохранение и удаление
+    файла с одним содержимым выполняются по очереди
+    :param key: sha256 содержимого (путь - для изображений без хэша)
+    :param session: асинхронная сессия
+    :return: None
+    """
+    await session.execute(select(func.pg_advisory_xact_lock(func.hashtext(key))))
+
+
+def media_files(path_media: str, content_hash: str | None) -> List[str]:
+    """
+    Файлы изображения: оригинал и уменьшенные копии
+    :param path_media: путь оригинала относительно MEDIA_FOLDER
+    :param content_hash: sha256 содержимого (None - копий нет)
+    :return: пути относительно MEDIA_FOLDER
+    """
+    files = [path_media]
+
+    if content_hash:
+        files.extend(variant_path(content_hash=content_hash, name=name)
+                     for name in MEDIA_VARIANTS)
+
+    return files
+
+
+def remove_media_files(paths: List[str]) -> List[str]:
+    """
+    Удаление файлов изображений (блокирующая функция,
+    выполняется в отдельном потоке)
+    :param paths: пути относительно MEDIA_FOLDER
+    :return: пути файлов, которые не удалось удалить
+    """
+    failed = []
+
+    for path in paths:
         try:
-            # Удаляем каждое изображение из файловой системы
-            os.remove(os.path.join("static", "images", img.path_media))
-            logger.debug(f"Изображение №{img.id} - {img.path_media} удалено")
+            os.remove(os.path.join(MEDIA_FOLDER, path))
+            logger.debug(f"Файл {path} удален")
 
         except FileNotFoundError:
-            logger.error(f"Директория: {img.path_media} не найдена")
+            pass
+
+        except OSError as exc:
+            logger.error(f"Ошибка удаления файла {path}: {exc}")
+            failed.append(path)
 
-    logger.info("Все изображения удалены")
+    return failed
@@ -0,0 +1,75 @@
+import os
+from typing import Dict, List, Tuple
+
+from PIL import Image as PILImage
+from PIL import ImageOps
+
+# Функции модуля выполняются в процессах обработки изображений,
+# поэтому модуль не импортирует приложение и БД
+
+
+def variant_path(content_hash: str, name: str) -> str:
+    """
+    Путь уменьшенной копии относительно директории изображений
+    (рядом с оригиналом, имя по хэшу оригинала)
+    :param content_hash: sha256 оригинала
+    :param name: название варианта
+    :return: путь вида ab/cd/abcd....thumb.webp
+    """
+    return os.path.join(content_hash[:2],
+                        content_hash[2:4],
+                        f"{content_hash}.{name}.webp",
+                        )
+
+
+def make_variants(folder: str,
+                  path_media: str,
+                  content_hash: str,
+                  variants: Dict[str, int],
+                  quality: int,
+                  ) -> List[Tuple[str, str, int, int, int]]:
+    """
+    Создание уменьшенных копий изображения в формате WebP.
+    Копия, уже созданная для того же содержимого, не пересоздается
+    :param folder: директория изображений
+    :param path_media: путь оригинала относительно директории
+    :param content_hash: sha256 оригинала
+    :param variants: название варианта -> максимальная сторона в пикселях
+    :param quality: качество WebP
+    :return: название, путь, ширина, высота и размер каждой копии
+    """
+    result = []
+
+    with PILImage.open(os.path.join(folder, path_media)) as original:
+        # Учитываем ориентацию из EXIF, анимацию не сохраняем (первый кадр)
+        source = ImageOps.exif_transpose(original)
+        source = source.convert("RGBA" if source.has_transparency_data
+                                else "RGB")
+
+        for name, max_side in variants.items():
+            path = variant_path(content_hash=content_hash, name=name)
+            full_path = os.path.join(folder, path)
+
+            if os.path.exists(full_path):
+                with PILImage.open(full_path) as existing:
+                    width, height = existing.size
+            else:
+                image = source.copy()
+                image.thumbnail((max_side, max_side), PILImage.Resampling.LANCZOS)
+                width, height = image.size
+
+                # Запись во временный файл и атомарное переименование
+                temp_path = f"{full_path}.{os.getpid()}.part"
+
+                try:
+                    image.save(temp_path, format="WEBP", quality=quality)
+                    os.replace(temp_path, full_path)
+                finally:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+
+            result.append(
+                (name, path, width, height, os.path.getsize(full_path))
+            )
+
+    return result
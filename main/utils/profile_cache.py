@@ -0,0 +1,175 @@
+import asyncio
+from typing import Tuple
+
+from loguru import logger
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
+
+from main.config import (DB_REPLICA_STALENESS,
+                         DB_REPLICA_URLS,
+                         PROFILE_CACHE_MAXSIZE,
+                         PROFILE_CACHE_TTL,)
+from main.models.users import User
+from main.utils.cache import CacheBackend, TTLCache, get_cache_backend
+from main.utils.etag import make_etag
+
+# id пользователей, профили которых сбрасываются после коммита сессии
+_INVALIDATE_KEY = "profile_cache_invalidate"
+
+
+class ProfileCache:
+    """
+    Кэш профилей пользователей: id -> готовый JSON ответа и его ETag.
+    Первый уровень - память процесса, второй (необязательный) - общий
+    для воркеров кэш.
+    Пока реплики могут не успеть получить изменения профиля (staleness
+    секунд после сброса), прочитанный профиль в кэш не записывается
+    """
+
+    def __init__(self,
+                 local: TTLCache,
+                 shared: CacheBackend | None = None,
+                 staleness: float = 0,
+                 ) -> None:
+        self.local = local
+        self.shared = shared
+        self.staleness = staleness
+        self._changed = TTLCache(maxsize=local.maxsize, ttl=staleness)
+
+    @staticmethod
+    def make_key(user_id: int) -> str:
+        """
+        Ключ кэша профиля
+        """
+        return f"profile:{user_id}"
+
+    async def get(self, user_id: int) -> Tuple[str, str] | None:
+        """
+        Профиль из кэша
+        :param user_id: id пользователя
+        :return: JSON ответа и ETag | None - профиля нет в кэше
+        """
+        key = self.make_key(user_id)
+        profile = self.local.get(key)
+
+        if profile is None and self.shared is not None:
+            payload = await self.shared.get(key)
+
+            if payload is not None:
+                profile = (payload, make_etag(payload))
+                self.local.set(key, profile)
+
+        return profile
+
+    async def set(self, user_id: int, payload: str) -> Tuple[str, str]:
+        """
+        Запись профиля в кэш
+        :param user_id: id пользователя
+        :param payload: JSON ответа
+        :return: JSON ответа и ETag
+        """
+        key = self.make_key(user_id)
+        profile = (payload, make_etag(payload))
+
+        if await self._recently_changed(key):
+            return profile
+
+        self.local.set(key, profile)
+
+        if self.shared is not None:
+            await self.shared.set(key, payload, self.local.ttl)
+
+        return profile
+
+    def invalidate(self, user_id: int) -> None:
+        """
+        Сброс профиля. Из общего кэша запись удаляется в фоне
+        """
+        key = self.make_key(user_id)
+        self.local.delete(key)
+
+        if self.staleness:
+            self._changed.set(key, True)
+
+        if self.shared is not None:
+            try:
+                asyncio.get_running_loop().create_task(self._invalidate_shared(key))
+            except RuntimeError:
+                # Нет запущенного цикла событий (скрипты, миграции)
+                asyncio.run(self._invalidate_shared(key))
+
+    def clear(self) -> None:
+        """
+        Очистка кэша процесса
+        """
+        self.local.clear()
+        self._changed.clear()
+
+    async def _invalidate_shared(self, key: str) -> None:
+        if self.shared is None:
+            return
+
+        await self.shared.delete(key)
+
+        if self.staleness:
+            await self.shared.set(key + ":changed", "1", self.staleness)
+
+    async def _recently_changed(self, key: str) -> bool:
+        """
+        Профиль сброшен недавно: реплика могла вернуть его прежнюю версию
+        """
+        if not self.staleness:
+            return False
+
+        if self._changed.get(key) is not None:
+            return True
+
+        return (self.shared is not None
+                and await self.shared.get(key + ":changed") is not None)
+
+
+profile_cache = ProfileCache(
+    local=TTLCache(maxsize=PROFILE_CACHE_MAXSIZE, ttl=PROFILE_CACHE_TTL),
+    shared=get_cache_backend(),
+    staleness=DB_REPLICA_STALENESS if DB_REPLICA_URLS else 0,
+)
+
+
+def schedule_invalidation(session: AsyncSession | Session, *user_ids: int) -> None:
+    """
+    Сброс профилей сразу и повторно после коммита, чтобы запрос, успевший
+    закэшировать старый профиль до коммита, не оставил его в кэше
+    :param session: сессия, в которой изменяются подписки
+    :param user_ids: id пользователей, профили которых изменились
+    """
+    for user_id in user_ids:
+        profile_cache.invalidate(user_id)
+
+    session.info.setdefault(_INVALIDATE_KEY, set()).update(user_ids)
+
+
+@event.listens_for(User, "after_update")
+def _user_updated(mapper, connection, target: User) -> None:
+    """
+    Смена имени пользователя. В списках подписок других профилей
+    прежнее имя остается до истечения PROFILE_CACHE_TTL
+    """
+    if inspect(target).attrs.username.history.has_changes():
+        logger.debug(f"Сброс кэша профиля пользователя {target.id}")
+
+        session = object_session(target)
+
+        if session is not None:
+            schedule_invalidation(session, target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _session_committed(session: Session) -> None:
+    for user_id in session.info.pop(_INVALIDATE_KEY, ()):
+        profile_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _session_rolled_back(session: Session) -> None:
+    session.info.pop(_INVALIDATE_KEY, None)
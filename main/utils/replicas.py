@@ -0,0 +1,206 @@
+import asyncio
+import itertools
+import time
+from typing import Dict, List, Sequence
+
+from loguru import logger
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import ORMExecuteState, Session
+
+from main.config import (DB_REPLICA_CHECK_INTERVAL,
+                         DB_REPLICA_MAX_LAG,
+                         DB_REPLICA_STALENESS,
+                         DB_REPLICA_URLS,)
+from main.database import async_session_maker, create_engine
+from main.utils.cache import CacheBackend, TTLCache, get_cache_backend
+
+# Владелец сессии и признак изменения данных в текущей транзакции
+_USER_KEY = "replica_user_id"
+_WROTE_KEY = "replica_wrote"
+
+# Кол-во пользователей, недавно изменявших данные, в памяти процесса
+_PINNED_MAXSIZE = 100000
+
+# Отставание реплики в секундах (на основной БД - 0)
+_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_is_in_recovery() "
+    "THEN coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0) "
+    "ELSE 0 END"
+)
+
+
+class ReplicaRouter:
+    """
+    Выбор БД для запросов на чтение: запросы распределяются по репликам
+    по очереди. Пользователь, недавно изменявший данные, читает с основной
+    БД, пока реплики могут не успеть получить его изменения.
+    Недоступные и отстающие реплики временно исключаются, если доступных
+    реплик нет - используется основная БД
+    """
+
+    def __init__(self,
+                 engines: Sequence[AsyncEngine],
+                 staleness: float,
+                 max_lag: float,
+                 check_interval: float,
+                 shared: CacheBackend | None = None,
+                 ) -> None:
+        self.engines = list(engines)
+        self.staleness = staleness
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.shared = shared
+        self._pinned = TTLCache(maxsize=_PINNED_MAXSIZE, ttl=staleness)
+        self._down_until: Dict[int, float] = {}
+        self._checked_at: Dict[int, float] = {}
+        self._turn = itertools.count()
+
+    @staticmethod
+    def make_key(user_id: int) -> str:
+        """
+        Ключ кэша пользователя, недавно изменявшего данные
+        """
+        return f"replica_pin:{user_id}"
+
+    def pin(self, user_id: int) -> None:
+        """
+        Чтение пользователя с основной БД в течение окна staleness.
+        В общий кэш (для других воркеров) отметка записывается в фоне
+        """
+        key = self.make_key(user_id)
+        self._pinned.set(key, True)
+
+        if self.shared is not None:
+            try:
+                asyncio.get_running_loop().create_task(
+                    self.shared.set(key, "1", self.staleness)
+                )
+            except RuntimeError:
+                # Нет запущенного цикла событий (скрипты, миграции)
+                pass
+
+    async def is_pinned(self, user_id: int) -> bool:
+        """
+        Проверка, что пользователь недавно изменял данные
+        """
+        key = self.make_key(user_id)
+
+        if self._pinned.get(key) is not None:
+            return True
+
+        if self.shared is not None and await self.shared.get(key) is not None:
+            self._pinned.set(key, True)
+            return True
+
+        return False
+
+    def mark_down(self, index: int, reason: str) -> None:
+        """
+        Исключение реплики на check_interval секунд
+        """
+        logger.warning(f"Реплика №{index} исключена: {reason}")
+
+        self._down_until[index] = time.monotonic() + self.check_interval
+
+    def available(self) -> List[int]:
+        """
+        Номера доступных реплик в порядке очереди
+        """
+        if not self.engines:
+            return []
+
+        now = time.monotonic()
+        start = next(self._turn) % len(self.engines)
+        order = list(range(start, len(self.engines))) + list(range(start))
+
+        return [
+            index for index in order if self._down_until.get(index, 0) <= now
+        ]
+
+    async def open_session(self) -> AsyncSession | None:
+        """
+        Сессия на доступной реплике. Соединение берется сразу, чтобы
+        недоступная реплика была заменена до выполнения запросов маршрута
+        :return: сессия | None - реплик нет или все недоступны
+        """
+        for index in self.available():
+            session = async_session_maker(bind=self.engines[index])
+
+            try:
+                connection = await session.connection()
+
+                if self._lag_check_due(index):
+                    lag = await connection.scalar(_LAG_QUERY)
+                    self._checked_at[index] = time.monotonic()
+
+                    if lag > self.max_lag:
+                        await session.close()
+                        self.mark_down(index, f"отставание {lag:.1f} сек.")
+                        continue
+            except (OSError, SQLAlchemyError) as exc:
+                await session.close()
+                self.mark_down(index, repr(exc))
+                continue
+
+            return session
+
+        return None
+
+    def _lag_check_due(self, index: int) -> bool:
+        """
+        Пора ли проверить отставание реплики
+        """
+        if not self.max_lag:
+            return False
+
+        checked_at = self._checked_at.get(index)
+
+        return (checked_at is None
+                or time.monotonic() - checked_at >= self.check_interval)
+
+
+replica_router = ReplicaRouter(
+    engines=[create_engine(url) for url in DB_REPLICA_URLS],
+    staleness=DB_REPLICA_STALENESS,
+    max_lag=DB_REPLICA_MAX_LAG,
+    check_interval=DB_REPLICA_CHECK_INTERVAL,
+    shared=get_cache_backend(),
+)
+
+
+def set_session_user(session: AsyncSession, user_id: int) -> None:
+    """
+    Привязка сессии к пользователю: после коммита изменений в этой сессии
+    пользователь читает с основной БД
+    """
+    session.info[_USER_KEY] = user_id
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _statement_executed(orm_execute_state: ORMExecuteState) -> None:
+    if (orm_execute_state.is_insert
+            or orm_execute_state.is_update
+            or orm_execute_state.is_delete):
+        orm_execute_state.session.info[_WROTE_KEY] = True
+
+
+@event.listens_for(Session, "after_flush")
+def _session_flushed(session: Session, flush_context) -> None:
+    session.info[_WROTE_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _session_committed(session: Session) -> None:
+    user_id = session.info.get(_USER_KEY)
+
+    if (session.info.pop(_WROTE_KEY, False)
+            and user_id is not None
+            and replica_router.engines):
+        replica_router.pin(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _session_rolled_back(session: Session) -> None:
+    session.info.pop(_WROTE_KEY, None)
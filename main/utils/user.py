@@ -1,20 +1,27 @@
 from http import HTTPStatus
+from typing import AsyncGenerator
 
-from fastapi import Security
+from fastapi import Depends, Security
 from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from main.database import async_session_maker
-from main.models.users import User
+from main.database import get_async_session
+from main.schemas import FollowingPrincipal, Principal, UserInfoSchema
 from main.services.user import UserService
+from main.utils.auth_cache import auth_cache
 from main.utils.exeptions import SpecialException
+from main.utils.replicas import replica_router, set_session_user
 from main.utils.token import TOKEN
 
 
-async def get_current_user(token: str = Security(TOKEN)) -> User | None:
+async def authenticate(token: str | None, session: AsyncSession) -> Principal:
     """
-    Поиск и возврат пользователя из базы данных по токену из header
+    Пользователь по токену (id и имя). Результат кэшируется,
+    повторные запросы с тем же токеном не обращаются к БД
+    :param token: api-key из header
+    :param session: асинхронная сессия
+    :return: id и имя пользователя
     """
-
     if token is None:
         logger.error("Токен не найден в header")
 
@@ -23,16 +30,106 @@ async def get_current_user(token: str = Security(TOKEN)) -> User | None:
             detail="Valid api-token token is missing",
         )
 
-    async with async_session_maker() as session:
-        # Поиск пользователя
-        current_user = await UserService.get_user_by_key(token=token,
-                                                         session=session,
-                                                         )
+    principal = await auth_cache.get(api_key=token)
+
+    if principal is None:
+        principal = await UserService.get_principal_by_key(token=token,
+                                                           session=session,
+                                                           )
 
-        if current_user is None:
+        if principal is None:
             raise SpecialException(
                 status_code=HTTPStatus.UNAUTHORIZED,  # 401
                 detail="Sorry. Wrong api-key token. This user does not exist",
             )
 
-        return current_user
+        await auth_cache.set(api_key=token, principal=principal)
+
+    return principal
+
+
+async def get_current_principal(
+    token: str = Security(TOKEN),
+    session: AsyncSession = Depends(get_async_session),
+) -> Principal:
+    """
+    Поиск пользователя по токену из header: id и имя без связанных объектов.
+    Результат кэшируется, повторные запросы с тем же токеном не обращаются к БД.
+
+    Сессия берется из зависимости get_async_session: FastAPI создает ее один
+    раз на запрос, поэтому аутентификация и маршрут работают в одной сессии
+    (одно соединение из пула на запрос)
+
+    Маршруты запрашивают только нужную им часть данных о пользователе:
+    get_current_principal - id и имя, get_current_following - плюс id подписок,
+    get_current_user - профиль с последними подписками и подписчиками
+    """
+    principal = await authenticate(token=token, session=session)
+
+    # После изменений в сессии запроса пользователь
+    # некоторое время читает с основной БД
+    set_session_user(session=session, user_id=principal.id)
+
+    return principal
+
+
+async def get_read_session(
+    principal: Principal = Depends(get_current_principal),
+    session: AsyncSession = Depends(get_async_session),
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Сессия для маршрутов, которые только читают данные: на реплике, если
+    реплика доступна и пользователь недавно не изменял данные.
+    Иначе - общая сессия запроса на основной БД (соединение для нее
+    берется из пула только при первом запросе)
+    """
+    replica_session = None
+
+    if not await replica_router.is_pinned(user_id=principal.id):
+        replica_session = await replica_router.open_session()
+
+    if replica_session is None:
+        yield session
+        return
+
+    async with replica_session:
+        yield replica_session
+
+
+async def get_current_following(
+    principal: Principal = Depends(get_current_principal),
+    session: AsyncSession = Depends(get_async_session),
+) -> FollowingPrincipal:
+    """
+    Данные текущего пользователя и id пользователей, на которых он подписан.
+    Сами пользователи и список подписчиков не загружаются
+    """
+    following_ids = await UserService.get_following_ids(user_id=principal.id,
+                                                        session=session,
+                                                        )
+
+    return FollowingPrincipal(id=principal.id,
+                              username=principal.username,
+                              following_ids=following_ids,
+                              )
+
+
+async def get_current_user(
+    principal: Principal = Depends(get_current_principal),
+    session: AsyncSession = Depends(get_read_session),
+) -> UserInfoSchema:
+    """
+    Профиль текущего пользователя: счетчики и последние подписки
+    и подписчики (читается с реплики)
+    """
+    current_user = await UserService.get_profile(user_id=principal.id,
+                                                 session=session,
+                                                 )
+
+    if current_user is None:
+        raise SpecialException(
+            status_code=HTTPStatus.UNAUTHORIZED,  # 401
+            detail="Sorry. Wrong api-key token. This user does not exist",
+        )
+
+    return current_user
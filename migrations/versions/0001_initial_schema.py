@@ -0,0 +1,84 @@
+"""initial schema
+
+Схема БД до появления миграций (таблицы, созданные create_all).
+Для существующей БД миграция не применяется, а отмечается:
+    alembic stamp 0001
+Изменения схемы, сделанные до появления миграций в коде, но отсутствующие
+в такой БД, добавляет следующая ревизия (0001a)
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("username", sa.String(length=60), nullable=False),
+        sa.Column("api_key", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
+
+    op.create_table(
+        "tweets",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("tweet_data", sa.String(length=280), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("likes_count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_tweets_id", "tweets", ["id"])
+
+    op.create_table(
+        "user_to_user",
+        sa.Column("followers_id", sa.Integer(), nullable=False),
+        sa.Column("following_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["followers_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["following_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("followers_id", "following_id"),
+    )
+
+    op.create_table(
+        "images",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("tweet_id", sa.Integer(), nullable=True),
+        sa.Column("path_media", sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(["tweet_id"], ["tweets.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_images_id", "images", ["id"])
+
+    op.create_table(
+        "likes",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("tweets_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["tweets_id"], ["tweets.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_likes_id", "likes", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_table("likes")
+    op.drop_table("images")
+    op.drop_table("user_to_user")
+    op.drop_table("tweets")
+    op.drop_table("users")
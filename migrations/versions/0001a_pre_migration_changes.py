@@ -0,0 +1,116 @@
+"""pre-migration changes
+
+Изменения схемы, сделанные до появления миграций: признак раскладки твита
+по лентам (tweets.fanned_out) и обязательная дата твита, материализованные
+ленты (timelines), хэш, размер и дата загрузки изображений, уменьшенные
+копии изображений (image_variants), уникальность лайка пользователя.
+Повторные лайки удаляются, после миграции счетчики лайков сверяются:
+python -m main.commands.reconcile_likes
+
+Revision ID: 0001a
+Revises: 0001
+Create Date: 2026-10-19 10:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0001a"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Текущее время в UTC (даты в приложении хранятся в UTC без часового пояса)
+UTC_NOW = sa.text("timezone('utc', now())")
+
+
+def upgrade() -> None:
+    op.execute(
+        sa.update(sa.table("tweets", sa.column("created_at")))
+        .where(sa.column("created_at").is_(None))
+        .values(created_at=UTC_NOW)
+    )
+    op.alter_column("tweets", "created_at", nullable=False)
+    op.add_column("tweets",
+                  sa.Column("fanned_out",
+                            sa.Boolean(),
+                            server_default="false",
+                            nullable=False,
+                            ),
+                  )
+
+    # Дата загрузки существующих изображений - время миграции
+    op.add_column("images",
+                  sa.Column("content_hash", sa.String(length=64), nullable=True),
+                  )
+    op.add_column("images", sa.Column("size", sa.BigInteger(), nullable=True))
+    op.add_column("images",
+                  sa.Column("created_at",
+                            sa.DateTime(),
+                            server_default=UTC_NOW,
+                            nullable=False,
+                            ),
+                  )
+    op.alter_column("images", "created_at", server_default=None)
+    op.create_index("ix_images_content_hash", "images", ["content_hash"])
+
+    # Остается первый лайк пользователя
+    op.execute(
+        """
+        DELETE FROM likes
+        USING likes AS first
+        WHERE likes.user_id = first.user_id
+          AND likes.tweets_id = first.tweets_id
+          AND likes.id > first.id
+        """
+    )
+    op.create_unique_constraint("uq_likes_user_id_tweets_id",
+                                "likes",
+                                ["user_id", "tweets_id"],
+                                )
+
+    op.create_table(
+        "timelines",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("tweet_id", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["tweet_id"], ["tweets.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user_id", "tweet_id"),
+    )
+    op.create_index("ix_timelines_user_id_created_at_tweet_id",
+                    "timelines",
+                    ["user_id", "created_at", "tweet_id"],
+                    )
+
+    op.create_table(
+        "image_variants",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("image_id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=32), nullable=False),
+        sa.Column("path_media", sa.String(), nullable=False),
+        sa.Column("width", sa.Integer(), nullable=False),
+        sa.Column("height", sa.Integer(), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(["image_id"], ["images.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("image_id",
+                            "name",
+                            name="uq_image_variants_image_id_name",
+                            ),
+    )
+    op.create_index("ix_image_variants_image_id", "image_variants", ["image_id"])
+
+
+def downgrade() -> None:
+    op.drop_table("image_variants")
+    op.drop_table("timelines")
+    op.drop_constraint("uq_likes_user_id_tweets_id", "likes", type_="unique")
+    op.drop_index("ix_images_content_hash", table_name="images")
+    op.drop_column("images", "created_at")
+    op.drop_column("images", "size")
+    op.drop_column("images", "content_hash")
+    op.drop_column("tweets", "fanned_out")
+    op.alter_column("tweets", "created_at", nullable=True)
@@ -0,0 +1,73 @@
+"""hot path indexes
+
+Индексы для запросов сервисного слоя: аутентификация по api-key,
+подписчики пользователя, лента (твиты авторов по дате), лайки твита,
+изображения твита, проверка ссылок на файл и поиск брошенных изображений.
+Индексы создаются без блокировки записи в таблицы (CONCURRENTLY).
+Перед созданием уникального индекса по api_key дубликаты ключей
+должны быть устранены
+
+Revision ID: 0002
+Revises: 0001a
+Create Date: 2026-10-18 12:30:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0002"
+down_revision: Union[str, None] = "0001a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Название, таблица, колонки, уникальность, условие частичного индекса
+INDEXES = (
+    ("ix_users_api_key", "users", ["api_key"], True, None),
+    ("ix_user_to_user_following_id_followers_id",
+     "user_to_user",
+     ["following_id", "followers_id"],
+     False,
+     None,
+     ),
+    ("ix_tweets_user_id_created_at_id",
+     "tweets",
+     ["user_id", "created_at", "id"],
+     False,
+     None,
+     ),
+    ("ix_likes_tweets_id_id", "likes", ["tweets_id", "id"], False, None),
+    ("ix_images_tweet_id", "images", ["tweet_id"], False, None),
+    ("ix_images_path_media", "images", ["path_media"], False, None),
+    ("ix_images_orphans_created_at",
+     "images",
+     ["created_at"],
+     False,
+     sa.text("tweet_id IS NULL"),
+     ),
+)
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY не выполняется внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique, where in INDEXES:
+            op.create_index(name,
+                            table,
+                            columns,
+                            unique=unique,
+                            postgresql_where=where,
+                            postgresql_concurrently=True,
+                            if_not_exists=True,
+                            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, *_ in reversed(INDEXES):
+            op.drop_index(name,
+                          table_name=table,
+                          postgresql_concurrently=True,
+                          if_exists=True,
+                          )
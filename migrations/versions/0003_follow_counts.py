@@ -0,0 +1,51 @@
+"""follow counts
+
+Счетчики подписчиков и подписок пользователей (users.followers_count,
+users.following_count), заполняются по таблице подписок.
+Повторная сверка: python -m main.commands.reconcile_follows
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 21:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("users",
+                  sa.Column("followers_count",
+                            sa.Integer(),
+                            server_default="0",
+                            nullable=False,
+                            ),
+                  )
+    op.add_column("users",
+                  sa.Column("following_count",
+                            sa.Integer(),
+                            server_default="0",
+                            nullable=False,
+                            ),
+                  )
+    op.execute(
+        """
+        UPDATE users
+        SET followers_count = (SELECT count(*) FROM user_to_user
+                               WHERE user_to_user.following_id = users.id),
+            following_count = (SELECT count(*) FROM user_to_user
+                               WHERE user_to_user.followers_id = users.id)
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("users", "following_count")
+    op.drop_column("users", "followers_count")
@@ -0,0 +1,64 @@
+"""feed order
+
+Порядок ленты по популярности и по рейтингу: вычисляемая колонка
+tweets.score (log(likes_count) + время публикации / 45000 сек.) и индексы
+твитов автора по likes_count и по score.
+Добавление хранимой вычисляемой колонки перезаписывает таблицу tweets
+под блокировкой, на большой таблице миграцию следует выполнять
+в период низкой нагрузки. Индексы создаются без блокировки записи
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 23:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Название, колонки
+INDEXES = (
+    ("ix_tweets_user_id_likes_count_id", ["user_id", "likes_count", "id"]),
+    ("ix_tweets_user_id_score_id", ["user_id", "score", "id"]),
+)
+
+
+def upgrade() -> None:
+    op.add_column("tweets",
+                  sa.Column("score",
+                            sa.Float(),
+                            sa.Computed("log(greatest(likes_count, 1)) "
+                                        "+ extract(epoch FROM created_at) / 45000",
+                                        persisted=True,
+                                        ),
+                            nullable=True,
+                            ),
+                  )
+
+    # CREATE INDEX CONCURRENTLY не выполняется внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.create_index(name,
+                            "tweets",
+                            columns,
+                            postgresql_concurrently=True,
+                            if_not_exists=True,
+                            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INDEXES):
+            op.drop_index(name,
+                          table_name="tweets",
+                          postgresql_concurrently=True,
+                          if_exists=True,
+                          )
+
+    op.drop_column("tweets", "score")
@@ -0,0 +1,30 @@
+"""last activity
+
+Время последней активности пользователя, влияющей на ленты подписчиков
+(users.last_activity_at): твиты и подписки. Используется в версии ленты
+(ETag GET /api/tweets). Для существующих пользователей не заполняется
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 23:30:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("users",
+                  sa.Column("last_activity_at", sa.DateTime(), nullable=True),
+                  )
+
+
+def downgrade() -> None:
+    op.drop_column("users", "last_activity_at")
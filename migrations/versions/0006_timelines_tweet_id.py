@@ -0,0 +1,40 @@
+"""timelines tweet_id
+
+Индекс записей материализованных лент по id твита: удаление твита
+из лент (TimelineService.retract и каскадное удаление вместе с твитом)
+выполняется по индексу, а не проходом по всей таблице timelines.
+Индекс создается без блокировки записи
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 10:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY не выполняется внутри транзакции
+    with op.get_context().autocommit_block():
+        op.create_index("ix_timelines_tweet_id",
+                        "timelines",
+                        ["tweet_id"],
+                        postgresql_concurrently=True,
+                        if_not_exists=True,
+                        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_timelines_tweet_id",
+                      table_name="timelines",
+                      postgresql_concurrently=True,
+                      if_exists=True,
+                      )
@@ -6,6 +6,7 @@ from httpx import AsyncClient
 
 from main.app import app
 from main.models.users import User
+from main.services.follower import FollowerService
 from tests.database import Base, async_session_maker, engine_test
 
 
@@ -60,4 +61,7 @@ async def users():
         session.add_all([user_1, user_2, user_3, user_4, user_5])
         await session.commit()
 
+        # Подписки добавлены в обход FollowerService
+        await FollowerService.reconcile_counts(session=session)
+
         return user_1, user_2, user_3, user_4, user_5
@@ -1,5 +1,36 @@
+from typing import List, Tuple
+
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import event
+
+from main.config import FOLLOWS_BULK_MAX_SIZE
+from main.database import engine
+from main.models.users import User
+from main.services.follower import FollowerService
+from tests.database import async_session_maker, engine_test
+
+
+@pytest.fixture(scope="session")
+async def bulk_users() -> Tuple[User, List[User]]:
+    """
+    Пользователь для массовой подписки (уже подписан на первого
+    из пользователей) и пользователи для подписки
+    """
+    async with async_session_maker() as session:
+        follower = User(username="bulk-follower", api_key="bulk-follower")
+        targets = [
+            User(username=f"bulk-target-{i}", api_key=f"bulk-target-{i}")
+            for i in range(12)
+        ]
+        follower.following.append(targets[0])
+
+        session.add_all([follower, *targets])
+        await session.commit()
+
+        await FollowerService.reconcile_counts(session=session)
+
+        return follower, targets
 
 
 @pytest.mark.follower
@@ -131,3 +162,149 @@ class TestFollowers:
             "error_type": "422",
             "error_message": "You can't subscribe to yourself",
         }
+
+    async def test_follow_uses_single_connection(
+        self,
+        client: AsyncClient,
+    ) -> None:
+        """
+        Тестирование того, что аутентификация и маршрут используют одну
+        сессию: на запрос подписки и отписки берется одно соединение
+        """
+        checkouts: List[int] = []
+
+        def on_checkout(*args) -> None:
+            checkouts.append(1)
+
+        # Соединения приложения могут браться и из основного движка
+        engines = (engine.sync_engine, engine_test.sync_engine)
+
+        for target in engines:
+            event.listen(target, "checkout", on_checkout)
+        try:
+            for method in (client.post, client.delete):
+                checkouts.clear()
+                resp = await method("/api/users/5/follow",
+                                    headers={"api-key": "test-user3"},
+                                    )
+
+                assert resp.json() == {"result": True}
+                assert len(checkouts) == 1
+        finally:
+            for target in engines:
+                event.remove(target, "checkout", on_checkout)
+
+    async def test_bulk_follow(
+        self,
+        client: AsyncClient,
+        bulk_users: Tuple[User, List[User]],
+    ) -> None:
+        """
+        Тестирование массовой подписки и отписки с результатом для каждого id
+        """
+        follower, targets = bulk_users
+        headers = {"api-key": follower.api_key}
+        user_ids = [targets[0].id, targets[1].id, 999999, follower.id,
+                    targets[2].id,
+                    ]
+
+        resp = await client.post("/api/users/follow",
+                                 json={"user_ids": user_ids},
+                                 headers=headers,
+                                 )
+
+        assert resp.json() == {
+            "result": True,
+            "users": [
+                {"user_id": targets[0].id, "status": "already_following"},
+                {"user_id": targets[1].id, "status": "followed"},
+                {"user_id": 999999, "status": "not_found"},
+                {"user_id": follower.id, "status": "self"},
+                {"user_id": targets[2].id, "status": "followed"},
+            ],
+        }
+
+        resp = await client.get(f"/api/users/{follower.id}", headers=headers)
+        assert resp.json()["user"]["following_count"] == 3
+
+        resp = await client.get(f"/api/users/{targets[1].id}", headers=headers)
+        assert resp.json()["user"]["followers_count"] == 1
+
+        resp = await client.request("DELETE",
+                                    "/api/users/follow",
+                                    json={"user_ids": [targets[1].id,
+                                                       targets[2].id,
+                                                       targets[3].id,
+                                                       999999,
+                                                       ]},
+                                    headers=headers,
+                                    )
+
+        assert [user["status"] for user in resp.json()["users"]] == [
+            "unfollowed", "unfollowed", "not_following", "not_found",
+        ]
+
+        resp = await client.get(f"/api/users/{follower.id}", headers=headers)
+        assert resp.json()["user"]["following_count"] == 1
+        assert [user["id"] for user in resp.json()["user"]["following"]] == [
+            targets[0].id
+        ]
+
+    async def test_bulk_follow_queries_count(
+        self,
+        client: AsyncClient,
+        bulk_users: Tuple[User, List[User]],
+    ) -> None:
+        """
+        Тестирование того, что кол-во запросов массовой подписки
+        не зависит от кол-ва пользователей
+        """
+        follower, targets = bulk_users
+        statements: List[str] = []
+
+        def count_statement(*args) -> None:
+            statements.append(args[2])
+
+        async def count_follow_statements(user_ids: List[int]) -> int:
+            statements.clear()
+            event.listen(engine_test.sync_engine,
+                         "before_cursor_execute",
+                         count_statement,
+                         )
+            try:
+                resp = await client.post("/api/users/follow",
+                                         json={"user_ids": user_ids},
+                                         headers={"api-key": follower.api_key},
+                                         )
+            finally:
+                event.remove(engine_test.sync_engine,
+                             "before_cursor_execute",
+                             count_statement,
+                             )
+
+            assert {user["status"] for user in resp.json()["users"]} == {
+                "followed"
+            }
+
+            return len(statements)
+
+        few = await count_follow_statements([targets[4].id])
+        many = await count_follow_statements([user.id for user in targets[5:]])
+
+        assert few == many
+
+    @pytest.mark.parametrize("size", [0, FOLLOWS_BULK_MAX_SIZE + 1])
+    async def test_bulk_follow_size(
+        self,
+        client: AsyncClient,
+        size: int,
+    ) -> None:
+        """
+        Тестирование вывода ошибки при пустом или слишком большом списке id
+        """
+        resp = await client.post("/api/users/follow",
+                                 json={"user_ids": list(range(1, size + 1))},
+                                 headers={"api-key": "test-user1"},
+                                 )
+
+        assert resp.status_code == 422
@@ -1,9 +1,20 @@
+import hashlib
+import io
 import os
 from http import HTTPStatus
 from pathlib import Path
 
 import pytest
+from fastapi import UploadFile
 from httpx import AsyncClient
+from sqlalchemy import select
+
+from main.models.images import Image
+from main.services.file_reaper import file_reaper
+from main.utils import image as image_utils
+from main.utils.exeptions import SpecialException
+from main.utils.image import save_image_util
+from tests.database import async_session_maker
 
 # Корневая директория с тестами
 _TEST_ROOT_DIR = Path(__file__).resolve().parents[1]
@@ -31,3 +42,253 @@ class TestImages:
         assert resp.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
         assert resp.json()["error_type"] == "422"
         assert resp.json()["result"] is False
+
+    async def test_load_image(
+        self,
+        client: AsyncClient,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование загрузки изображения блоками в файл с путем по хэшу содержимого
+        """
+        monkeypatch.setattr("main.utils.image.MEDIA_FOLDER", str(tmp_path))
+        monkeypatch.setattr("main.utils.image.MEDIA_CHUNK_SIZE", 1024)
+        content = os.urandom(10 * 1024 + 1)
+
+        resp = await client.post(
+            "/api/medias",
+            files={"file": ("image.png", content)},
+            headers={"api-key": "test-user1"},
+        )
+
+        content_hash = hashlib.sha256(content).hexdigest()
+        path = tmp_path / content_hash[:2] / content_hash[2:4] / f"{content_hash}.png"
+
+        assert resp.status_code == HTTPStatus.CREATED
+        assert path.read_bytes() == content
+        assert [p for p in tmp_path.rglob("*") if p.is_file()] == [path]
+
+    async def test_load_too_large_image(
+        self,
+        client: AsyncClient,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование отказа в загрузке изображения больше допустимого размера
+        """
+        monkeypatch.setattr("main.utils.image.MEDIA_FOLDER", str(tmp_path))
+        monkeypatch.setattr("main.utils.image.MEDIA_MAX_SIZE", 1024)
+
+        resp = await client.post(
+            "/api/medias",
+            files={"file": ("image.png", b"0" * 1025)},
+            headers={"api-key": "test-user1"},
+        )
+
+        assert resp.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+        assert resp.json()["error_type"] == "413"
+        assert os.listdir(tmp_path) == []
+
+    async def test_load_too_large_request(
+        self,
+        client: AsyncClient,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование отказа по заголовку Content-Length без чтения
+        тела запроса
+        """
+        monkeypatch.setattr("main.utils.image.MEDIA_FOLDER", str(tmp_path))
+        monkeypatch.setattr("main.utils.image.MEDIA_MAX_SIZE", 1024)
+        monkeypatch.setattr("main.routes.image.MEDIA_BATCH_MAX_FILES", 2)
+
+        async def save_image_util(file: UploadFile) -> None:
+            raise AssertionError("Тело запроса не должно читаться")
+
+        monkeypatch.setattr("main.services.image.save_image_util", save_image_util)
+
+        for url, files in (
+            ("/api/medias", {"file": ("image.png", b"0" * 64 * 1024)}),
+            ("/api/medias/batch",
+             [("files", (f"{i}.png", b"0" * 32 * 1024)) for i in range(2)]),
+        ):
+            resp = await client.post(url,
+                                     files=files,
+                                     headers={"api-key": "test-user1"},
+                                     )
+
+            assert resp.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+            assert resp.json()["error_type"] == "413"
+
+        assert os.listdir(tmp_path) == []
+
+    async def test_load_too_large_request_unauthorized(
+        self,
+        client: AsyncClient,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование проверки api-key до проверки размера запроса
+        """
+        monkeypatch.setattr("main.utils.image.MEDIA_MAX_SIZE", 1024)
+
+        for headers in ({}, {"api-key": "unknown-user"}):
+            resp = await client.post("/api/medias",
+                                     files={"file": ("image.png", b"0" * 64 * 1024)},
+                                     headers=headers,
+                                     )
+
+            assert resp.status_code == HTTPStatus.UNAUTHORIZED
+            assert resp.json()["error_type"] == "401"
+
+    async def test_load_too_large_image_stream(
+        self,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование удаления временного файла, если размер изображения
+        неизвестен заранее и превышен при копировании
+        """
+        monkeypatch.setattr("main.utils.image.MEDIA_FOLDER", str(tmp_path))
+        monkeypatch.setattr("main.utils.image.MEDIA_MAX_SIZE", 1024)
+        monkeypatch.setattr("main.utils.image.MEDIA_CHUNK_SIZE", 256)
+        file = UploadFile(file=io.BytesIO(b"0" * 2048), filename="image.png")
+
+        with pytest.raises(SpecialException) as exc:
+            await save_image_util(file=file)
+
+        assert exc.value.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+        assert os.listdir(tmp_path) == []
+
+    async def test_load_image_without_filename(
+        self,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование отказа в загрузке изображения без названия файла
+        """
+        monkeypatch.setattr("main.utils.image.MEDIA_FOLDER", str(tmp_path))
+        file = UploadFile(file=io.BytesIO(b"0" * 16), filename=None)
+
+        with pytest.raises(SpecialException) as exc:
+            await save_image_util(file=file)
+
+        assert exc.value.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+        assert os.listdir(tmp_path) == []
+
+    async def test_load_images_batch(
+        self,
+        client: AsyncClient,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование пакетной загрузки изображений
+        """
+        monkeypatch.setattr("main.utils.image.MEDIA_FOLDER", str(tmp_path))
+        first, second = os.urandom(2048), os.urandom(2048)
+
+        resp = await client.post(
+            "/api/medias/batch",
+            files=[("files", ("1.png", first)),
+                   ("files", ("2.jpg", second)),
+                   ("files", ("3.png", first)),
+                   ],
+            headers={"api-key": "test-user1"},
+        )
+        media_ids = resp.json()["media_ids"]
+
+        async with async_session_maker() as session:
+            images = await session.scalars(
+                select(Image).where(Image.id.in_(media_ids))
+            )
+            paths = {image.id: image.path_media for image in images}
+
+        assert resp.status_code == HTTPStatus.CREATED
+        assert len(media_ids) == 3
+        assert paths[media_ids[0]] == paths[media_ids[2]]
+        assert (tmp_path / paths[media_ids[1]]).read_bytes() == second
+        assert len([p for p in tmp_path.rglob("*") if p.is_file()]) == 2
+
+    async def test_load_images_batch_place_error(
+        self,
+        client: AsyncClient,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование удаления уже перенесенных файлов, если перенести
+        на место удалось не все файлы пакета
+        """
+        monkeypatch.setattr("main.utils.image.MEDIA_FOLDER", str(tmp_path))
+        placed = []
+
+        async def place_image(temp_path: str, path_media: str) -> None:
+            if placed:
+                raise OSError("No space left on device")
+
+            await image_utils.place_image(temp_path=temp_path,
+                                          path_media=path_media,
+                                          )
+            placed.append(path_media)
+
+        monkeypatch.setattr("main.services.image.place_image", place_image)
+
+        with pytest.raises(OSError):
+            await client.post(
+                "/api/medias/batch",
+                files=[("files", ("1.png", os.urandom(2048))),
+                       ("files", ("2.png", os.urandom(2048))),
+                       ],
+                headers={"api-key": "test-user1"},
+            )
+
+        await file_reaper.wait()
+
+        assert (tmp_path / placed[0]).exists() is False
+        assert [p for p in tmp_path.rglob("*") if p.is_file()] == []
+
+    async def test_load_images_batch_incorrect_file(
+        self,
+        client: AsyncClient,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование отказа в пакетной загрузке, если один из файлов
+        неразрешенного формата (остальные файлы не сохраняются)
+        """
+        monkeypatch.setattr("main.utils.image.MEDIA_FOLDER", str(tmp_path))
+
+        resp = await client.post(
+            "/api/medias/batch",
+            files=[("files", ("1.png", b"1")), ("files", ("2.txt", b"2"))],
+            headers={"api-key": "test-user1"},
+        )
+
+        assert resp.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+        assert list(tmp_path.iterdir()) == []
+
+    async def test_load_images_batch_too_many(
+        self,
+        client: AsyncClient,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование отказа в пакетной загрузке слишком большого кол-ва файлов
+        """
+        monkeypatch.setattr("main.routes.image.MEDIA_BATCH_MAX_FILES", 2)
+
+        resp = await client.post(
+            "/api/medias/batch",
+            files=[("files", (f"{i}.png", b"0")) for i in range(3)],
+            headers={"api-key": "test-user1"},
+        )
+
+        assert resp.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+        assert resp.json()["error_message"].startswith("Too many images")
@@ -1,13 +1,32 @@
-from typing import Dict, Tuple
+import asyncio
+from typing import Dict, List, Tuple
 
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import func, select
 
 from main.models.tweets import Like, Tweet
 from main.models.users import User
+from main.services.like import LikeService
+from main.services.like_counter import like_counter
 from tests.database import async_session_maker
 
 
+@pytest.fixture(scope="session")
+async def likers() -> List[User]:
+    """
+    Пользователи для одновременных лайков
+    """
+    async with async_session_maker() as session:
+        users = [
+            User(username=f"liker-{i}", api_key=f"liker-{i}") for i in range(20)
+        ]
+        session.add_all(users)
+        await session.commit()
+
+        return users
+
+
 @pytest.mark.like
 # Используем в тестах данные о пользователе и твитах
 @pytest.mark.usefixtures("users", "tweets")
@@ -132,3 +151,184 @@ class TestLikes:
             "error_type": "423",
             "error_message": "The user has not yet liked this tweet",
         }
+
+    async def test_concurrent_likes(
+        self,
+        client: AsyncClient,
+        tweets: Tuple[Tweet],
+        likers: List[User],
+    ) -> None:
+        """
+        Тестирование счетчика лайков при одновременных лайках
+        от разных пользователей и повторных лайках от одного
+        """
+        tweet_id = tweets[2].id
+
+        responses = await asyncio.gather(
+            *(
+                client.post(f"/api/tweets/{tweet_id}/likes",
+                            headers={"api-key": liker.api_key},
+                            )
+                for liker in likers
+            ),
+            *(
+                client.post(f"/api/tweets/{tweet_id}/likes",
+                            headers={"api-key": likers[0].api_key},
+                            )
+                for _ in range(5)
+            ),
+        )
+        succeeded = [resp for resp in responses if resp.status_code == 201]
+
+        async with async_session_maker() as session:
+            tweet = await session.get(Tweet, tweet_id)
+            likes = await session.scalar(
+                select(func.count()).where(Like.tweets_id == tweet_id)
+            )
+
+        assert len(succeeded) == len(likers)
+        assert tweet.likes_count == likes == len(likers)
+
+        responses = await asyncio.gather(
+            *(
+                client.delete(f"/api/tweets/{tweet_id}/likes",
+                              headers={"api-key": liker.api_key},
+                              )
+                for liker in likers
+            )
+        )
+
+        async with async_session_maker() as session:
+            tweet = await session.get(Tweet, tweet_id)
+
+        assert all(resp.json() == {"result": True} for resp in responses)
+        assert tweet.likes_count == 0
+
+    async def test_write_behind_likes(
+        self,
+        client: AsyncClient,
+        tweets: Tuple[Tweet],
+        likers: List[User],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование отложенной записи счетчика лайков
+        """
+        monkeypatch.setattr("main.services.like.LIKES_WRITE_BEHIND", True)
+        tweet_id = tweets[2].id
+
+        try:
+            responses = await asyncio.gather(
+                *(
+                    client.post(f"/api/tweets/{tweet_id}/likes",
+                                headers={"api-key": liker.api_key},
+                                )
+                    for liker in likers
+                )
+            )
+            await client.delete(f"/api/tweets/{tweet_id}/likes",
+                                headers={"api-key": likers[0].api_key},
+                                )
+
+            assert all(resp.status_code == 201 for resp in responses)
+            assert like_counter.pending() == {tweet_id: len(likers) - 1}
+
+            await like_counter.flush()
+        finally:
+            await like_counter.stop()
+
+        async with async_session_maker() as session:
+            tweet = await session.get(Tweet, tweet_id)
+
+        assert like_counter.pending() == {}
+        assert tweet.likes_count == len(likers) - 1
+
+    async def test_reconcile_counts(self, tweets: Tuple[Tweet]) -> None:
+        """
+        Тестирование сверки счетчиков лайков с таблицей лайков
+        """
+        tweet_id = tweets[2].id
+
+        async with async_session_maker() as session:
+            tweet = await session.get(Tweet, tweet_id)
+            likes_count = tweet.likes_count
+            tweet.likes_count = likes_count + 7
+            await session.commit()
+
+            fixed = await LikeService.reconcile_counts(session=session)
+            await session.refresh(tweet)
+
+        assert fixed == 1
+        assert tweet.likes_count == likes_count
+
+    async def test_reconcile_write_behind(
+        self,
+        client: AsyncClient,
+        tweets: Tuple[Tweet],
+        likers: List[User],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование сверки при отложенной записи: изменения из буфера
+        не учитываются дважды
+        """
+        monkeypatch.setattr("main.services.like.LIKES_WRITE_BEHIND", True)
+        tweet_id = tweets[1].id
+
+        async with async_session_maker() as session:
+            likes_count = await session.scalar(
+                select(func.count(Like.id)).where(Like.tweets_id == tweet_id)
+            )
+
+        try:
+            resp = await client.post(f"/api/tweets/{tweet_id}/likes",
+                                     headers={"api-key": likers[0].api_key},
+                                     )
+
+            assert resp.status_code == 201
+            assert like_counter.pending() == {tweet_id: 1}
+
+            async with async_session_maker() as session:
+                await LikeService.reconcile_counts(session=session)
+
+            assert like_counter.pending() == {}
+        finally:
+            await like_counter.stop()
+
+        async with async_session_maker() as session:
+            tweet = await session.get(Tweet, tweet_id)
+
+        assert tweet.likes_count == likes_count + 1
+
+    async def test_stop_keeps_deltas(self, tweets: Tuple[Tweet]) -> None:
+        """
+        Тестирование остановки фоновой записи: изменения, записываемые
+        в момент остановки или прерванные отменой, не теряются
+        """
+        tweet_id = tweets[2].id
+
+        async with async_session_maker() as session:
+            likes_count = (await session.get(Tweet, tweet_id)).likes_count
+
+        like_counter.add(tweet_id, 1)
+        flush = asyncio.create_task(like_counter.flush())
+        await asyncio.sleep(0)
+        flush.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await flush
+
+        assert like_counter.pending() == {tweet_id: 1}
+
+        await like_counter.stop()
+
+        async with async_session_maker() as session:
+            tweet = await session.get(Tweet, tweet_id)
+
+        assert like_counter.pending() == {}
+        assert tweet.likes_count == likes_count + 1
+
+        async with async_session_maker() as session:
+            tweet = await session.get(Tweet, tweet_id)
+            tweet.likes_count = likes_count
+            await session.commit()
@@ -0,0 +1,691 @@
+import datetime
+from typing import Dict, Tuple
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import event, func, select
+
+from main.config import FEED_LIKES_PREVIEW
+from main.models.images import Image
+from main.models.likes import Like
+from main.models.timelines import TimelineEntry
+from main.models.tweets import Tweet
+from main.models.users import User
+from main.schemas import TweetListSchema
+from main.services.timeline import TimelineService
+from main.services.tweet import FEED_SORT_COLUMNS
+from tests.database import async_session_maker, engine_test
+
+
+@pytest.fixture(scope="session")
+async def feed_users() -> Tuple[User, User]:
+    """
+    Читатель ленты и автор, на которого он подписан
+    """
+    async with async_session_maker() as session:
+        reader = User(username="feed-reader", api_key="feed-reader")
+        author = User(username="feed-author", api_key="feed-author")
+        reader.following.append(author)
+
+        session.add_all([reader, author])
+        await session.commit()
+
+        return reader, author
+
+
+@pytest.fixture(scope="session")
+async def feed_tweets(feed_users: Tuple[User, User]) -> list[Tweet]:
+    """
+    Твиты автора для постраничного вывода
+    """
+    async with async_session_maker() as session:
+        tweets = [
+            Tweet(tweet_data=f"Твит ленты {i}", user_id=feed_users[1].id)
+            for i in range(5)
+        ]
+        session.add_all(tweets)
+        await session.commit()
+
+        return tweets
+
+
+@pytest.fixture(scope="session")
+async def reader_headers(feed_users: Tuple[User, User]) -> Dict:
+    """
+    Параметр в header для запросов от имени читателя ленты
+    """
+    return {"api-key": feed_users[0].api_key}
+
+
+@pytest.mark.feed
+class TestTweetsFeed:
+
+    async def test_feed_pages(
+        self,
+        client: AsyncClient,
+        feed_tweets: list[Tweet],
+        reader_headers: Dict,
+    ) -> None:
+        """
+        Тестирование постраничного вывода ленты по курсору
+        """
+        received = []
+        cursor = None
+
+        for _ in range(3):
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+
+            resp = await client.get(
+                "/api/tweets", params=params, headers=reader_headers
+            )
+            data = resp.json()
+
+            assert data["result"] is True
+            assert len(data["tweets"]) <= 2
+
+            received.extend(tweet["id"] for tweet in data["tweets"])
+            cursor = data["next_cursor"]
+
+        # Новые твиты первыми, без повторов и пропусков, последняя страница
+        # не содержит курсора
+        assert received == sorted((tweet.id for tweet in feed_tweets),
+                                  reverse=True,
+                                  )
+        assert cursor is None
+
+    async def test_feed_queries_count(
+        self,
+        client: AsyncClient,
+        feed_tweets: list[Tweet],
+        reader_headers: Dict,
+    ) -> None:
+        """
+        Тестирование того, что кол-во запросов к БД при выводе ленты
+        не зависит от кол-ва лайков и изображений у твитов
+        """
+        statements = []
+
+        def count_statement(*args) -> None:
+            statements.append(args[2])
+
+        async def add_likes_and_images(start: int, stop: int) -> None:
+            async with async_session_maker() as session:
+                likers = [
+                    User(username=f"feed-liker-{i}", api_key=f"feed-liker-{i}")
+                    for i in range(start, stop)
+                ]
+                session.add_all(likers)
+                await session.flush()
+
+                session.add_all(
+                    Like(user_id=liker.id, tweets_id=tweet.id)
+                    for liker in likers
+                    for tweet in feed_tweets
+                )
+                session.add_all(
+                    Image(tweet_id=tweet.id, path_media=f"feed-{i}.jpg")
+                    for i in range(start, stop)
+                    for tweet in feed_tweets
+                )
+                await session.commit()
+
+        async def count_feed_statements() -> int:
+            statements.clear()
+            event.listen(engine_test.sync_engine,
+                         "before_cursor_execute",
+                         count_statement,
+                         )
+            try:
+                resp = await client.get("/api/tweets", headers=reader_headers)
+            finally:
+                event.remove(engine_test.sync_engine,
+                             "before_cursor_execute",
+                             count_statement,
+                             )
+
+            assert resp.json()["result"] is True
+
+            return len(statements)
+
+        await add_likes_and_images(start=0, stop=1)
+        few_likes = await count_feed_statements()
+
+        await add_likes_and_images(start=1, stop=20)
+        many_likes = await count_feed_statements()
+
+        assert few_likes == many_likes
+
+    async def test_feed_invalid_cursor(
+        self,
+        client: AsyncClient,
+        reader_headers: Dict,
+    ) -> None:
+        """
+        Тестирование вывода ошибки при передаче некорректного курсора
+        """
+        resp = await client.get(
+            "/api/tweets",
+            params={"cursor": "not-a-cursor"},
+            headers=reader_headers,
+        )
+
+        assert resp.json() == {
+            "result": False,
+            "error_type": "422",
+            "error_message": "Invalid cursor",
+        }
+
+    async def test_feed_likes_summary(
+        self,
+        client: AsyncClient,
+        feed_tweets: list[Tweet],
+        reader_headers: Dict,
+    ) -> None:
+        """
+        Тестирование вывода сводки по лайкам вместо полного списка
+        """
+        liked_tweet_id = feed_tweets[0].id
+        await client.post(f"/api/tweets/{liked_tweet_id}/likes",
+                          headers=reader_headers,
+                          )
+
+        resp = await client.get(
+            "/api/tweets",
+            params={"likes": "summary"},
+            headers=reader_headers,
+        )
+        summary = {tweet["id"]: tweet for tweet in resp.json()["tweets"]}
+
+        resp = await client.get("/api/tweets", headers=reader_headers)
+        full = {tweet["id"]: tweet for tweet in resp.json()["tweets"]}
+
+        assert summary.keys() == full.keys()
+
+        for tweet_id, tweet in summary.items():
+            assert len(tweet["likes"]) <= FEED_LIKES_PREVIEW
+            assert len(tweet["likes"]) == min(len(full[tweet_id]["likes"]),
+                                              FEED_LIKES_PREVIEW,
+                                              )
+            assert all(like in full[tweet_id]["likes"]
+                       for like in tweet["likes"])
+            assert tweet["is_liked"] is (tweet_id == liked_tweet_id)
+            assert full[tweet_id]["is_liked"] is (tweet_id == liked_tweet_id)
+
+    @pytest.mark.parametrize("order", ["recent", "popular", "ranked"])
+    async def test_feed_orders(
+        self,
+        client: AsyncClient,
+        feed_users: Tuple[User, User],
+        reader_headers: Dict,
+        order: str,
+    ) -> None:
+        """
+        Тестирование постраничного вывода ленты в разных порядках
+        """
+        received = []
+        cursor = None
+
+        while True:
+            params = {"limit": 2, "order": order}
+            if cursor:
+                params["cursor"] = cursor
+
+            resp = await client.get("/api/tweets",
+                                    params=params,
+                                    headers=reader_headers,
+                                    )
+            data = resp.json()
+            received.extend(tweet["id"] for tweet in data["tweets"])
+            cursor = data["next_cursor"]
+
+            if cursor is None:
+                break
+
+        column = FEED_SORT_COLUMNS[order]
+
+        async with async_session_maker() as session:
+            expected = await session.scalars(
+                select(Tweet.id)
+                .where(Tweet.user_id == feed_users[1].id)
+                .order_by(column.desc(), Tweet.id.desc())
+            )
+
+        assert received == list(expected)
+
+    async def test_feed_cursor_order_mismatch(
+        self,
+        client: AsyncClient,
+        feed_tweets: list[Tweet],
+        reader_headers: Dict,
+    ) -> None:
+        """
+        Тестирование вывода ошибки при передаче курсора другого порядка ленты
+        """
+        resp = await client.get("/api/tweets",
+                                params={"limit": 1, "order": "popular"},
+                                headers=reader_headers,
+                                )
+        cursor = resp.json()["next_cursor"]
+
+        resp = await client.get("/api/tweets",
+                                params={"cursor": cursor, "order": "ranked"},
+                                headers=reader_headers,
+                                )
+
+        assert resp.json()["error_message"] == "Invalid cursor"
+
+    @pytest.mark.parametrize("likes_mode", ["full", "summary"])
+    async def test_feed_matches_schema(
+        self,
+        client: AsyncClient,
+        feed_tweets: list[Tweet],
+        reader_headers: Dict,
+        likes_mode: str,
+    ) -> None:
+        """
+        Тестирование соответствия ленты, собранной без ORM-объектов,
+        схеме ответа TweetListSchema
+        """
+        resp = await client.get("/api/tweets",
+                                params={"likes": likes_mode},
+                                headers=reader_headers,
+                                )
+        data = resp.json()
+
+        assert resp.headers["content-type"] == "application/json"
+        assert data["tweets"]
+        assert any(tweet["likes"] and tweet["attachments"]
+                   for tweet in data["tweets"])
+        assert TweetListSchema.model_validate(data).model_dump(by_alias=True) == data
+
+    async def test_feed_since(
+        self,
+        client: AsyncClient,
+        feed_users: Tuple[User, User],
+        reader_headers: Dict,
+    ) -> None:
+        """
+        Тестирование вывода только новых твитов по watermark: твиты
+        последних FEED_SINCE_OVERLAP секунд выводятся повторно
+        """
+        author_headers = {"api-key": feed_users[1].api_key}
+
+        resp = await client.get("/api/tweets", headers=reader_headers)
+        watermark = resp.json()["watermark"]
+        seen = {tweet["id"] for tweet in resp.json()["tweets"]}
+
+        resp = await client.get("/api/tweets",
+                                params={"since": watermark},
+                                headers=reader_headers,
+                                )
+
+        # Новых твитов нет - watermark прежний
+        assert {tweet["id"] for tweet in resp.json()["tweets"]} <= seen
+        assert resp.json()["watermark"] == watermark
+
+        new_ids = []
+
+        for i in range(3):
+            resp = await client.post("/api/tweets",
+                                     json={"tweet_data": f"Новый твит {i}",
+                                           "tweet_media_ids": [],
+                                           },
+                                     headers=author_headers,
+                                     )
+            new_ids.append(resp.json()["tweet_id"])
+
+        resp = await client.get("/api/tweets",
+                                params={"since": watermark, "limit": 2},
+                                headers=reader_headers,
+                                )
+        data = resp.json()
+        received = [tweet["id"] for tweet in data["tweets"]]
+        # watermark выдается с первой страницы новых твитов
+        new_watermark = data["watermark"]
+
+        resp = await client.get("/api/tweets",
+                                params={"since": watermark,
+                                        "cursor": data["next_cursor"],
+                                        },
+                                headers=reader_headers,
+                                )
+        data = resp.json()
+        received.extend(tweet["id"] for tweet in data["tweets"])
+
+        assert [
+            tweet_id for tweet_id in received if tweet_id not in seen
+        ] == new_ids[::-1]
+        assert data["next_cursor"] is None
+        assert data["watermark"] is None
+        assert new_watermark != watermark
+
+        resp = await client.get("/api/tweets",
+                                params={"since": new_watermark},
+                                headers=reader_headers,
+                                )
+
+        assert {tweet["id"] for tweet in resp.json()["tweets"]} <= seen | set(new_ids)
+
+        for tweet_id in new_ids:
+            await client.delete(f"/api/tweets/{tweet_id}",
+                                headers=author_headers,
+                                )
+
+    async def test_feed_since_late_commit(
+        self,
+        client: AsyncClient,
+        feed_users: Tuple[User, User],
+        reader_headers: Dict,
+    ) -> None:
+        """
+        Тестирование вывода по watermark твита, закоммиченного позже
+        более нового твита (время твита раньше самого нового в ленте)
+        """
+        author_headers = {"api-key": feed_users[1].api_key}
+
+        resp = await client.post("/api/tweets",
+                                 json={"tweet_data": "Новый твит",
+                                       "tweet_media_ids": [],
+                                       },
+                                 headers=author_headers,
+                                 )
+        tweet_id = resp.json()["tweet_id"]
+
+        resp = await client.get("/api/tweets", headers=reader_headers)
+        watermark = resp.json()["watermark"]
+
+        async with async_session_maker() as session:
+            newest = await session.get(Tweet, tweet_id)
+            late = Tweet(tweet_data="Твит долгой транзакции",
+                         user_id=feed_users[1].id,
+                         created_at=newest.created_at - datetime.timedelta(seconds=1),
+                         )
+            session.add(late)
+            await session.commit()
+
+        resp = await client.get("/api/tweets",
+                                params={"since": watermark},
+                                headers=reader_headers,
+                                )
+
+        assert late.id in [tweet["id"] for tweet in resp.json()["tweets"]]
+
+        for delete_id in (tweet_id, late.id):
+            await client.delete(f"/api/tweets/{delete_id}",
+                                headers=author_headers,
+                                )
+
+    async def test_feed_since_order(
+        self,
+        client: AsyncClient,
+        feed_tweets: list[Tweet],
+        reader_headers: Dict,
+    ) -> None:
+        """
+        Тестирование вывода ошибки при передаче since для порядка,
+        отличного от recent
+        """
+        resp = await client.get("/api/tweets", headers=reader_headers)
+        watermark = resp.json()["watermark"]
+
+        resp = await client.get("/api/tweets",
+                                params={"since": watermark, "order": "popular"},
+                                headers=reader_headers,
+                                )
+
+        assert resp.json()["error_type"] == "422"
+
+    async def test_feed_etag(
+        self,
+        client: AsyncClient,
+        feed_users: Tuple[User, User],
+        reader_headers: Dict,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование ответа 304 на запрос неизменившейся ленты и смены ETag
+        при новом твите автора, его удалении и подписке читателя
+        """
+        monkeypatch.setattr("main.services.tweet.FEED_ETAG_MAX_AGE", 0)
+        author_headers = {"api-key": feed_users[1].api_key}
+
+        async def feed_etag() -> str:
+            resp = await client.get("/api/tweets", headers=reader_headers)
+
+            assert resp.status_code == 200
+
+            return resp.headers["etag"]
+
+        etag = await feed_etag()
+        resp = await client.get("/api/tweets",
+                                headers={**reader_headers, "If-None-Match": etag},
+                                )
+
+        assert resp.status_code == 304
+        assert resp.content == b""
+        assert resp.headers["etag"] == etag
+
+        # ETag зависит от параметров ленты
+        resp = await client.get("/api/tweets",
+                                params={"limit": 1},
+                                headers={**reader_headers, "If-None-Match": etag},
+                                )
+
+        assert resp.status_code == 200
+
+        resp = await client.post("/api/tweets",
+                                 json={"tweet_data": "Твит для ETag",
+                                       "tweet_media_ids": [],
+                                       },
+                                 headers=author_headers,
+                                 )
+        tweet_id = resp.json()["tweet_id"]
+        after_tweet = await feed_etag()
+
+        await client.delete(f"/api/tweets/{tweet_id}", headers=author_headers)
+        after_delete = await feed_etag()
+
+        async with async_session_maker() as session:
+            other = User(username="feed-etag-author", api_key="feed-etag-author")
+            session.add(other)
+            await session.commit()
+
+        await client.post(f"/api/users/{other.id}/follow", headers=reader_headers)
+        after_follow = await feed_etag()
+
+        await client.delete(f"/api/users/{other.id}/follow",
+                            headers=reader_headers,
+                            )
+        after_unfollow = await feed_etag()
+
+        assert len({etag,
+                    after_tweet,
+                    after_delete,
+                    after_follow,
+                    after_unfollow,
+                    }) == 5
+
+    async def test_feed_etag_likes(
+        self,
+        client: AsyncClient,
+        feed_users: Tuple[User, User],
+        reader_headers: Dict,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование смены ETag при лайке читателя и удалении лайка
+        (без отметки активности читателя, от которой зависят ленты
+        его подписчиков)
+        """
+        monkeypatch.setattr("main.services.tweet.FEED_ETAG_MAX_AGE", 0)
+        author_headers = {"api-key": feed_users[1].api_key}
+
+        resp = await client.post("/api/tweets",
+                                 json={"tweet_data": "Твит для лайка",
+                                       "tweet_media_ids": [],
+                                       },
+                                 headers=author_headers,
+                                 )
+        tweet_id = resp.json()["tweet_id"]
+
+        resp = await client.get("/api/tweets", headers=reader_headers)
+        etag = resp.headers["etag"]
+
+        async with async_session_maker() as session:
+            last_activity_at = await session.scalar(
+                select(User.last_activity_at).where(User.id == feed_users[0].id)
+            )
+
+        await client.post(f"/api/tweets/{tweet_id}/likes", headers=reader_headers)
+        resp = await client.get("/api/tweets",
+                                headers={**reader_headers, "If-None-Match": etag},
+                                )
+        after_like = resp.headers["etag"]
+
+        assert resp.status_code == 200
+        assert after_like != etag
+
+        await client.delete(f"/api/tweets/{tweet_id}/likes",
+                            headers=reader_headers,
+                            )
+        resp = await client.get("/api/tweets",
+                                headers={**reader_headers,
+                                         "If-None-Match": after_like,
+                                         },
+                                )
+
+        # Лента снова совпадает с исходной
+        assert resp.status_code == 200
+        assert resp.headers["etag"] == etag
+
+        async with async_session_maker() as session:
+            assert await session.scalar(
+                select(User.last_activity_at).where(User.id == feed_users[0].id)
+            ) == last_activity_at
+
+        await client.delete(f"/api/tweets/{tweet_id}", headers=author_headers)
+
+    async def test_tweet_likes_pages(
+        self,
+        client: AsyncClient,
+        feed_tweets: list[Tweet],
+        reader_headers: Dict,
+    ) -> None:
+        """
+        Тестирование постраничного вывода лайков твита
+        """
+        tweet_id = feed_tweets[0].id
+        received = []
+        cursor = None
+
+        while True:
+            params = {"limit": 7}
+            if cursor:
+                params["cursor"] = cursor
+
+            resp = await client.get(f"/api/tweets/{tweet_id}/likes",
+                                    params=params,
+                                    headers=reader_headers,
+                                    )
+            data = resp.json()
+            received.extend(data["likes"])
+            cursor = data["next_cursor"]
+
+            if cursor is None:
+                break
+
+        async with async_session_maker() as session:
+            likes_count = await session.scalar(
+                select(func.count()).where(Like.tweets_id == tweet_id)
+            )
+
+        assert len(received) == likes_count
+        assert len({like["user_id"] for like in received}) == likes_count
+
+    async def test_tweet_likes_not_found(
+        self,
+        client: AsyncClient,
+        reader_headers: Dict,
+        response_tweet_not_found: Dict,
+    ) -> None:
+        """
+        Тестирование вывода ошибки при запросе лайков несуществующего твита
+        """
+        resp = await client.get("/api/tweets/100000/likes",
+                                headers=reader_headers,
+                                )
+
+        assert resp.json() == response_tweet_not_found
+
+
+@pytest.mark.feed
+class TestFanoutFeed:
+    @pytest.fixture
+    def fanout(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """
+        Включение режима fan-out-on-write
+        """
+        monkeypatch.setattr("main.services.timeline.FEED_FANOUT_ENABLED", True)
+
+    async def test_backfill_keeps_feed(
+        self,
+        client: AsyncClient,
+        feed_tweets: list[Tweet],
+        reader_headers: Dict,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование совпадения ленты до и после заполнения материализованных
+        лент по существующим подпискам
+        """
+        resp = await client.get("/api/tweets", headers=reader_headers)
+        expected = resp.json()
+
+        async with async_session_maker() as session:
+            inserted = await TimelineService.backfill(session=session)
+
+        monkeypatch.setattr("main.services.timeline.FEED_FANOUT_ENABLED", True)
+        resp = await client.get("/api/tweets", headers=reader_headers)
+
+        assert inserted >= len(feed_tweets)
+        assert resp.json() == expected
+
+    @pytest.mark.usefixtures("fanout")
+    async def test_fan_out_and_retract(
+        self,
+        client: AsyncClient,
+        feed_users: Tuple[User, User],
+        reader_headers: Dict,
+    ) -> None:
+        """
+        Тестирование раскладки нового твита по лентам подписчиков
+        и удаления его из лент вместе с твитом
+        """
+        author_headers = {"api-key": feed_users[1].api_key}
+        resp = await client.post(
+            "/api/tweets",
+            json={"tweet_data": "Твит для раскладки", "tweet_media_ids": []},
+            headers=author_headers,
+        )
+        tweet_id = resp.json()["tweet_id"]
+
+        async with async_session_maker() as session:
+            entry = await session.get(TimelineEntry,
+                                      (feed_users[0].id, tweet_id),
+                                      )
+
+        resp = await client.get("/api/tweets", headers=reader_headers)
+
+        assert entry is not None
+        assert resp.json()["tweets"][0]["id"] == tweet_id
+
+        await client.delete(f"/api/tweets/{tweet_id}", headers=author_headers)
+
+        async with async_session_maker() as session:
+            entry = await session.get(TimelineEntry,
+                                      (feed_users[0].id, tweet_id),
+                                      )
+
+        assert entry is None
@@ -0,0 +1,350 @@
+import datetime
+import io
+import os
+from http import HTTPStatus
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+from httpx import AsyncClient
+from PIL import Image as PILImage
+from sqlalchemy import insert, select, update
+
+from main.config import MEDIA_ORPHAN_GRACE, MEDIA_VARIANTS
+from main.models.image_variants import ImageVariant
+from main.models.images import Image
+from main.models.users import User, user_to_user
+from main.services.file_reaper import file_reaper
+from main.services.image import ImageService
+from main.services.image_variants import image_variants
+from tests.database import async_session_maker
+
+
+@pytest.fixture(scope="session")
+async def media_headers() -> Dict:
+    """
+    Параметр в header для запросов от имени автора твитов с изображениями
+    """
+    async with async_session_maker() as session:
+        session.add(User(username="media-author", api_key="media-author"))
+        await session.commit()
+
+    return {"api-key": "media-author"}
+
+
+def stored_files(folder: Path) -> List[str]:
+    """
+    Сохраненные изображения (пути относительно директории)
+    """
+    return sorted(
+        str(path.relative_to(folder)) for path in folder.rglob("*") if path.is_file()
+    )
+
+
+@pytest.mark.image
+class TestTweetsMedia:
+    async def test_deduplicate_images(
+        self,
+        client: AsyncClient,
+        media_headers: Dict,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование хранения одинаковых изображений одним файлом
+        и удаления файла вместе с последней ссылкой на него
+        """
+        monkeypatch.setattr("main.utils.image.MEDIA_FOLDER", str(tmp_path))
+        content = os.urandom(4096)
+
+        media_ids = []
+
+        for name in ("first.png", "second.png"):
+            resp = await client.post("/api/medias",
+                                     files={"file": (name, content)},
+                                     headers=media_headers,
+                                     )
+            media_ids.append(resp.json()["media_id"])
+
+        async with async_session_maker() as session:
+            images = list(
+                await session.scalars(select(Image).where(Image.id.in_(media_ids)))
+            )
+
+        assert len({img.path_media for img in images}) == 1
+        assert images[0].size == len(content)
+        assert stored_files(tmp_path) == [images[0].path_media]
+        assert images[0].path_media.endswith(f"{images[0].content_hash}.png")
+
+        tweet_ids = []
+
+        for media_id in media_ids:
+            resp = await client.post(
+                "/api/tweets",
+                json={"tweet_data": "Твит с изображением",
+                      "tweet_media_ids": [media_id],
+                      },
+                headers=media_headers,
+            )
+            tweet_ids.append(resp.json()["tweet_id"])
+
+        resp = await client.delete(f"/api/tweets/{tweet_ids[0]}",
+                                   headers=media_headers,
+                                   )
+        await file_reaper.wait()
+
+        assert resp.status_code == HTTPStatus.OK
+        assert stored_files(tmp_path) == [images[0].path_media]
+
+        resp = await client.delete(f"/api/tweets/{tweet_ids[1]}",
+                                   headers=media_headers,
+                                   )
+        await file_reaper.wait()
+
+        assert resp.status_code == HTTPStatus.OK
+        assert stored_files(tmp_path) == []
+
+    async def test_image_variants(
+        self,
+        client: AsyncClient,
+        media_headers: Dict,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование создания уменьшенных копий изображения
+        и вывода ссылок на них в ленте
+        """
+        monkeypatch.setattr("main.utils.image.MEDIA_FOLDER", str(tmp_path))
+        monkeypatch.setattr("main.services.image_variants.MEDIA_FOLDER",
+                            str(tmp_path),
+                            )
+        monkeypatch.setattr("main.services.image.MEDIA_VARIANTS_ENABLED", True)
+
+        content = io.BytesIO()
+        PILImage.new("RGB", (2000, 1000), "red").save(content, format="PNG")
+
+        resp = await client.post("/api/medias",
+                                 files={"file": ("big.png", content.getvalue())},
+                                 headers=media_headers,
+                                 )
+        media_id = resp.json()["media_id"]
+
+        try:
+            await image_variants.wait()
+        finally:
+            await image_variants.stop()
+
+        async with async_session_maker() as session:
+            variants = {
+                variant.name: variant
+                for variant in await session.scalars(
+                    select(ImageVariant).where(ImageVariant.image_id == media_id)
+                )
+            }
+
+        assert set(variants) == set(MEDIA_VARIANTS)
+
+        for name, max_side in MEDIA_VARIANTS.items():
+            assert (variants[name].width, variants[name].height) == (
+                max_side, max_side // 2
+            )
+
+            with PILImage.open(tmp_path / variants[name].path_media) as image:
+                assert image.format == "WEBP"
+                assert image.size == (max_side, max_side // 2)
+
+        # Подписываем автора на себя, чтобы твит попал в его ленту
+        resp = await client.post(
+            "/api/tweets",
+            json={"tweet_data": "Твит с копиями", "tweet_media_ids": [media_id]},
+            headers=media_headers,
+        )
+        tweet_id = resp.json()["tweet_id"]
+
+        async with async_session_maker() as session:
+            author = await session.scalar(
+                select(User).where(User.api_key == media_headers["api-key"])
+            )
+            await session.execute(
+                insert(user_to_user).values(followers_id=author.id,
+                                            following_id=author.id,
+                                            )
+            )
+            await session.commit()
+
+        resp = await client.get("/api/tweets",
+                                params={"media_variant": "thumb"},
+                                headers=media_headers,
+                                )
+        tweet = next(t for t in resp.json()["tweets"] if t["id"] == tweet_id)
+
+        assert tweet["attachments"] == [variants["thumb"].path_media]
+
+        resp = await client.delete(f"/api/tweets/{tweet_id}", headers=media_headers)
+        await file_reaper.wait()
+
+        assert resp.status_code == HTTPStatus.OK
+        assert stored_files(tmp_path) == []
+
+    async def test_image_variants_deleted_image(
+        self,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование удаления копий изображения, удаленного
+        до окончания обработки
+        """
+        monkeypatch.setattr("main.utils.image.MEDIA_FOLDER", str(tmp_path))
+        monkeypatch.setattr("main.services.image_variants.MEDIA_FOLDER",
+                            str(tmp_path),
+                            )
+
+        content_hash = "f" * 64
+        path_media = f"ff/ff/{content_hash}.png"
+        (tmp_path / "ff" / "ff").mkdir(parents=True)
+        PILImage.new("RGB", (2000, 1000), "red").save(tmp_path / path_media)
+
+        try:
+            # Записи об изображении нет - копии не сохраняются в БД
+            await image_variants._process(image_id=10 ** 6,
+                                          path_media=path_media,
+                                          content_hash=content_hash,
+                                          )
+        finally:
+            await image_variants.stop()
+
+        await file_reaper.wait()
+
+        assert stored_files(tmp_path) == []
+
+    async def test_keep_files_on_rollback(
+        self,
+        client: AsyncClient,
+        media_headers: Dict,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование сохранения файлов, если транзакция удаления твита
+        не зафиксирована
+        """
+        monkeypatch.setattr("main.utils.image.MEDIA_FOLDER", str(tmp_path))
+
+        resp = await client.post("/api/medias",
+                                 files={"file": ("kept.png", os.urandom(1024))},
+                                 headers=media_headers,
+                                 )
+        resp = await client.post(
+            "/api/tweets",
+            json={"tweet_data": "Твит", "tweet_media_ids": [resp.json()["media_id"]]},
+            headers=media_headers,
+        )
+        tweet_id = resp.json()["tweet_id"]
+        files = stored_files(tmp_path)
+
+        async with async_session_maker() as session:
+            await ImageService.delete_images(tweet_id=tweet_id, session=session)
+            await session.rollback()
+
+        await file_reaper.wait()
+
+        assert len(files) == 1
+        assert stored_files(tmp_path) == files
+
+        resp = await client.delete(f"/api/tweets/{tweet_id}", headers=media_headers)
+        await file_reaper.wait()
+
+        assert stored_files(tmp_path) == []
+
+    async def test_retry_file_removal(
+        self,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование повторного удаления файла после ошибки
+        """
+        monkeypatch.setattr("main.utils.image.MEDIA_FOLDER", str(tmp_path))
+        monkeypatch.setattr(file_reaper, "retry_delay", 0.01)
+        (tmp_path / "orphan.png").write_bytes(b"0")
+
+        remove = os.remove
+        calls = []
+
+        def flaky_remove(path: str) -> None:
+            calls.append(path)
+
+            if len(calls) == 1:
+                raise PermissionError(path)
+
+            remove(path)
+
+        monkeypatch.setattr("main.utils.image.os.remove", flaky_remove)
+
+        file_reaper.enqueue(files=[("orphan.png", None)])
+        await file_reaper.wait()
+
+        assert len(calls) == 2
+        assert stored_files(tmp_path) == []
+
+    async def test_collect_orphans(
+        self,
+        client: AsyncClient,
+        media_headers: Dict,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование удаления изображений, не привязанных к твиту
+        дольше допустимого срока
+        """
+        monkeypatch.setattr("main.utils.image.MEDIA_FOLDER", str(tmp_path))
+        monkeypatch.setattr("main.services.image.MEDIA_GC_BATCH", 2)
+        unique, shared, attached = (os.urandom(size) for size in (1000, 2000, 3000))
+
+        media_ids = {}
+
+        for name, content in (("unique", unique),
+                              ("shared-1", shared),
+                              ("shared-2", shared),
+                              ("attached-orphan", attached),
+                              ("attached", attached),
+                              ("fresh", os.urandom(500)),
+                              ):
+            resp = await client.post("/api/medias",
+                                     files={"file": (f"{name}.png", content)},
+                                     headers=media_headers,
+                                     )
+            media_ids[name] = resp.json()["media_id"]
+
+        resp = await client.post(
+            "/api/tweets",
+            json={"tweet_data": "Твит", "tweet_media_ids": [media_ids["attached"]]},
+            headers=media_headers,
+        )
+
+        # Загрузки старше срока сборки, кроме последней
+        async with async_session_maker() as session:
+            await session.execute(
+                update(Image)
+                .where(Image.id.in_(media_ids.values()),
+                       Image.id != media_ids["fresh"],
+                       )
+                .values(created_at=datetime.datetime.utcnow()
+                        - datetime.timedelta(seconds=MEDIA_ORPHAN_GRACE + 1))
+            )
+            await session.commit()
+
+            collected, reclaimed = await ImageService.collect_orphans(session=session)
+            left = set(await session.scalars(
+                select(Image.id).where(Image.id.in_(media_ids.values()))
+            ))
+
+        await file_reaper.wait()
+
+        assert collected == 4
+        assert reclaimed == len(unique) + len(shared)
+        assert left == {media_ids["attached"], media_ids["fresh"]}
+        assert len(stored_files(tmp_path)) == 2
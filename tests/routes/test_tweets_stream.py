@@ -0,0 +1,143 @@
+import asyncio
+from typing import List, Tuple
+
+import orjson
+import pytest
+from httpx import AsyncClient
+
+from main.models.users import User
+from main.services.tweet_stream import (KEEPALIVE_FRAME,
+                                        OVERFLOW_FRAME,
+                                        MemoryStreamBackend,
+                                        TweetStream,
+                                        tweet_stream,)
+from tests.database import async_session_maker
+
+
+@pytest.fixture(scope="session")
+async def stream_users() -> Tuple[User, User, User]:
+    """
+    Читатель потока, автор, на которого он подписан, и посторонний автор
+    """
+    async with async_session_maker() as session:
+        reader = User(username="stream-reader", api_key="stream-reader")
+        author = User(username="stream-author", api_key="stream-author")
+        other = User(username="stream-other", api_key="stream-other")
+        reader.following.append(author)
+
+        session.add_all([reader, author, other])
+        await session.commit()
+
+        return reader, author, other
+
+
+def parse_events(body: str) -> List[Tuple[str, str]]:
+    """
+    События SSE: название и данные (комментарии - с пустым названием)
+    """
+    events = []
+
+    for frame in body.split("\n\n"):
+        if not frame:
+            continue
+
+        if frame.startswith(":"):
+            events.append(("", frame))
+            continue
+
+        fields = dict(line.split(": ", 1) for line in frame.split("\n"))
+        events.append((fields["event"], fields["data"]))
+
+    return events
+
+
+@pytest.mark.stream
+class TestTweetsStream:
+    async def test_stream_followed_tweets(
+        self,
+        client: AsyncClient,
+        stream_users: Tuple[User, User, User],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Тестирование получения через поток твитов только тех авторов,
+        на которых подписан пользователь
+        """
+        reader, author, other = stream_users
+        monkeypatch.setattr(tweet_stream, "max_duration", 1)
+        monkeypatch.setattr(tweet_stream, "keepalive", 0.2)
+
+        stream = asyncio.create_task(
+            client.get("/api/tweets/stream", headers={"api-key": reader.api_key})
+        )
+
+        for _ in range(100):
+            if tweet_stream.connections():
+                break
+
+            await asyncio.sleep(0.01)
+
+        tweet_ids = []
+
+        for user in (author, other):
+            resp = await client.post("/api/tweets",
+                                     json={"tweet_data": f"Твит {user.username}",
+                                           "tweet_media_ids": [],
+                                           },
+                                     headers={"api-key": user.api_key},
+                                     )
+            tweet_ids.append(resp.json()["tweet_id"])
+
+        resp = await stream
+        events = parse_events(resp.text)
+        tweets = [orjson.loads(data) for event, data in events if event == "tweet"]
+
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        assert tweets == [{
+            "id": tweet_ids[0],
+            "content": f"Твит {author.username}",
+            "author": {"id": author.id, "name": author.username},
+            "likes": [],
+            "attachments": [],
+            "likes_count": 0,
+            "is_liked": False,
+        }]
+        assert ("", KEEPALIVE_FRAME.strip()) in events
+        # Поток закрыт по истечении max_duration, подписка снята
+        assert tweet_stream.connections() == 0
+
+    async def test_stream_overflow(self) -> None:
+        """
+        Тестирование замены событий переполненной очереди событием
+        переполнения и рассылки через общую шину
+        """
+        stream = TweetStream(queue_size=2,
+                             keepalive=1,
+                             max_duration=1,
+                             backend=MemoryStreamBackend(),
+                             )
+        subscription = await stream.subscribe(author_ids=[1])
+
+        for tweet_id in range(5):
+            await stream.publish(author_id=1, tweet={"id": tweet_id})
+
+        await stream.publish(author_id=2, tweet={"id": 100})
+
+        frames = [subscription.queue.get_nowait()
+                  for _ in range(subscription.queue.qsize())]
+
+        assert frames == [OVERFLOW_FRAME, 'event: tweet\ndata: {"id":4}\n\n']
+        assert subscription.overflows == 3
+
+        stream.unsubscribe(subscription)
+        await stream.stop()
+
+        assert stream.connections() == 0
+
+    async def test_stream_unauthorized(self, client: AsyncClient) -> None:
+        """
+        Тестирование отказа в потоке без api-key
+        """
+        resp = await client.get("/api/tweets/stream")
+
+        assert resp.status_code == 401
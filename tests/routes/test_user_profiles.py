@@ -0,0 +1,180 @@
+from contextlib import asynccontextmanager
+from http import HTTPStatus
+from typing import AsyncGenerator, List, Tuple
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import event
+
+from main.database import engine
+from main.models.tweets import Tweet
+from main.models.users import User
+from main.services.follower import FollowerService
+from tests.database import async_session_maker, engine_test
+
+
+@pytest.fixture(scope="session")
+async def celebrity() -> Tuple[User, User, Tweet]:
+    """
+    Автор с подписчиками, его твит и пользователь, подписанный на автора
+    """
+    async with async_session_maker() as session:
+        author = User(username="profile-author", api_key="profile-author")
+        fans = [
+            User(username=f"profile-fan-{i}", api_key=f"profile-fan-{i}")
+            for i in range(10)
+        ]
+        for fan in fans:
+            fan.following.append(author)
+
+        session.add_all([author, *fans])
+        await session.flush()
+
+        tweet = Tweet(tweet_data="Твит автора", user_id=author.id)
+        session.add(tweet)
+        await session.commit()
+
+        # Подписки добавлены в обход FollowerService
+        await FollowerService.reconcile_counts(session=session)
+
+        return author, fans[0], tweet
+
+
+@asynccontextmanager
+async def captured_statements() -> AsyncGenerator[List[str], None]:
+    """
+    Перехват SQL-запросов к БД приложения и тестовой БД
+    """
+    statements: List[str] = []
+
+    def capture(*args) -> None:
+        statements.append(args[2])
+
+    engines = (engine.sync_engine, engine_test.sync_engine)
+
+    for sync_engine in engines:
+        event.listen(sync_engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        for sync_engine in engines:
+            event.remove(sync_engine, "before_cursor_execute", capture)
+
+
+@pytest.mark.user
+class TestUserProfiles:
+    async def test_like_skips_follow_graph(
+        self,
+        client: AsyncClient,
+        celebrity: Tuple[User, User, Tweet],
+    ) -> None:
+        """
+        Тестирование того, что лайк не загружает подписки и подписчиков
+        """
+        _, fan, tweet = celebrity
+
+        async with captured_statements() as statements:
+            resp = await client.post(f"/api/tweets/{tweet.id}/likes",
+                                     headers={"api-key": fan.api_key},
+                                     )
+
+        assert resp.json() == {"result": True}
+        assert not any("user_to_user" in statement for statement in statements)
+
+    async def test_feed_skips_follow_graph(
+        self,
+        client: AsyncClient,
+        celebrity: Tuple[User, User, Tweet],
+    ) -> None:
+        """
+        Тестирование того, что лента подставляет подписки подзапросом,
+        не загружая пользователей и их подписчиков
+        """
+        _, fan, tweet = celebrity
+
+        async with captured_statements() as statements:
+            resp = await client.get("/api/tweets",
+                                    headers={"api-key": fan.api_key},
+                                    )
+
+        graph_statements = [
+            statement for statement in statements if "user_to_user" in statement
+        ]
+
+        assert [tweet["id"] for tweet in resp.json()["tweets"]] == [tweet.id]
+        # Версия ленты (ETag) и сама лента
+        assert len(graph_statements) == 2
+        assert graph_statements[0].startswith("SELECT count(*)")
+        assert graph_statements[1].startswith("SELECT tweets.")
+
+    async def test_profile_cache(
+        self,
+        client: AsyncClient,
+        celebrity: Tuple[User, User, Tweet],
+    ) -> None:
+        """
+        Тестирование выдачи профиля из кэша и ответа 304 по ETag
+        """
+        author, fan, _ = celebrity
+        headers = {"api-key": fan.api_key}
+
+        resp = await client.get(f"/api/users/{author.id}", headers=headers)
+        etag = resp.headers["ETag"]
+
+        assert len(resp.json()["user"]["followers"]) == 10
+
+        async with captured_statements() as statements:
+            cached = await client.get(f"/api/users/{author.id}", headers=headers)
+
+        assert statements == []
+        assert cached.json() == resp.json()
+        assert cached.headers["ETag"] == etag
+
+        resp = await client.get(f"/api/users/{author.id}",
+                                headers={**headers, "If-None-Match": etag},
+                                )
+
+        assert resp.status_code == HTTPStatus.NOT_MODIFIED
+        assert resp.content == b""
+        assert resp.headers["ETag"] == etag
+
+    async def test_profile_cache_invalidation(
+        self,
+        client: AsyncClient,
+        celebrity: Tuple[User, User, Tweet],
+    ) -> None:
+        """
+        Тестирование сброса кэша профилей обоих пользователей
+        при отписке и подписке
+        """
+        author, fan, _ = celebrity
+        headers = {"api-key": fan.api_key}
+
+        resp = await client.get(f"/api/users/{author.id}", headers=headers)
+        etag = resp.headers["ETag"]
+
+        resp = await client.get(f"/api/users/{fan.id}", headers=headers)
+
+        assert resp.json()["user"]["following"] == [
+            {"id": author.id, "name": author.username}
+        ]
+
+        await client.delete(f"/api/users/{author.id}/follow", headers=headers)
+
+        resp = await client.get(f"/api/users/{author.id}",
+                                headers={**headers, "If-None-Match": etag},
+                                )
+
+        assert resp.status_code == HTTPStatus.OK
+        assert resp.headers["ETag"] != etag
+        assert len(resp.json()["user"]["followers"]) == 9
+
+        resp = await client.get(f"/api/users/{fan.id}", headers=headers)
+
+        assert resp.json()["user"]["following"] == []
+
+        await client.post(f"/api/users/{author.id}/follow", headers=headers)
+
+        resp = await client.get(f"/api/users/{author.id}", headers=headers)
+
+        assert resp.headers["ETag"] == etag
@@ -26,6 +26,8 @@ class TestUsers:
             "user": {
                 "followers": [{"id": 4, "name": "test-user4"}],
                 "following": [{"id": 1, "name": "test-user1"}],
+                "followers_count": 1,
+                "following_count": 1,
                 "id": 3,
                 "name": "test-user3",
             },
@@ -53,6 +55,8 @@ class TestUsers:
             "user": {
                 "followers": [{"id": 4, "name": "test-user4"}],
                 "following": [{"id": 1, "name": "test-user1"}],
+                "followers_count": 1,
+                "following_count": 1,
                 "id": 3,
                 "name": "test-user3",
             },
@@ -80,3 +84,71 @@ class TestUsers:
             "error_type": "404",
             "error_message": "User not found",
         }
+
+    async def test_user_followers_pages(
+        self,
+        client: AsyncClient,
+    ) -> None:
+        """
+        Тестирование постраничного вывода подписчиков пользователя
+        """
+        headers = {"api-key": "test-user1"}
+
+        resp = await client.get("/api/users/1/followers?limit=1",
+                                headers=headers,
+                                )
+        page = resp.json()
+
+        assert page["users"] == [{"id": 3, "name": "test-user3"}]
+        assert page["next_cursor"]
+
+        resp = await client.get(
+            f"/api/users/1/followers?limit=1&cursor={page['next_cursor']}",
+            headers=headers,
+        )
+
+        assert resp.json() == {
+            "result": True,
+            "users": [{"id": 2, "name": "test-user2"}],
+            "next_cursor": None,
+        }
+
+    async def test_user_following(
+        self,
+        client: AsyncClient,
+    ) -> None:
+        """
+        Тестирование вывода подписок пользователя
+        """
+        resp = await client.get("/api/users/3/following",
+                                headers={"api-key": "test-user1"},
+                                )
+
+        assert resp.json() == {
+            "result": True,
+            "users": [{"id": 1, "name": "test-user1"}],
+            "next_cursor": None,
+        }
+
+    async def test_user_follows_errors(
+        self,
+        client: AsyncClient,
+    ) -> None:
+        """
+        Тестирование вывода ошибок: пользователь не найден, неверный курсор
+        """
+        headers = {"api-key": "test-user1"}
+
+        resp = await client.get("/api/users/1000/followers", headers=headers)
+
+        assert resp.json() == {
+            "result": False,
+            "error_type": "404",
+            "error_message": "User not found",
+        }
+
+        resp = await client.get("/api/users/1/following?cursor=bad",
+                                headers=headers,
+                                )
+
+        assert resp.json()["error_type"] == "422"
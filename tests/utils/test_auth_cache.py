@@ -0,0 +1,160 @@
+import asyncio
+import time
+from http import HTTPStatus
+
+import pytest
+from httpx import AsyncClient
+
+from main.models.users import User
+from main.schemas import Principal
+from main.utils.auth_cache import AuthCache, auth_cache
+from main.utils.cache import CacheBackend, MemoryCacheBackend, TTLCache
+from tests.database import async_session_maker
+
+
+@pytest.fixture(scope="session")
+async def cached_user() -> User:
+    """
+    Пользователь для проверки кэша аутентификации
+    """
+    async with async_session_maker() as session:
+        user = User(username="cache-user", api_key="cache-user")
+        session.add(user)
+        await session.commit()
+
+        return user
+
+
+async def auth_status(client: AsyncClient, api_key: str) -> int:
+    """
+    Код ответа на запрос, требующий только аутентификации
+    (лайки несуществующего твита: 404 - пользователь найден)
+    """
+    resp = await client.get("/api/tweets/100000/likes",
+                            headers={"api-key": api_key},
+                            )
+
+    return resp.status_code
+
+
+@pytest.mark.token
+class TestAuthCache:
+    def test_ttl_cache_expiration(self) -> None:
+        """
+        Тестирование устаревания записей кэша
+        """
+        cache = TTLCache(maxsize=10, ttl=0.01)
+        cache.set("key", "value")
+
+        assert cache.get("key") == "value"
+
+        time.sleep(0.02)
+
+        assert cache.get("key") is None
+
+    def test_ttl_cache_lru(self) -> None:
+        """
+        Тестирование вытеснения давно не использованных записей
+        """
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("first", 1)
+        cache.set("second", 2)
+        cache.get("first")
+        cache.set("third", 3)
+
+        assert cache.get("first") == 1
+        assert cache.get("second") is None
+        assert cache.get("third") == 3
+
+    async def test_principal_cached(
+        self,
+        client: AsyncClient,
+        cached_user: User,
+    ) -> None:
+        """
+        Тестирование записи пользователя в кэш после аутентификации
+        """
+        auth_cache.clear()
+
+        assert await auth_status(client, "cache-user") == HTTPStatus.NOT_FOUND
+        assert await auth_cache.get("cache-user") == Principal(
+            id=cached_user.id, username=cached_user.username
+        )
+
+    async def test_key_rotation_invalidates(
+        self,
+        client: AsyncClient,
+        cached_user: User,
+    ) -> None:
+        """
+        Тестирование сброса кэша при смене api-key
+        """
+        assert await auth_status(client, "cache-user") == HTTPStatus.NOT_FOUND
+
+        async with async_session_maker() as session:
+            user = await session.get(User, cached_user.id)
+            user.api_key = "cache-user-rotated"
+            await session.commit()
+
+        assert await auth_cache.get("cache-user") is None
+        assert await auth_status(client, "cache-user") == HTTPStatus.UNAUTHORIZED
+        assert (
+            await auth_status(client, "cache-user-rotated")
+            == HTTPStatus.NOT_FOUND
+        )
+
+    async def test_user_delete_invalidates(
+        self,
+        client: AsyncClient,
+        cached_user: User,
+    ) -> None:
+        """
+        Тестирование сброса кэша при удалении пользователя
+        """
+        assert (
+            await auth_status(client, "cache-user-rotated")
+            == HTTPStatus.NOT_FOUND
+        )
+
+        async with async_session_maker() as session:
+            user = await session.get(User, cached_user.id)
+            await session.delete(user)
+            await session.commit()
+
+        assert (
+            await auth_status(client, "cache-user-rotated")
+            == HTTPStatus.UNAUTHORIZED
+        )
+
+    async def test_shared_invalidate(self) -> None:
+        """
+        Тестирование кэша с общим для воркеров кэшем: записи не хранятся
+        в памяти процесса, сброшенная запись не выдается до завершения
+        фонового удаления
+        """
+        shared = MemoryCacheBackend()
+        cache = AuthCache(local=TTLCache(maxsize=10, ttl=60), shared=shared)
+        principal = Principal(id=1, username="shared-user")
+
+        await cache.set("shared-user", principal)
+        key = cache.make_key("shared-user")
+
+        assert cache.local.get(key) is None
+        assert await cache.get("shared-user") == principal
+
+        cache.invalidate("shared-user")
+
+        assert await cache.get("shared-user") is None
+
+        await asyncio.wait(list(cache._deleting.values()))
+
+        assert await shared.get(key) is None
+        assert not cache._deleting
+
+    def test_backend_interface(self) -> None:
+        """
+        Тестирование интерфейса общего кэша: реализация обязана
+        определить все методы
+        """
+        with pytest.raises(TypeError):
+            CacheBackend()
@@ -0,0 +1,73 @@
+from http import HTTPStatus
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from main.database import create_engine, engine_options, pool_metrics
+from tests.database import DATABASE_URL_TEST
+
+
+@pytest.mark.pool
+class TestDatabasePool:
+    async def test_pool_metrics(self) -> None:
+        """
+        Тестирование учета выданных соединений и ожидания соединения
+        """
+        engine = create_engine(DATABASE_URL_TEST,
+                               pool_size=1,
+                               max_overflow=0,
+                               pool_timeout=0.2,
+                               )
+
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+                metrics = pool_metrics(engine=engine)
+
+                assert metrics["checked_out"] == 1
+                assert metrics["size"] == 1
+
+                # Пул исчерпан: второе соединение ждет и получает отказ
+                with pytest.raises(PoolTimeoutError):
+                    async with engine.connect():
+                        pass
+
+            metrics = pool_metrics(engine=engine)
+        finally:
+            await engine.dispose()
+
+        assert metrics["checked_out"] == 0
+        assert metrics["checked_in"] == 1
+        assert metrics["waits"] == 2
+        assert metrics["timeouts"] == 1
+        assert metrics["max_wait_time"] >= 0.2
+
+    def test_pgbouncer_mode(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """
+        Тестирование отключения кэша подготовленных выражений
+        при работе через пулер в режиме транзакций
+        """
+        monkeypatch.setattr("main.database.DB_PGBOUNCER", True)
+        monkeypatch.setattr("main.database.DB_STATEMENT_TIMEOUT", 5000)
+
+        connect_args = engine_options()["connect_args"]
+
+        assert connect_args["statement_cache_size"] == 0
+        assert connect_args["prepared_statement_cache_size"] == 0
+        assert connect_args["prepared_statement_name_func"]() != (
+            connect_args["prepared_statement_name_func"]()
+        )
+        assert connect_args["server_settings"] == {"statement_timeout": "5000"}
+
+    async def test_pool_metrics_route(self, client: AsyncClient) -> None:
+        """
+        Тестирование вывода состояния пула соединений
+        """
+        resp = await client.get("/api/metrics/pool",
+                                headers={"api-key": "test-user1"},
+                                )
+
+        assert resp.status_code == HTTPStatus.OK
+        assert {"checked_out", "overflow", "wait_time"} <= resp.json().keys()
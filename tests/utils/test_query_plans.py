@@ -0,0 +1,435 @@
+import json
+import re
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+import pytest
+from sqlalchemy import event, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from main.models.image_variants import ImageVariant
+from main.models.images import Image
+from main.models.likes import Like
+from main.models.tweets import Tweet
+from main.models.users import User, user_to_user
+from main.schemas import Principal
+from main.services.file_reaper import file_reaper
+from main.services.follower import FollowerService
+from main.services.image import ImageService
+from main.services.like import LikeService
+from main.services.timeline import TimelineService
+from main.services.tweet import TweetsService
+from main.services.user import UserService
+from main.utils.cursor import encode_cursor
+from tests.database import async_session_maker, engine_test
+
+Statement = Tuple[str, Any]
+
+
+@pytest.fixture(scope="session")
+async def plan_data() -> Dict[str, Any]:
+    """
+    Читатель, авторы с твитами, лайками и изображениями
+    """
+    async with async_session_maker() as session:
+        reader = User(username="plan-reader", api_key="plan-reader")
+        authors = [
+            User(username=f"plan-author-{i}", api_key=f"plan-author-{i}")
+            for i in range(3)
+        ]
+        reader.following.extend(authors)
+        session.add_all([reader, *authors])
+        await session.flush()
+
+        tweets = [
+            Tweet(tweet_data=f"Твит {i}", user_id=author.id)
+            for author in authors
+            for i in range(5)
+        ]
+        session.add_all(tweets)
+        await session.flush()
+
+        session.add_all(
+            Like(user_id=user.id, tweets_id=tweet.id)
+            for tweet in tweets
+            for user in (reader, *authors)
+        )
+        images = [
+            Image(tweet_id=tweet.id, path_media=f"plan-{tweet.id}.png")
+            for tweet in tweets
+        ]
+        session.add_all(images)
+        await session.flush()
+
+        session.add(ImageVariant(image_id=images[0].id,
+                                 name="thumb",
+                                 path_media="plan-thumb.webp",
+                                 width=1,
+                                 height=1,
+                                 size=1,
+                                 ))
+        await session.commit()
+
+        return {"reader": reader, "authors": authors, "tweets": tweets}
+
+
+@asynccontextmanager
+async def captured_statements() -> AsyncIterator[List[Statement]]:
+    """
+    Запросы, выполненные через тестовый движок
+    """
+    statements: List[Statement] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(engine_test.sync_engine, "before_cursor_execute", capture)
+
+    try:
+        yield statements
+    finally:
+        event.remove(engine_test.sync_engine, "before_cursor_execute", capture)
+
+
+def sequential_scans(plan: Dict, indexes: Dict[str, Tuple[str, str]]) -> List[str]:
+    """
+    Таблицы, которые в плане запроса читаются целиком: последовательно
+    или полным проходом по индексу. Проход по индексу полный, если
+    условие поиска не задает первую колонку ни одного индекса таблицы
+    (подходящего индекса нет). Проход без условия поиска допустим,
+    только если он нужен ради порядка строк (например, для Merge Join):
+    без фильтра и не через bitmap
+    :param plan: узел плана
+    :param indexes: название индекса -> таблица и первая колонка индекса
+    """
+    tables = []
+
+    if plan["Node Type"] == "Seq Scan":
+        tables.append(plan["Relation Name"])
+    elif plan["Node Type"] in ("Index Scan",
+                               "Index Only Scan",
+                               "Bitmap Index Scan",
+                               ):
+        table = indexes[plan["Index Name"]][0]
+        condition = plan.get("Index Cond")
+        columns = {
+            column for index_table, column in indexes.values()
+            if index_table == table and column
+        }
+
+        if condition is None:
+            if "Filter" in plan or plan["Node Type"] == "Bitmap Index Scan":
+                tables.append(table)
+        elif not any(re.search(rf"\b{column}\b", condition) for column in columns):
+            tables.append(table)
+
+    for child in plan.get("Plans", ()):
+        tables.extend(sequential_scans(child, indexes))
+
+    return tables
+
+
+async def table_indexes(conn: AsyncConnection) -> Dict[str, Tuple[str, str]]:
+    """
+    Индексы: таблица и первая колонка (пустая у индексов по выражениям)
+    """
+    result = await conn.execute(text(
+        "SELECT c.relname, t.relname, coalesce(a.attname, '') FROM pg_index i "
+        "JOIN pg_class c ON c.oid = i.indexrelid "
+        "JOIN pg_class t ON t.oid = i.indrelid "
+        "LEFT JOIN pg_attribute a ON a.attrelid = i.indrelid "
+        "AND a.attnum = i.indkey[0]"
+    ))
+
+    return {index: (table, column) for index, table, column in result.all()}
+
+
+def sorted_scans(plan: Dict) -> List[str]:
+    """
+    Таблицы, строки которых сортируются сразу после чтения:
+    индекс не дает нужного порядка
+    """
+    tables = []
+
+    if plan["Node Type"] == "Sort":
+        child = plan["Plans"][0]
+
+        if "Relation Name" in child:
+            tables.append(child["Relation Name"])
+
+    for child in plan.get("Plans", ()):
+        tables.extend(sorted_scans(child))
+
+    return tables
+
+
+async def assert_index_scans(statements: List[Statement],
+                             ordered: Tuple[str, ...] = (),
+                             ) -> None:
+    """
+    Проверка, что запросы используют индексы.
+    Последовательное чтение запрещается планировщику, поэтому на маленьких
+    тестовых таблицах оно остается в плане (или заменяется полным проходом
+    по индексу, в котором нужная колонка не первая), только если
+    подходящего индекса нет.
+    Таблицы ordered должны читаться по индексу сразу в нужном порядке
+    """
+    checked = 0
+
+    async with engine_test.connect() as conn:
+        await conn.execute(text("SET enable_seqscan = off"))
+        indexes = await table_indexes(conn)
+
+        for statement, parameters in statements:
+            if not statement.lstrip(" \n(").upper().startswith(
+                ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+            ):
+                continue
+
+            result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}",
+                                                parameters,
+                                                )
+            plan = result.scalar()
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            checked += 1
+
+            assert sequential_scans(plan[0]["Plan"], indexes) == [], statement
+            assert not set(sorted_scans(plan[0]["Plan"])) & set(ordered), statement
+
+        await conn.rollback()
+
+    assert checked
+
+
+@pytest.mark.plan
+class TestQueryPlans:
+    async def test_user_queries(self, plan_data: Dict[str, Any]) -> None:
+        """
+        Аутентификация, профиль и подписки пользователя
+        """
+        reader = plan_data["reader"]
+
+        async with async_session_maker() as session:
+            async with captured_statements() as statements:
+                await UserService.get_principal_by_key(token=reader.api_key,
+                                                       session=session,
+                                                       )
+                await UserService.get_user_by_key(token=reader.api_key,
+                                                  session=session,
+                                                  )
+                await UserService.get_user_by_id(user_id=reader.id,
+                                                 session=session,
+                                                 )
+                await UserService.get_profile(user_id=reader.id,
+                                              session=session,
+                                              )
+                for kind in ("followers", "following"):
+                    await UserService.get_follows(user_id=reader.id,
+                                                  kind=kind,
+                                                  session=session,
+                                                  limit=1,
+                                                  cursor=encode_cursor([1]),
+                                                  )
+                await UserService.get_following_ids(user_id=reader.id,
+                                                    session=session,
+                                                    )
+                await TimelineService.is_fanout_author(
+                    author_id=plan_data["authors"][0].id, session=session
+                )
+
+        await assert_index_scans(statements)
+
+    @pytest.mark.parametrize("order", ["recent", "popular", "ranked"])
+    @pytest.mark.parametrize("likes_mode", ["full", "summary"])
+    async def test_feed_queries(self,
+                                plan_data: Dict[str, Any],
+                                likes_mode: str,
+                                order: str,
+                                ) -> None:
+        """
+        Страницы ленты (с курсором) со связанными данными
+        """
+        user = Principal.model_validate(plan_data["reader"])
+
+        async with async_session_maker() as session:
+            async with captured_statements() as statements:
+                _, cursor, _ = await TweetsService.get_tweets(user=user,
+                                                              session=session,
+                                                              limit=5,
+                                                              likes_mode=likes_mode,
+                                                              media_variant="thumb",
+                                                              order=order,
+                                                              )
+                await TweetsService.get_tweets(user=user,
+                                               session=session,
+                                               limit=5,
+                                               cursor=cursor,
+                                               likes_mode=likes_mode,
+                                               order=order,
+                                               )
+
+        await assert_index_scans(statements, ordered=("tweets",))
+
+    async def test_feed_poll_queries(self, plan_data: Dict[str, Any]) -> None:
+        """
+        Версия ленты и новые твиты после watermark
+        """
+        user = Principal.model_validate(plan_data["reader"])
+
+        async with async_session_maker() as session:
+            _, _, watermark = await TweetsService.get_tweets(user=user,
+                                                             session=session,
+                                                             limit=5,
+                                                             )
+
+            async with captured_statements() as statements:
+                await TweetsService.get_feed_version(user=user, session=session)
+                await TweetsService.get_tweets(user=user,
+                                               session=session,
+                                               limit=5,
+                                               since=watermark,
+                                               )
+
+        await assert_index_scans(statements, ordered=("tweets",))
+
+    async def test_timeline_queries(self, plan_data: Dict[str, Any]) -> None:
+        """
+        Страница материализованной ленты
+        """
+        reader = plan_data["reader"]
+
+        following_ids = select(user_to_user.c.following_id).where(
+            user_to_user.c.followers_id == reader.id
+        )
+
+        async with async_session_maker() as session:
+            async with captured_statements() as statements:
+                await session.execute(
+                    TimelineService.page_keys_query(user_id=reader.id,
+                                                    following_ids=following_ids,
+                                                    after=None,
+                                                    limit=5,
+                                                    )
+                )
+
+        await assert_index_scans(statements)
+
+    async def test_timeline_write_queries(
+        self,
+        plan_data: Dict[str, Any],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        Раскладка твита по лентам, удаление из лент, добавление и удаление
+        твитов авторов при подписке и заполнение лент
+        """
+        reader = plan_data["reader"]
+        author_ids = [author.id for author in plan_data["authors"]]
+        tweet = plan_data["tweets"][0]
+
+        async with async_session_maker() as session:
+            # Заполнение лент не сохраняется: пачки не коммитятся,
+            # сессия откатывается при закрытии
+            monkeypatch.setattr(session, "commit", session.flush)
+
+            async with captured_statements() as statements:
+                await TimelineService.fan_out(
+                    tweet=Tweet(id=tweet.id,
+                                user_id=tweet.user_id,
+                                created_at=tweet.created_at,
+                                ),
+                    session=session,
+                )
+                await TimelineService.retract(tweet_id=tweet.id, session=session)
+                await TimelineService.add_authors(user_id=reader.id,
+                                                  author_ids=author_ids,
+                                                  session=session,
+                                                  )
+                await TimelineService.remove_authors(user_id=reader.id,
+                                                     author_ids=author_ids,
+                                                     session=session,
+                                                     )
+                await TimelineService.backfill(session=session)
+
+        await assert_index_scans(statements)
+
+    async def test_bulk_follow_queries(self, plan_data: Dict[str, Any]) -> None:
+        """
+        Массовая подписка и отписка
+        """
+        follower, *authors = plan_data["authors"]
+        user = Principal.model_validate(follower)
+        user_ids = [author.id for author in authors]
+
+        async with async_session_maker() as session:
+            async with captured_statements() as statements:
+                await FollowerService.create_followers(current_user=user,
+                                                       user_ids=user_ids,
+                                                       session=session,
+                                                       )
+                await FollowerService.delete_followers(current_user=user,
+                                                       user_ids=user_ids,
+                                                       session=session,
+                                                       )
+
+        await assert_index_scans(statements)
+
+    async def test_like_queries(self, plan_data: Dict[str, Any]) -> None:
+        """
+        Лайк, удаление лайка и список лайкнувших
+        """
+        reader = plan_data["reader"]
+        tweet = plan_data["tweets"][0]
+
+        async with async_session_maker() as session:
+            async with captured_statements() as statements:
+                await LikeService.dislike(tweet_id=tweet.id,
+                                          user_id=reader.id,
+                                          session=session,
+                                          )
+                await LikeService.like(tweet_id=tweet.id,
+                                       user_id=reader.id,
+                                       session=session,
+                                       )
+                await LikeService.check_like_tweet(tweet_id=tweet.id,
+                                                   user_id=reader.id,
+                                                   session=session,
+                                                   )
+                _, cursor = await LikeService.get_likes(tweet_id=tweet.id,
+                                                        session=session,
+                                                        limit=2,
+                                                        )
+                await LikeService.get_likes(tweet_id=tweet.id,
+                                            session=session,
+                                            limit=2,
+                                            cursor=cursor,
+                                            )
+
+        await assert_index_scans(statements)
+
+    async def test_image_queries(self, plan_data: Dict[str, Any]) -> None:
+        """
+        Изображения твита, уменьшенные копии и сборка брошенных изображений
+        """
+        tweet = plan_data["tweets"][0]
+
+        async with async_session_maker() as session:
+            async with captured_statements() as statements:
+                images = await ImageService.get_images(tweet_id=tweet.id,
+                                                       session=session,
+                                                       )
+                await ImageService.get_variant_paths(
+                    image_ids=[image.id for image in images],
+                    name="thumb",
+                    session=session,
+                )
+                await ImageService.collect_orphans(session=session)
+                # Проверка ссылок на файлы перед удалением
+                await file_reaper._unreferenced_files(
+                    batch=[(image.path_media, image.content_hash, 0, 0.0)
+                           for image in images],
+                    session=session,
+                )
+
+        await assert_index_scans(statements)
@@ -0,0 +1,173 @@
+import asyncio
+from http import HTTPStatus
+from typing import AsyncGenerator
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from main.config import DB_NAME
+from main.utils.cache import TTLCache
+from main.utils.profile_cache import profile_cache
+from main.utils.replicas import ReplicaRouter, replica_router
+from tests.database import DATABASE_URL_TEST, Base, engine_test
+
+# Вторая локальная БД изображает реплику: данные в нее не копируются,
+# поэтому по ответу видно, из какой БД прочитаны данные
+REPLICA_NAME = f"{DB_NAME}_replica"
+REPLICA_URL = DATABASE_URL_TEST.rsplit("/", 1)[0] + f"/{REPLICA_NAME}"
+# Недоступная реплика
+BROKEN_URL = DATABASE_URL_TEST.rsplit("@", 1)[0] + "@127.0.0.1:1/replica"
+
+
+@pytest.fixture(scope="session")
+async def replica_engine() -> AsyncGenerator[AsyncEngine, None]:
+    """
+    Пустая БД с таблицами приложения в роли реплики
+    """
+    async with engine_test.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(f'DROP DATABASE IF EXISTS "{REPLICA_NAME}"'))
+        await conn.execute(text(f'CREATE DATABASE "{REPLICA_NAME}"'))
+
+    engine = create_async_engine(REPLICA_URL, poolclass=NullPool)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    yield engine
+
+    await engine.dispose()
+
+
+@pytest.fixture
+def replicas(monkeypatch: pytest.MonkeyPatch, replica_engine: AsyncEngine):
+    """
+    Подключение реплик к приложению на время теста
+    """
+
+    def use(*engines: AsyncEngine) -> None:
+        monkeypatch.setattr(replica_router, "engines", list(engines))
+
+    monkeypatch.setattr(replica_router,
+                        "_pinned",
+                        TTLCache(maxsize=100, ttl=replica_router.staleness),
+                        )
+    monkeypatch.setattr(replica_router, "_down_until", {})
+    # Профили, закэшированные при чтении с основной БД
+    profile_cache.clear()
+
+    return use
+
+
+@pytest.mark.replica
+@pytest.mark.usefixtures("users")
+class TestReplicas:
+    async def test_read_from_replica(self,
+                                     client: AsyncClient,
+                                     replicas,
+                                     replica_engine: AsyncEngine,
+                                     ) -> None:
+        """
+        Тестирование чтения с реплики: в БД-реплике пользователей нет
+        """
+        replicas(replica_engine)
+
+        resp = await client.get("/api/users/1", headers={"api-key": "test-user2"})
+
+        assert resp.status_code == HTTPStatus.NOT_FOUND
+
+    async def test_read_your_writes(self,
+                                    client: AsyncClient,
+                                    replicas,
+                                    replica_engine: AsyncEngine,
+                                    ) -> None:
+        """
+        Тестирование чтения с основной БД после изменений пользователя
+        """
+        replicas(replica_engine)
+        headers = {"api-key": "test-user3"}
+
+        for method in (client.post, client.delete):
+            resp = await method("/api/users/5/follow", headers=headers)
+
+            assert resp.json() == {"result": True}
+
+        resp = await client.get("/api/users/me", headers=headers)
+
+        assert resp.status_code == HTTPStatus.OK
+        assert resp.json()["user"]["id"] == 3
+
+        # Другой пользователь по-прежнему читает с реплики
+        resp = await client.get("/api/users/3", headers={"api-key": "test-user4"})
+
+        assert resp.status_code == HTTPStatus.NOT_FOUND
+
+    async def test_fallback_to_primary(self,
+                                       client: AsyncClient,
+                                       replicas,
+                                       ) -> None:
+        """
+        Тестирование чтения с основной БД, если реплика недоступна
+        """
+        broken = create_async_engine(BROKEN_URL, poolclass=NullPool)
+        replicas(broken)
+
+        try:
+            resp = await client.get("/api/users/1",
+                                    headers={"api-key": "test-user4"},
+                                    )
+        finally:
+            await broken.dispose()
+
+        assert resp.status_code == HTTPStatus.OK
+        assert replica_router.available() == []
+
+    async def test_skip_broken_replica(self, replica_engine: AsyncEngine) -> None:
+        """
+        Тестирование исключения недоступной реплики и возврата ее
+        после периода проверки
+        """
+        broken = create_async_engine(BROKEN_URL, poolclass=NullPool)
+        router = ReplicaRouter(engines=[broken, replica_engine],
+                               staleness=1,
+                               max_lag=1,
+                               check_interval=0.2,
+                               )
+
+        try:
+            for _ in range(2):
+                session = await router.open_session()
+
+                async with session:
+                    name = await session.scalar(text("SELECT current_database()"))
+
+                assert name == REPLICA_NAME
+
+            assert router.available() == [1]
+
+            await asyncio.sleep(0.2)
+
+            assert sorted(router.available()) == [0, 1]
+        finally:
+            await broken.dispose()
+
+    async def test_pin_expires(self) -> None:
+        """
+        Тестирование окна чтения с основной БД после изменений
+        """
+        router = ReplicaRouter(engines=[],
+                               staleness=0.1,
+                               max_lag=0,
+                               check_interval=1,
+                               )
+        router.pin(user_id=1)
+
+        assert await router.is_pinned(user_id=1)
+        assert not await router.is_pinned(user_id=2)
+
+        await asyncio.sleep(0.1)
+
+        assert not await router.is_pinned(user_id=1)